@@ -1,3 +1,18 @@
 """AsyncAWS root, implements Facade for AWS APIs"""
-from asyncaws.sqs import SQS
-from asyncaws.sns import SNS
+from asyncaws.core import AWSError, RetryPolicy, RateLimiter
+from asyncaws.transport import TransportConfig
+from asyncaws.credentials import (CredentialsError, Credentials,
+                                  StaticProvider, EnvironmentProvider,
+                                  SharedFileProvider, ContainerProvider,
+                                  InstanceMetadataProvider, ChainProvider)
+from asyncaws.instrumentation import (Instrumentation, MetricsCollector,
+                                      StatsdInstrumentation)
+from asyncaws.codec import MessageCodec, BlobStore, FilesystemBlobStore
+from asyncaws.message import Message
+from asyncaws.dedup import (Deduplicator, DuplicateFailed, DedupStore,
+                            MemoryDedupStore, SQLiteDedupStore)
+from asyncaws.sqs import SQS, SQSBatcher
+from asyncaws.sns import SNS, SNSBatcher
+from asyncaws.consumer import (SQSConsumer, MultiQueueConsumer,
+                              MessageGroupDispatcher, VisibilityHeartbeat,
+                              MessageStream)
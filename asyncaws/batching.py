@@ -0,0 +1,105 @@
+"""Coalescing of single API calls into batch requests"""
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+from asyncaws.core import AWSError
+
+
+class BatchCollector(object):
+    """
+    Buffers entries per key (queue URL, topic ARN) and sends them as one
+    batch request when the window elapses, or as soon as max_entries or
+    max_bytes are reached. Every added entry gets its own Future, resolved
+    from the matching per-entry result of the batch response.
+
+    :param send_batch: function(key, entries) that makes the batch request
+        and returns a Future with {'Successful': [...], 'Failed': [...]}.
+        Every entry is a dict with unique 'Id' within the batch.
+    :param entry_result: function(successful_item, batch_result) that returns
+        the value for the Future of a single entry.
+    :param window: max time (in seconds) an entry waits in the buffer.
+    :param max_entries: max number of entries in one batch request.
+    :param max_bytes: max total payload size of one batch request.
+    """
+    def __init__(self, send_batch, entry_result, window=0.05,
+                 max_entries=10, max_bytes=256 * 1024):
+        self.send_batch = send_batch
+        self.entry_result = entry_result
+        self.window = window
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._buffers = {}
+
+    def add(self, key, entry, size=0):
+        """
+        Put entry to the buffer of given key.
+
+        :param key: batch destination, entries are batched per key.
+        :param entry: dict with entry params, without 'Id'.
+        :param size: payload size of the entry, counted towards max_bytes.
+        :return: Future, resolved with the result of this entry.
+        """
+        assert size <= self.max_bytes
+        buf = self._buffers.get(key)
+        if buf is not None and buf['bytes'] + size > self.max_bytes:
+            self.flush(key)
+            buf = None
+        if buf is None:
+            timeout = IOLoop.current().call_later(self.window, self.flush, key)
+            buf = self._buffers[key] = {'entries': [], 'futures': {},
+                                        'bytes': 0, 'timeout': timeout}
+        future = Future()
+        entry = dict(entry, Id=str(len(buf['entries'])))
+        buf['entries'].append(entry)
+        buf['futures'][entry['Id']] = future
+        buf['bytes'] += size
+        if len(buf['entries']) >= self.max_entries:
+            self.flush(key)
+        return future
+
+    def flush(self, key=None):
+        """Send buffered entries of given key immediately, or of all keys"""
+        if key is None:
+            for buffered_key in list(self._buffers):
+                self.flush(buffered_key)
+            return
+        buf = self._buffers.pop(key, None)
+        if buf is None:
+            return
+        IOLoop.current().remove_timeout(buf['timeout'])
+        futures = buf['futures']
+        try:
+            batch_future = self.send_batch(key, buf['entries'])
+        except Exception as error:
+            self._fail(futures, error)
+            return
+        # resolved on the IOLoop thread, chained without a callback hop
+        batch_future.add_done_callback(lambda f: self._resolve(f, futures))
+
+    def _resolve(self, batch_future, futures):
+        """Set per-entry results, failed entries get AWSError"""
+        try:
+            batch_result = batch_future.result()
+        except Exception as error:
+            self._fail(futures, error)
+            return
+        for item in batch_result['Successful']:
+            future = futures.pop(item['Id'], None)
+            # unknown or repeated Ids of a malformed response are skipped
+            if future is not None:
+                future.set_result(self.entry_result(item, batch_result))
+        for item in batch_result['Failed']:
+            future = futures.pop(item['Id'], None)
+            if future is not None:
+                future.set_exception(AWSError(
+                    item.get('Code'), item.get('Message'),
+                    sender_fault=item.get('SenderFault') == 'true'))
+        # entries missing in response should not hang forever
+        self._fail(futures, AWSError('MissingEntry',
+                                     'Entry is absent in batch response'))
+
+    @staticmethod
+    def _fail(futures, error):
+        """Set the same exception for all remaining futures"""
+        for future in futures.values():
+            future.set_exception(error)
+        futures.clear()
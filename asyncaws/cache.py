@@ -0,0 +1,74 @@
+"""In-memory caches of AWS clients"""
+import time
+from tornado.concurrent import Future
+
+
+class NameCache(object):
+    """
+    Keeps names resolved to queue URLs or topic ARNs for ttl seconds.
+    Concurrent lookups of the same name share a single request, so a cold
+    start with many callers makes one control-plane call per name.
+
+    :param ttl: time (in seconds) a resolved value is kept.
+    :param async: lookups return Futures, as clients in async mode.
+    """
+    def __init__(self, ttl=300, async=True):
+        self.ttl = ttl
+        self._async = async
+        self._values = {}
+        self._pending = {}
+
+    def get(self, name, lookup):
+        """
+        Get cached value of name, or resolve it with lookup.
+
+        :param name: name of queue or topic.
+        :param lookup: function() making the request, returns Future
+            (async mode) or value. Failed lookups are not cached.
+        :return: Future with the value, or the value itself in sync mode.
+        """
+        entry = self._values.get(name)
+        if entry is not None:
+            value, expires = entry
+            if expires > time.time():
+                if not self._async:
+                    return value
+                future = Future()
+                future.set_result(value)
+                return future
+            del self._values[name]
+        if not self._async:
+            value = lookup()
+            self.put(name, value)
+            return value
+        pending = self._pending.get(name)
+        if pending is not None:
+            return pending
+        future = self._pending[name] = lookup()
+        future.add_done_callback(lambda f: self._resolved(name, f))
+        return future
+
+    def put(self, name, value):
+        """Cache value of name, e.g. known from CreateQueue response"""
+        self._values[name] = (value, time.time() + self.ttl)
+
+    def invalidate(self, value):
+        """Forget names resolved to value, e.g. URL of deleted queue"""
+        for name, (cached, _) in list(self._values.items()):
+            if cached == value:
+                del self._values[name]
+        # result of a lookup in flight might be stale as well
+        self._pending.clear()
+
+    def clear(self):
+        """Forget all names"""
+        self._values.clear()
+        self._pending.clear()
+
+    def _resolved(self, name, future):
+        """Store result of finished lookup, unless invalidated meanwhile"""
+        if self._pending.get(name) is not future:
+            return
+        del self._pending[name]
+        if future.exception() is None:
+            self.put(name, future.result())
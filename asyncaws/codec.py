@@ -0,0 +1,183 @@
+"""
+Opt-in encoding of message bodies: compression and offloading of large
+bodies to a blob store. Encoded messages carry the applied steps in
+a message attribute, so receivers decode them transparently and plain
+messages pass through untouched.
+"""
+import base64
+import os
+import uuid
+import zlib
+from tornado.gen import coroutine, Return, maybe_future
+from asyncaws.core import message_size
+
+# message attribute with encoding steps, e.g. "zlib/base64"
+CODEC_ATTRIBUTE = 'asyncaws.codec'
+
+
+class BlobStore(object):
+    """
+    Base class of stores of offloaded message bodies.
+    Methods may return Futures, e.g. of an S3 client.
+    Stored blobs are not deleted with messages, let the store expire them.
+    """
+    def put(self, data):
+        """Store bytes, return key of the blob"""
+        raise NotImplementedError
+
+    def get(self, key):
+        """Return bytes of the blob"""
+        raise NotImplementedError
+
+
+class FilesystemBlobStore(BlobStore):
+    """
+    Blobs as files of a local directory, e.g. in tests or for workers
+    sharing a volume.
+
+    :param path: directory of the blobs, created if missing.
+    """
+    def __init__(self, path):
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def put(self, data):
+        key = uuid.uuid4().hex
+        with open(os.path.join(self.path, key), 'wb') as blob:
+            blob.write(data)
+        return key
+
+    def get(self, key):
+        # keys are generated by put, never contain path separators
+        with open(os.path.join(self.path, os.path.basename(key)),
+                  'rb') as blob:
+            return blob.read()
+
+
+def base64_size(size):
+    """Length of base64 encoding of size bytes"""
+    return (size + 2) // 3 * 4
+
+
+def zstd_module():
+    """Import zstandard, optional dependency of zstd compression"""
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstd compression requires zstandard package")
+    return zstandard
+
+
+class MessageCodec(object):
+    """
+    Encodes message bodies on send and decodes them on receive.
+    Bodies of at least min_size bytes are compressed and base64-encoded,
+    if that makes them smaller. Messages still larger than
+    offload_threshold, counting the encoded body and all attributes, have
+    their body put to blob_store and replaced by the blob key.
+    Received messages are decoded one by one: a message that fails, e.g.
+    whose blob has expired, keeps its encoded body and the error in
+    decode_error, and SQSConsumer fails only that message.
+
+    :param compression: 'zlib', 'zstd' (requires zstandard) or None.
+    :param level: compression level.
+    :param min_size: min body size (in bytes) worth compressing.
+    :param blob_store: optional BlobStore of large bodies.
+    :param offload_threshold: max size (in bytes) of body sent inline.
+    """
+    def __init__(self, compression='zlib', level=6, min_size=1024,
+                 blob_store=None, offload_threshold=192 * 1024):
+        assert compression in ('zlib', 'zstd', None)
+        self.compression = compression
+        self.level = level
+        self.min_size = min_size
+        self.blob_store = blob_store
+        self.offload_threshold = offload_threshold
+        if compression == 'zstd':
+            zstd = zstd_module()
+            self._compressor = zstd.ZstdCompressor(level=level)
+            self._decompressor = zstd.ZstdDecompressor()
+
+    def compress(self, data):
+        """Compress bytes with configured algorithm"""
+        if self.compression == 'zstd':
+            return self._compressor.compress(data)
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data, algorithm):
+        """Decompress bytes compressed with given algorithm"""
+        if algorithm == 'zstd':
+            decompressor = getattr(self, '_decompressor', None) or \
+                zstd_module().ZstdDecompressor()
+            return decompressor.decompress(data)
+        return zlib.decompress(data)
+
+    @coroutine
+    def encode(self, body, attributes=None):
+        """
+        Encode message body.
+
+        :param body: message body, unicode or utf-8 string.
+        :param attributes: message attributes of the message, if any.
+        :return: Future with (body, attributes), attributes are a new dict
+            with CODEC_ATTRIBUTE if the body was changed.
+        """
+        data = body.encode('utf-8') if isinstance(body, unicode) else body
+        compressed = None
+        if self.compression and len(data) >= self.min_size:
+            compressed = self.compress(data)
+            if len(compressed) >= len(data):
+                compressed = None
+        # compression pays off inline only if it outweighs base64 growth
+        if compressed is not None and \
+                base64_size(len(compressed)) < len(data):
+            inline = base64.b64encode(compressed)
+            steps = [self.compression, 'base64']
+        else:
+            inline = body
+            steps = []
+        inline_attributes = self._with_steps(attributes, steps)
+        if self.blob_store is None or message_size(
+                inline, inline_attributes) <= self.offload_threshold:
+            raise Return((inline, inline_attributes))
+        if compressed is not None:
+            key = yield maybe_future(self.blob_store.put(compressed))
+            steps = [self.compression, 'blob']
+        else:
+            key = yield maybe_future(self.blob_store.put(data))
+            steps = ['blob']
+        raise Return((key, self._with_steps(attributes, steps)))
+
+    @staticmethod
+    def _with_steps(attributes, steps):
+        """Attributes with CODEC_ATTRIBUTE of applied steps, if any"""
+        if not steps:
+            return attributes
+        attributes = dict(attributes or {})
+        attributes[CODEC_ATTRIBUTE] = {'DataType': 'String',
+                                       'StringValue': '/'.join(steps)}
+        return attributes
+
+    @coroutine
+    def decode(self, message):
+        """
+        Restore original body of received message, in place.
+        Messages without CODEC_ATTRIBUTE are left as they are.
+
+        :param message: Message, as returned by receive_messages.
+        :return: Future with the message.
+        """
+        attribute = message.get('MessageAttributes', {}).get(CODEC_ATTRIBUTE)
+        if attribute is None:
+            raise Return(message)
+        data = message['Body']
+        for step in reversed(attribute['StringValue'].split('/')):
+            if step == 'blob':
+                data = yield maybe_future(self.blob_store.get(data))
+            elif step == 'base64':
+                data = base64.b64decode(data)
+            else:
+                data = self.decompress(data, step)
+        message['Body'] = data.decode('utf-8')
+        raise Return(message)
@@ -0,0 +1,523 @@
+"""High-level consumers built on top of SQS long polling"""
+import logging
+from collections import deque
+from tornado.gen import coroutine, sleep, Return
+from tornado.ioloop import IOLoop, PeriodicCallback
+from tornado.locks import Condition
+from tornado.queues import Queue
+from tornado.concurrent import is_future
+
+logger = logging.getLogger(__name__)
+
+
+class SQSConsumer(object):
+    """
+    Consumes an SQS queue with several concurrent long-poll loops.
+    Number of messages in processing is capped by max_in_flight: pollers
+    only ask SQS for as many messages as there are free slots, and wait
+    while all slots are taken. A message is deleted after its handler
+    succeeds, failed messages become visible again after visibility_timeout.
+    Requires SQS client in async mode.
+
+    :param sqs: SQS client instance.
+    :param queue_url: The URL of the Amazon SQS queue to consume.
+    :param handler: function or coroutine, called with every Message.
+    :param pollers: number of concurrent long-poll loops.
+    :param max_in_flight: max number of messages being processed at once.
+    :param batch_size: max number of messages per receive, 1-10.
+    :param wait_time: long poll duration (in seconds).
+    :param visibility_timeout: visibility timeout of received messages.
+    :param batcher: optional SQSBatcher to coalesce deletes.
+    :param heartbeat: optional VisibilityHeartbeat, keeps extending
+        visibility of messages while they are processed, so that
+        visibility_timeout can stay short. Started and stopped
+        together with the consumer. A message waits up to one interval
+        of the heartbeat for its first extension, so the interval must be
+        shorter than visibility_timeout, e.g. half of it.
+    :param error_delay: pause (in seconds) of a poller after failed receive.
+    """
+    def __init__(self, sqs, queue_url, handler, pollers=2, max_in_flight=20,
+                 batch_size=10, wait_time=15, visibility_timeout=300,
+                 batcher=None, heartbeat=None, error_delay=1):
+        assert sqs._async, "consumer requires async mode"
+        assert 1 <= batch_size <= 10
+        assert heartbeat is None or \
+            heartbeat.interval < visibility_timeout, \
+            "heartbeat interval must be shorter than visibility_timeout"
+        self.sqs = sqs
+        self.queue_url = queue_url
+        self.pollers = pollers
+        self.max_in_flight = max_in_flight
+        self.batch_size = batch_size
+        self.wait_time = wait_time
+        self.visibility_timeout = visibility_timeout
+        self.heartbeat = heartbeat
+        self.error_delay = error_delay
+        self.handler = handler
+        self._delete_message = (batcher or sqs).delete_message
+        self._in_flight = 0
+        self._running = False
+        self._poll_futures = []
+        self._changed = Condition()
+
+    @property
+    def in_flight(self):
+        """Number of received messages that are not processed yet"""
+        return self._in_flight
+
+    @property
+    def running(self):
+        """True between start and stop"""
+        return self._running
+
+    def start(self):
+        """Start long-poll loops on the current IOLoop"""
+        assert not self._running, "consumer is already running"
+        self._running = True
+        if self.heartbeat is not None:
+            self.heartbeat.start()
+        self._poll_futures = [self._poll() for _ in range(self.pollers)]
+
+    @coroutine
+    def stop(self):
+        """
+        Stop polling and wait until all in-flight messages are processed.
+        Pending long polls are not interrupted, messages they return
+        are processed before the returned Future resolves.
+        """
+        self._running = False
+        self._changed.notify_all()
+        yield self._poll_futures
+        while self._in_flight:
+            yield self._changed.wait()
+        if self.heartbeat is not None:
+            self.heartbeat.stop()
+
+    @coroutine
+    def _reserve(self):
+        """Wait for free processing slots and take up to batch_size"""
+        while self._running and self._in_flight >= self.max_in_flight:
+            yield self._changed.wait()
+        if not self._running:
+            raise Return(0)
+        count = min(self.batch_size, self.max_in_flight - self._in_flight)
+        self._in_flight += count
+        raise Return(count)
+
+    def _release(self, count=1):
+        """Return processing slots"""
+        self._in_flight -= count
+        self._changed.notify_all()
+
+    @coroutine
+    def _poll(self):
+        """Long-poll loop, hands received messages over to handlers"""
+        while self._running:
+            count = yield self._reserve()
+            if not count:
+                continue
+            try:
+                messages = yield self.sqs.receive_messages(
+                    self.queue_url, self.wait_time, count,
+                    self.visibility_timeout)
+            except Exception:
+                logger.exception("Failed to receive from %s", self.queue_url)
+                self._release(count)
+                yield sleep(self.error_delay)
+                continue
+            self._release(count - len(messages))
+            for message in messages:
+                self._process_message(self.queue_url, message)
+
+    @coroutine
+    def _process_message(self, queue_url, message):
+        """Run handler and delete the message if it succeeds"""
+        if self.heartbeat is not None:
+            self.heartbeat.track(queue_url, message['ReceiptHandle'])
+        try:
+            # undecodable message fails alone, it is redelivered or
+            # moved to the dead-letter queue like any failed message
+            error = getattr(message, 'decode_error', None)
+            if error is not None:
+                raise error
+            result = self.handler(message)
+            if is_future(result):
+                yield result
+            yield self._delete_message(queue_url, message['ReceiptHandle'])
+        except Exception:
+            logger.exception("Failed to process message %s",
+                             message['MessageId'])
+        finally:
+            if self.heartbeat is not None:
+                self.heartbeat.untrack(queue_url, message['ReceiptHandle'])
+            self._release()
+
+
+class QueueState(object):
+    """Scheduling state of a queue of MultiQueueConsumer"""
+    __slots__ = ('url', 'weight', 'current', 'polling', 'hot', 'idle',
+                 'ready_at')
+
+    def __init__(self, url, weight):
+        self.url = url
+        self.weight = weight
+        # smooth weighted round robin counter
+        self.current = 0
+        self.polling = 0
+        # last receive returned messages
+        self.hot = False
+        # current backoff (in seconds) of an empty queue
+        self.idle = 0
+        self.ready_at = 0
+
+    def eligible(self, now):
+        """Queue may be polled now"""
+        return self.ready_at <= now and (self.hot or not self.polling)
+
+
+class MultiQueueConsumer(SQSConsumer):
+    """
+    Consumes several queues with one fixed pool of long-poll loops, so the
+    number of open connections does not grow with the number of queues.
+    Whenever processing slots free up, a poller picks the next queue by
+    smooth weighted round robin: while queues have messages, a queue of
+    weight 3 is polled (and gets slots) three times as often as a queue of
+    weight 1. A queue that returned nothing is skipped for idle_delay,
+    doubled on every further empty receive up to max_idle_delay, and
+    a quiet queue is long-polled by one poller at a time.
+    message['QueueUrl'] is the URL of the queue a message came from.
+    Requires SQS client in async mode.
+
+    :param sqs: SQS client instance.
+    :param queues: dict of queue URL to weight (number > 0), or list of
+        queue URLs of equal weight.
+    :param handler: function or coroutine, called with every Message.
+    :param pollers: number of concurrent long-poll loops over all queues.
+    :param wait_time: long poll duration (in seconds), short so that
+        pollers move on from quiet queues quickly.
+    :param idle_delay: initial pause (in seconds) of polling an empty queue.
+    :param max_idle_delay: max pause (in seconds) of polling an empty queue.
+
+    Other parameters are the same as of SQSConsumer.
+    """
+    def __init__(self, sqs, queues, handler, pollers=4, max_in_flight=20,
+                 batch_size=10, wait_time=2, visibility_timeout=300,
+                 batcher=None, heartbeat=None, error_delay=1, idle_delay=1,
+                 max_idle_delay=20):
+        super(MultiQueueConsumer, self).__init__(
+            sqs, None, handler, pollers, max_in_flight, batch_size,
+            wait_time, visibility_timeout, batcher, heartbeat, error_delay)
+        if not isinstance(queues, dict):
+            queues = dict.fromkeys(queues, 1)
+        assert queues and all(weight > 0 for weight in queues.values())
+        self.idle_delay = idle_delay
+        self.max_idle_delay = max_idle_delay
+        # heavier queues first, they win ties of the round robin
+        self._queues = [QueueState(url, weight) for url, weight in
+                        sorted(queues.items(), key=lambda item: -item[1])]
+
+    def _next_queue(self):
+        """Pick a queue to poll, None if all of them are waiting"""
+        now = IOLoop.current().time()
+        eligible = [queue for queue in self._queues if queue.eligible(now)]
+        if not eligible:
+            return None
+        total = 0
+        best = None
+        for queue in eligible:
+            queue.current += queue.weight
+            total += queue.weight
+            if best is None or queue.current > best.current:
+                best = queue
+        best.current -= total
+        return best
+
+    def _next_ready(self):
+        """IOLoop time when a queue waiting for its backoff can be polled"""
+        waiting = [queue.ready_at for queue in self._queues
+                   if not queue.polling]
+        return min(waiting) if waiting else None
+
+    @coroutine
+    def _poll(self):
+        """Long-poll loop, polls queues picked by weight"""
+        while self._running:
+            now = IOLoop.current().time()
+            if not any(queue.eligible(now) for queue in self._queues):
+                # woken up early by released slots or stop
+                yield self._changed.wait(self._next_ready())
+                continue
+            count = yield self._reserve()
+            if not count:
+                continue
+            queue = self._next_queue()
+            if queue is None:
+                self._release(count)
+                continue
+            queue.polling += 1
+            try:
+                messages = yield self.sqs.receive_messages(
+                    queue.url, self.wait_time, count,
+                    self.visibility_timeout)
+            except Exception:
+                logger.exception("Failed to receive from %s", queue.url)
+                queue.hot = False
+                queue.ready_at = IOLoop.current().time() + self.error_delay
+                self._release(count)
+                continue
+            finally:
+                queue.polling -= 1
+            self._received(queue, messages)
+            self._release(count - len(messages))
+            for message in messages:
+                message['QueueUrl'] = queue.url
+                self._process_message(queue.url, message)
+
+    def _received(self, queue, messages):
+        """Update backoff of the queue after receive"""
+        queue.hot = bool(messages)
+        if messages:
+            queue.idle = 0
+            queue.ready_at = 0
+        else:
+            queue.idle = min(self.max_idle_delay,
+                             queue.idle * 2 or self.idle_delay)
+            queue.ready_at = IOLoop.current().time() + queue.idle
+
+
+class GroupFailed(Exception):
+    """An earlier message of the same group failed, the message is skipped"""
+
+
+class MessageGroupDispatcher(object):
+    """
+    Handler wrapper for FIFO queues: messages of different groups are
+    processed concurrently, messages of one group strictly in the order they
+    are received. When a message fails, later messages of its group that are
+    already received are skipped (fail with GroupFailed) and not deleted,
+    so SQS redelivers the group from the failed message on. Messages without
+    MessageGroupId are passed to the handler right away.
+    Use as handler of SQSConsumer or MultiQueueConsumer::
+
+        consumer = SQSConsumer(sqs, fifo_queue_url,
+                               MessageGroupDispatcher(handler))
+
+    :param handler: function or coroutine, called with every message.
+    """
+    def __init__(self, handler):
+        self.handler = handler
+        # (queue URL, group) -> Future of the last dispatched message
+        self._tails = {}
+
+    def __len__(self):
+        """Number of groups with messages in processing"""
+        return len(self._tails)
+
+    def __call__(self, message):
+        group = (message.get('Attributes') or {}).get('MessageGroupId')
+        if group is None:
+            return self.handler(message)
+        key = (message.get('QueueUrl'), group)
+        future = self._run(self._tails.get(key), message)
+        self._tails[key] = future
+        future.add_done_callback(lambda _: self._finished(key, future))
+        return future
+
+    @coroutine
+    def _run(self, previous, message):
+        """Wait for the previous message of the group, then handle this one"""
+        if previous is not None:
+            try:
+                yield previous
+            except Exception:
+                raise GroupFailed(message['MessageId'])
+        result = self.handler(message)
+        if is_future(result):
+            yield result
+
+    def _finished(self, key, future):
+        """Forget the group once its last message is processed"""
+        if self._tails.get(key) is future:
+            del self._tails[key]
+
+
+class MessageStream(object):
+    """
+    Messages of a queue, received by a background long-poll loop that runs
+    ahead of the consumer: the next poll is already waiting while the
+    current batch is handled. At most `prefetch` received batches are
+    buffered, then polling pauses until the consumer catches up.
+    Keep visibility_timeout longer than the time a buffered message waits.
+    Python 2 has no async iterators, next() returns a Future instead::
+
+        stream = sqs.iter_messages(queue_url)
+        while True:
+            message = yield stream.next()
+            if message is None:
+                break  # stream closed and drained
+
+    :param sqs: SQS client instance, in async mode.
+    :param queue_url: The URL of the Amazon SQS queue to read.
+    :param batches: next() returns whole received batches (lists)
+        instead of single messages.
+    :param prefetch: max number of received batches waiting in the buffer.
+    :param batch_size: max number of messages per receive, 1-10.
+    :param wait_time: long poll duration (in seconds).
+    :param visibility_timeout: visibility timeout of received messages.
+    :param error_delay: pause (in seconds) after failed receive.
+    """
+    def __init__(self, sqs, queue_url, batches=False, prefetch=2,
+                 batch_size=10, wait_time=15, visibility_timeout=300,
+                 error_delay=1):
+        assert sqs._async, "stream requires async mode"
+        assert 1 <= batch_size <= 10
+        self.sqs = sqs
+        self.queue_url = queue_url
+        self.batches = batches
+        self.batch_size = batch_size
+        self.wait_time = wait_time
+        self.visibility_timeout = visibility_timeout
+        self.error_delay = error_delay
+        self._buffer = Queue(maxsize=prefetch)
+        self._current = deque()
+        self._running = True
+        self._finished = False
+        self._poll_future = self._poll()
+
+    @property
+    def running(self):
+        """True until close is called"""
+        return self._running
+
+    def close(self):
+        """
+        Stop polling. A pending long poll is not interrupted, messages it
+        returns are still handed out by next() before it returns None.
+        """
+        self._running = False
+
+    @coroutine
+    def next(self):
+        """
+        Take the next message (or batch of messages), waiting for a
+        receive if the buffer is empty.
+
+        :return: Future with Message (list of them if batches is True),
+            None once the stream is closed and all messages are taken.
+        """
+        if self._current:
+            raise Return(self._current.popleft())
+        if self._finished:
+            raise Return(None)
+        batch = yield self._buffer.get()
+        if batch is None:
+            self._finished = True
+            raise Return(None)
+        if self.batches:
+            raise Return(batch)
+        self._current.extend(batch[1:])
+        raise Return(batch[0])
+
+    @coroutine
+    def _poll(self):
+        """Long-poll loop, fills the buffer with received batches"""
+        while self._running:
+            try:
+                messages = yield self.sqs.receive_messages(
+                    self.queue_url, self.wait_time, self.batch_size,
+                    self.visibility_timeout)
+            except Exception:
+                logger.exception("Failed to receive from %s", self.queue_url)
+                yield sleep(self.error_delay)
+                continue
+            if messages:
+                # waits while the buffer is full
+                yield self._buffer.put(messages)
+        yield self._buffer.put(None)
+
+
+class VisibilityHeartbeat(object):
+    """
+    Periodically extends visibility timeout of tracked messages, so that
+    long-running handlers keep their messages hidden while a crashed worker
+    releases them quickly. Extensions of all messages in a queue are sent
+    with ChangeMessageVisibilityBatch, 10 per request. Messages that can not
+    be extended anymore (deleted, expired handle) are untracked.
+    Requires SQS client in async mode.
+
+    :param sqs: SQS client instance.
+    :param visibility_timeout: new visibility timeout (in seconds) set on
+        every extension.
+    :param interval: time (in seconds) between extensions, half of
+        visibility_timeout by default.
+    """
+    def __init__(self, sqs, visibility_timeout=60, interval=None):
+        assert sqs._async, "heartbeat requires async mode"
+        self.sqs = sqs
+        self.visibility_timeout = visibility_timeout
+        self.interval = interval or visibility_timeout / 2.0
+        self._handles = {}
+        self._beating = False
+        self._timer = None
+
+    def track(self, queue_url, receipt_handle):
+        """Start extending visibility of the message"""
+        self._handles.setdefault(queue_url, set()).add(receipt_handle)
+
+    def untrack(self, queue_url, receipt_handle):
+        """Stop extending visibility, call after the message is deleted"""
+        handles = self._handles.get(queue_url)
+        if handles is not None:
+            handles.discard(receipt_handle)
+            if not handles:
+                del self._handles[queue_url]
+
+    def __len__(self):
+        return sum(len(handles) for handles in self._handles.values())
+
+    def start(self):
+        """Start extending visibility on the current IOLoop"""
+        if self._timer is None:
+            self._timer = PeriodicCallback(self.beat, self.interval * 1000)
+            self._timer.start()
+
+    def stop(self):
+        """Stop extending visibility, tracked messages are kept"""
+        if self._timer is not None:
+            self._timer.stop()
+            self._timer = None
+
+    @coroutine
+    def beat(self):
+        """Extend visibility of all tracked messages once"""
+        if self._beating:
+            # previous extension is still running
+            return
+        self._beating = True
+        try:
+            requests = []
+            for queue_url, handles in self._handles.items():
+                handles = list(handles)
+                for start in range(0, len(handles), 10):
+                    requests.append(self._extend(queue_url,
+                                                 handles[start:start + 10]))
+            yield requests
+        finally:
+            self._beating = False
+
+    @coroutine
+    def _extend(self, queue_url, handles):
+        """Extend visibility of up to 10 messages of one queue"""
+        entries = [{'Id': str(i), 'ReceiptHandle': handle,
+                    'VisibilityTimeout': self.visibility_timeout}
+                   for i, handle in enumerate(handles)]
+        try:
+            result = yield self.sqs.change_message_visibility_batch(
+                queue_url, entries)
+        except Exception:
+            logger.exception("Failed to extend visibility in %s", queue_url)
+            return
+        for item in result['Failed']:
+            logger.warning("Can not extend visibility in %s: %s",
+                           queue_url, item.get('Message'))
+            self.untrack(queue_url, handles[int(item['Id'])])
@@ -1,12 +1,135 @@
-from tornado.httpclient import HTTPRequest, HTTPClient, AsyncHTTPClient
+from tornado.httpclient import (HTTPRequest, HTTPClient, AsyncHTTPClient,
+                                HTTPError)
 from tornado.ioloop import IOLoop
 from tornado.httputil import url_concat
-from concurrent.futures import Future
+from tornado.concurrent import Future
+from tornado.gen import coroutine, Return, maybe_future
 from urlparse import urlparse
-from lxml import objectify
+from urllib import urlencode
+from lxml import objectify, etree
+from collections import deque
+from asyncaws.parsers import ResponseParser, local_name
+from asyncaws.instrumentation import CallMetrics, notify
+from asyncaws.cache import NameCache
+from asyncaws.credentials import (CredentialsCache, StaticProvider,
+                                  ChainProvider)
+import copy
 import datetime
 import hashlib
 import hmac
+import random
+import socket
+import time
+
+ALGORITHM = 'AWS4-HMAC-SHA256'
+SIGNED_HEADERS = 'host;x-amz-date'
+# GET requests have an empty payload, its hash never changes
+EMPTY_PAYLOAD_HASH = hashlib.sha256('').hexdigest()
+FORM_CONTENT_TYPE = 'application/x-www-form-urlencoded; charset=utf-8'
+
+
+class AWSError(Exception):
+    """
+    Error reported by AWS API, either for the whole request
+    or for a single entry of a batch request
+    """
+    def __init__(self, code, message, sender_fault=None, status_code=None):
+        super(AWSError, self).__init__('{}: {}'.format(code, message))
+        self.code = code
+        self.message = message
+        self.sender_fault = sender_fault
+        self.status_code = status_code
+
+
+def parse_error(exc):
+    """
+    Convert HTTPError with AWS ErrorResponse body to AWSError.
+    Other exceptions (connection errors, timeouts) are returned as is.
+    """
+    response = getattr(exc, 'response', None)
+    if not isinstance(exc, HTTPError) or response is None or not response.body:
+        return exc
+    try:
+        root = etree.fromstring(response.body)
+    except etree.XMLSyntaxError:
+        return exc
+    error = dict((local_name(child), child.text)
+                 for child in root.iter() if not len(child))
+    if 'Code' not in error:
+        return exc
+    return AWSError(error['Code'], error.get('Message'),
+                    sender_fault=error.get('Type') == 'Sender',
+                    status_code=exc.code)
+
+
+class RetryPolicy(object):
+    """
+    Decides if and when a failed request is repeated.
+    Server errors, throttling and connection errors are retried with
+    full-jitter exponential backoff. Every retry takes tokens from a retry
+    budget, and every success returns one, so that during an outage retries
+    quickly stop instead of multiplying the load.
+
+    :param max_attempts: max number of attempts, including the first one.
+    :param base_delay: backoff (in seconds) before the first retry.
+    :param max_delay: upper limit of backoff (in seconds).
+    :param budget: capacity of the retry budget, in tokens.
+    :param retry_cost: number of tokens taken by one retry.
+    """
+    retryable_codes = frozenset([
+        'Throttling', 'ThrottlingException', 'ThrottledException',
+        'RequestThrottled', 'RequestThrottledException',
+        'RequestLimitExceeded', 'TooManyRequestsException',
+        'ServiceUnavailable', 'InternalError', 'InternalFailure',
+        'RequestTimeout', 'RequestTimeoutException',
+    ])
+    throttling_codes = frozenset([
+        'Throttling', 'ThrottlingException', 'ThrottledException',
+        'RequestThrottled', 'RequestThrottledException',
+        'RequestLimitExceeded', 'TooManyRequestsException',
+    ])
+
+    def __init__(self, max_attempts=3, base_delay=0.05, max_delay=20,
+                 budget=500, retry_cost=5):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.retry_cost = retry_cost
+        self.tokens = budget
+
+    def is_retryable(self, error):
+        """Classify error of a single attempt"""
+        if isinstance(error, AWSError):
+            return (error.code in self.retryable_codes or
+                    (error.status_code or 0) >= 500)
+        if isinstance(error, HTTPError):
+            # 599 is used by tornado for timeouts and connection errors
+            return error.code >= 500
+        return isinstance(error, (socket.error, IOError))
+
+    def is_throttling(self, error):
+        """True if AWS asked to slow down"""
+        return getattr(error, 'code', None) in self.throttling_codes
+
+    def should_retry(self, error, attempt):
+        """Check attempt number and error, take retry tokens if allowed"""
+        if attempt >= self.max_attempts or not self.is_retryable(error):
+            return False
+        if self.tokens < self.retry_cost:
+            return False
+        self.tokens -= self.retry_cost
+        return True
+
+    def delay(self, attempt):
+        """Full-jitter backoff (in seconds) before the next attempt"""
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(0, ceiling)
+
+    def record_success(self):
+        """Return one token to the retry budget"""
+        if self.tokens < self.budget:
+            self.tokens += 1
 
 
 def sign(key, msg):
@@ -23,15 +146,126 @@ def get_signature_key(key, date_stamp, region_name, service_name):
     return k_signing
 
 
+def parse_response(parse_function, raw_response):
+    """
+    Call parse function with raw response if it is a ResponseParser,
+    plain functions get the root of lxml.objectify tree
+    """
+    if isinstance(parse_function, ResponseParser):
+        return parse_function.parse(raw_response)
+    return parse_function(objectify.fromstring(raw_response))
+
+
+def payload_hash(body):
+    """Hex SHA-256 of request payload, signed as part of the request"""
+    return hashlib.sha256(body).hexdigest() if body else EMPTY_PAYLOAD_HASH
+
+
+def message_attribute_params(prefix, attributes):
+    """
+    Request params of message attributes, e.g. MessageAttribute.1.Name.
+    Values are dicts with DataType and StringValue or BinaryValue,
+    plain values are sent as String.
+    """
+    params = {}
+    for i, (name, value) in enumerate(sorted(attributes.items())):
+        if not isinstance(value, dict):
+            value = {'DataType': 'String', 'StringValue': value}
+        params['%s.%s.Name' % (prefix, i+1)] = name
+        for key, item in value.items():
+            params['%s.%s.Value.%s' % (prefix, i+1, key)] = item
+    return params
+
+
+def message_size(body, attributes=None):
+    """Size of message body and attributes, as counted by AWS limits"""
+    size = len(body.encode('utf-8') if isinstance(body, unicode) else body)
+    for name, value in (attributes or {}).items():
+        size += len(name)
+        if isinstance(value, dict):
+            size += sum(len(item) for item in value.values())
+        else:
+            size += len(value) + len('String')
+    return size
+
+
+def encode_body(params):
+    """Form-encode request params for POST body, unicode as utf-8"""
+    return urlencode([
+        (key, value.encode('utf-8') if isinstance(value, unicode) else value)
+        for key, value in params.items()])
+
+
+@coroutine
+def run_bounded(client, operations, concurrency, callback=None):
+    """
+    Run operations on the current IOLoop, at most `concurrency` at once.
+    Workers share one iterator, so operations may be a generator.
+
+    :return: Future with list of (result, error) in order of operations.
+    """
+    results = {}
+    pending = enumerate(operations)
+
+    @coroutine
+    def worker():
+        for index, operation in pending:
+            try:
+                result = yield maybe_future(operation(client))
+            except Exception as exc:
+                results[index] = (None, exc)
+            else:
+                results[index] = (result, None)
+            if callback is not None:
+                callback(index, *results[index])
+
+    yield [worker() for _ in range(concurrency)]
+    raise Return([results[index] for index in range(len(results))])
+
+
+class SigningKeyCache(object):
+    """
+    Keeps derived v4 signing keys and credential scopes for the current
+    UTC day. Derivation costs four chained HMACs, but its result only changes
+    once a day per region and service, so every request can reuse it.
+    """
+    def __init__(self, secret_key):
+        self._secret_key = secret_key
+        self._date_stamp = None
+        self._entries = {}
+
+    def get(self, date_stamp, region, service):
+        """Return (signing_key, scope) tuple, deriving it on first use"""
+        if date_stamp != self._date_stamp:
+            # midnight UTC passed, keys of the previous day are stale
+            self._entries = {}
+            self._date_stamp = date_stamp
+        cache_key = (date_stamp, region, service)
+        entry = self._entries.get(cache_key)
+        if entry is None:
+            sign_key = get_signature_key(self._secret_key, date_stamp,
+                                         region, service)
+            scope = '{date_stamp}/{region}/{service}/aws4_request'.format(
+                date_stamp=date_stamp, region=region, service=service)
+            entry = self._entries[cache_key] = (sign_key, scope)
+        return entry
+
+
 class AWSRequest(HTTPRequest):
     """
     Generic AWS Adapter for Tornado HTTP request
-    Generates v4 signature and sets all required headers
+    Generates v4 signature and sets all required headers.
+    POST requests carry form-encoded params in body, its hash is signed,
+    precomputed payload_hash can be passed to skip hashing of the body.
+    Session token of temporary credentials is sent and signed if given.
     """
     def __init__(self, *args, **kwargs):
         service = kwargs['service']
         region = kwargs['region']
         method = kwargs.get('method', 'GET')
+        body = kwargs.get('body')
+        body_hash = kwargs.pop('payload_hash', None) or payload_hash(body)
+        token = kwargs.pop('token', None)
         url = kwargs.get('url') or args[0]
         # tornado url_concat encodes spaces as '+', but AWS expects '%20'
         url = url.replace('+', '%20')
@@ -44,16 +278,16 @@ class AWSRequest(HTTPRequest):
         kwargs['url'] = url.replace(parsed_url.query, canonical_querystring)
         # reset args, everything is passed with kwargs
         args = tuple()
-        # prepare timestamps
-        utc_time = datetime.datetime.utcnow()
-        amz_date = utc_time.strftime('%Y%m%dT%H%M%SZ')
-        date_stamp = utc_time.strftime('%Y%m%d')
+        # prepare timestamps, date stamp is a prefix of amz date
+        amz_date = datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+        date_stamp = amz_date[:8]
         # prepare aws-specific headers
         canonical_headers = 'host:{host}\nx-amz-date:{amz_date}\n'.format(
             host=host, amz_date=amz_date)
-        signed_headers = 'host;x-amz-date'
-        # for GET requests payload is empty
-        payload_hash = hashlib.sha256('').hexdigest()
+        signed_headers = SIGNED_HEADERS
+        if token:
+            canonical_headers += 'x-amz-security-token:{}\n'.format(token)
+            signed_headers += ';x-amz-security-token'
 
         canonical_request = (
             '{method}\n{canonical_uri}\n{canonical_querystring}'
@@ -62,24 +296,23 @@ class AWSRequest(HTTPRequest):
             method=method, canonical_uri=canonical_uri,
             canonical_querystring=canonical_querystring,
             canonical_headers=canonical_headers, signed_headers=signed_headers,
-            payload_hash=payload_hash
+            payload_hash=body_hash
         )
-        # creating signature
-        algorithm = 'AWS4-HMAC-SHA256'
-        scope = '{date_stamp}/{region}/{service}/aws4_request'.format(
-            date_stamp=date_stamp, region=region, service=service)
+        # creating signature, derived key is reused if cache is provided
+        signing_keys = kwargs.pop('signing_keys', None)
+        if signing_keys is None:
+            signing_keys = SigningKeyCache(kwargs['secret_key'])
+        sign_key, scope = signing_keys.get(date_stamp, region, service)
         string_to_sign = '{algorithm}\n{amz_date}\n{scope}\n{hash}'.format(
-            algorithm=algorithm, amz_date=amz_date, scope=scope,
+            algorithm=ALGORITHM, amz_date=amz_date, scope=scope,
             hash=hashlib.sha256(canonical_request).hexdigest())
-        sign_key = get_signature_key(kwargs['secret_key'],
-                                     date_stamp, region, service)
         hash_tuple = (sign_key, string_to_sign.encode('utf-8'), hashlib.sha256)
         signature = hmac.new(*hash_tuple).hexdigest()
         authorization_header = (
             '{algorithm} Credential={access_key}/{scope}, '
             'SignedHeaders={signed_headers}, Signature={signature}'
         ).format(
-            algorithm=algorithm, access_key=kwargs['access_key'], scope=scope,
+            algorithm=ALGORITHM, access_key=kwargs['access_key'], scope=scope,
             signed_headers=signed_headers, signature=signature
         )
         # clean-up kwargs
@@ -91,42 +324,474 @@ class AWSRequest(HTTPRequest):
         headers = kwargs.get('headers', {})
         headers.update({'x-amz-date': amz_date,
                         'Authorization': authorization_header})
+        if token:
+            headers['x-amz-security-token'] = token
+        if body is not None:
+            headers.setdefault('Content-Type', FORM_CONTENT_TYPE)
         kwargs['headers'] = headers
         # init Tornado HTTPRequest
         super(AWSRequest, self).__init__(*args, **kwargs)
 
 
+class RateLimiter(object):
+    """
+    Token bucket limiting the rate of requests, adapted with AIMD:
+    every success raises the rate by about `increase` requests per second
+    each second, every throttling response multiplies it by `decrease`.
+    Requests over the limit wait in a FIFO queue without blocking IOLoop.
+    Limiters returned by `shared` are common for all clients of the same
+    service, region and account.
+
+    :param rate: initial rate, requests per second.
+    :param min_rate: the rate never goes below this value.
+    :param max_rate: the rate never goes above this value.
+    :param burst: bucket capacity, max number of requests sent at once.
+    :param increase: additive increase, requests per second.
+    :param decrease: multiplicative decrease factor on throttling.
+    :param cooldown: time (in seconds) after a decrease when further
+        throttling responses are ignored, they usually belong to requests
+        sent before the decrease.
+    """
+    _shared = {}
+
+    def __init__(self, rate=50, min_rate=1, max_rate=None, burst=None,
+                 increase=1, decrease=0.5, cooldown=1):
+        self.min_rate = min_rate
+        self.max_rate = max_rate or rate * 10
+        self.burst = burst or max(1, rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self._rate = float(rate)
+        self._tokens = float(self.burst)
+        self._updated = time.time()
+        self._decreased = 0
+        self._waiters = deque()
+        self._timeout = None
+
+    @classmethod
+    def shared(cls, service, region, account, **kwargs):
+        """Return limiter for given service, region and account"""
+        key = (service, region, account)
+        limiter = cls._shared.get(key)
+        if limiter is None:
+            limiter = cls._shared[key] = cls(**kwargs)
+        return limiter
+
+    @property
+    def rate(self):
+        """Current rate limit, requests per second"""
+        return self._rate
+
+    @property
+    def queue_depth(self):
+        """Number of requests waiting for a token"""
+        return len(self._waiters)
+
+    def acquire(self):
+        """
+        Take a token for one request.
+
+        :return: Future, resolved when the request may be sent.
+        """
+        future = Future()
+        self._refill()
+        if not self._waiters and self._tokens >= 1:
+            self._tokens -= 1
+            future.set_result(None)
+        else:
+            self._waiters.append(future)
+            self._schedule()
+        return future
+
+    def wait(self):
+        """Take a token for one request, sleeping if needed (sync mode)"""
+        self._refill()
+        if self._tokens < 1:
+            time.sleep((1 - self._tokens) / self._rate)
+            self._refill()
+        self._tokens -= 1
+
+    def on_success(self):
+        """Additive increase"""
+        self._rate = min(self.max_rate,
+                         self._rate + self.increase / self._rate)
+
+    def on_throttle(self):
+        """Multiplicative decrease"""
+        now = time.time()
+        if now - self._decreased < self.cooldown:
+            return
+        self._decreased = now
+        self._rate = max(self.min_rate, self._rate * self.decrease)
+
+    def _refill(self):
+        """Add tokens for the time passed since the last refill"""
+        now = time.time()
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def _schedule(self):
+        """Wake up the queue when the next token is available"""
+        if self._timeout is None:
+            delay = max(0, (1 - self._tokens) / self._rate)
+            self._timeout = IOLoop.current().call_later(delay, self._release)
+
+    def _release(self):
+        """Hand over available tokens to waiting requests"""
+        self._timeout = None
+        self._refill()
+        while self._waiters and self._tokens >= 1:
+            self._tokens -= 1
+            self._waiters.popleft().set_result(None)
+        if self._waiters:
+            self._schedule()
+
+
 class AWS(object):
     """
     Generic class for AWS API implementations: SQS, SNS, etc
     """
-    def __init__(self, access_key, secret_key, region, async=True):
+    # actions always sent as POST, they usually carry large payloads
+    post_actions = frozenset()
+
+    def __init__(self, access_key, secret_key, region, async=True,
+                 retry_policy=None, rate_limit=None, post_threshold=2048,
+                 transport=None, endpoint=None, instrumentation=None,
+                 executor=None, offload_threshold=32 * 1024,
+                 name_cache_ttl=300, credentials=None, codec=None):
+        assert codec is None or async, "codec requires async mode"
         self.region = region
-        self.__access_key = access_key
-        self.__secret_key = secret_key
-        self._http = AsyncHTTPClient() if async else HTTPClient()
+        self.codec = codec
+        self.executor = executor
+        self.offload_threshold = offload_threshold
+        self.instrumentation = instrumentation
+        if endpoint is None:
+            endpoint = "http://{service}.{region}.amazonaws.com/".format(
+                service=getattr(self, 'service', None), region=region)
+        self.endpoint = endpoint
+        self.transport = transport
+        self.post_threshold = post_threshold
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.rate_limiter = None
+        if rate_limit:
+            self.rate_limiter = RateLimiter.shared(
+                getattr(self, 'service', None), region, access_key,
+                rate=rate_limit)
+        if access_key is not None:
+            static = StaticProvider(access_key, secret_key)
+            self.credentials = CredentialsCache(
+                static, async, credentials=static.credentials)
+        else:
+            self.credentials = CredentialsCache(
+                credentials or ChainProvider(), async)
+        # derived keys are tied to the secret key of current credentials
+        self._signing_credentials = None
+        self._signing_keys = None
+        if transport is None:
+            # shared tornado client with default settings
+            self._http = AsyncHTTPClient() if async else HTTPClient()
+            self._long_poll_http = self._http
+        else:
+            self._http, self._long_poll_http = transport.create_clients(async)
         self._async = async
+        # queue URLs and topic ARNs resolved by name
+        self.names = NameCache(name_cache_ttl, async)
+
+    def _sign(self, full_url, service, body=None, **request_kwargs):
+        """Make signed request, called for every attempt"""
+        credentials = self.credentials.current
+        if credentials is None:
+            # sync mode, async calls wait for credentials before signing
+            credentials = self.credentials.load_sync()
+        if credentials is not self._signing_credentials:
+            self._signing_keys = SigningKeyCache(credentials.secret_key)
+            self._signing_credentials = credentials
+        return AWSRequest(full_url, service=service, region=self.region,
+                          access_key=credentials.access_key,
+                          secret_key=credentials.secret_key,
+                          token=credentials.token,
+                          signing_keys=self._signing_keys,
+                          method='GET' if body is None else 'POST',
+                          body=body, **request_kwargs)
+
+    def close(self):
+        """
+        Close HTTP clients made for this client by its transport, or the
+        private synchronous one. The shared AsyncHTTPClient of the IOLoop
+        is left open, other clients use it too.
+        """
+        if self._async and self.transport is None:
+            return
+        for client in set([self._http, self._long_poll_http]):
+            client.close()
+
+    def gather(self, operations, concurrency=10, callback=None):
+        """
+        Run many calls with at most `concurrency` of them in flight, e.g.
+        get_queue_attributes of every queue. A failed call does not stop
+        the others, its error is returned in its place.
+        Sync clients run the calls concurrently on a private IOLoop,
+        so the whole batch takes about as long as the slowest calls.
+
+        :param operations: iterable of functions called with an async
+            client, returning Future of the call, e.g.
+            ``lambda sqs: sqs.get_queue_attributes(url)``.
+        :param concurrency: max number of calls in flight.
+        :param callback: optional function(index, result, error) called
+            as every operation completes.
+        :return: list of (result, error) tuples in order of operations,
+            error is None for successful calls (Future of it in async mode).
+        """
+        if self._async:
+            return run_bounded(self, operations, concurrency, callback)
+        if self.credentials.current is None:
+            self.credentials.load_sync()
+        io_loop = IOLoop(make_current=False)
+        clients = []
+
+        def run():
+            twin = self._async_twin(concurrency)
+            clients.extend(set([twin._http, twin._long_poll_http]))
+            return run_bounded(twin, operations, concurrency, callback)
+
+        try:
+            return io_loop.run_sync(run)
+        finally:
+            for client in clients:
+                client.close()
+            io_loop.close(all_fds=True)
+
+    def _async_twin(self, max_clients):
+        """Async copy of sync client, bound to the current IOLoop"""
+        twin = copy.copy(self)
+        twin._async = True
+        if self.transport is None:
+            twin._http = AsyncHTTPClient(force_instance=True,
+                                         max_clients=max_clients)
+            twin._long_poll_http = twin._http
+        else:
+            twin._http, twin._long_poll_http = \
+                self.transport.create_clients(True)
+        twin.names = NameCache(self.names.ttl, True)
+        return twin
+
+    def _use_post(self, params):
+        """POST listed actions and params longer than post_threshold"""
+        if params.get('Action') in self.post_actions:
+            return True
+        size = 0
+        for value in params.values():
+            if isinstance(value, basestring):
+                size += len(value)
+        return size > self.post_threshold
 
     def _process(self, url, params, service, parse_function):
         """Prepare request and result parsing callback"""
-        full_url = url_concat(url, params)
-        request = AWSRequest(full_url, service=service, region=self.region,
-                             access_key=self.__access_key,
-                             secret_key=self.__secret_key)
+        if self._use_post(params):
+            full_url, body = url, encode_body(params)
+        else:
+            full_url, body = url_concat(url, params), None
+        # long polls go to their own connection pool
+        wait_time = int(params.get('WaitTimeSeconds') or 0)
+        http = self._long_poll_http if wait_time else self._http
+        request_kwargs = {}
+        if self.transport is not None:
+            request_kwargs = self.transport.request_kwargs(wait_time)
+        policy = self.retry_policy
+        limiter = self.rate_limiter
+        instrumentation = self.instrumentation
+        metrics = None
+        if instrumentation is not None:
+            metrics = CallMetrics(service, params.get('Action'), self.region)
+            notify(instrumentation, 'request_start', metrics)
+        # large payloads are hashed and parsed by executor, if any
+        executor = self.executor if self._async else None
+        threshold = self.offload_threshold
+        # body does not change between attempts, it is hashed once
+        hashed = []
+
+        def make_request():
+            """sign request with payload hash of the first attempt"""
+            if not hashed:
+                hashed.append(payload_hash(body))
+            return self._sign(full_url, service, body,
+                              payload_hash=hashed[0], **request_kwargs)
+
+        def sign():
+            """make signed request, measure signing time and size"""
+            if metrics is None:
+                return make_request()
+            started = time.time()
+            request = make_request()
+            metrics.attempts += 1
+            metrics.sign_time += time.time() - started
+            metrics.request_bytes += len(request.url) + len(body or '')
+            return request
+
+        def received(response, started):
+            """measure network time and response size"""
+            if metrics is not None and response is not None:
+                metrics.network_time += time.time() - started
+                metrics.response_bytes += len(response.body or '')
+                metrics.status_code = response.code
+
+        def parse(raw_response):
+            """parse response, measure parsing time"""
+            if metrics is None:
+                return parse_response(parse_function, raw_response)
+            started = time.time()
+            try:
+                return parse_response(parse_function, raw_response)
+            finally:
+                metrics.parse_time += time.time() - started
+
+        def finish(error=None):
+            """report the end of the call"""
+            if metrics is not None:
+                metrics.error = error
+                metrics.finished = time.time()
+                notify(instrumentation, 'request_end', metrics)
+
         if not self._async:
-            http_response = self._http.fetch(request)
-            xml_root = objectify.fromstring(http_response.body)
-            response = parse_function(xml_root)
+            attempt = 1
+            while True:
+                if limiter is not None:
+                    limiter.wait()
+                started = time.time()
+                try:
+                    http_response = http.fetch(sign())
+                    received(http_response, started)
+                    break
+                except Exception as exc:
+                    received(getattr(exc, 'response', None), started)
+                    error = parse_error(exc)
+                    if limiter is not None and policy.is_throttling(error):
+                        limiter.on_throttle()
+                    if not policy.should_retry(error, attempt):
+                        finish(error)
+                        raise error
+                time.sleep(policy.delay(attempt))
+                attempt += 1
+            policy.record_success()
+            if limiter is not None:
+                limiter.on_success()
+            try:
+                response = parse(http_response.body)
+            except Exception as exc:
+                finish(exc)
+                raise
+            finish()
             return response
 
         ioloop = IOLoop.current()
         final_result = Future()
 
-        def inject_result(future):
+        def fetch(attempt):
+            """wait for rate limiter if needed"""
+            if limiter is None:
+                send(attempt)
+            else:
+                limiter.acquire().add_done_callback(
+                    lambda future: send(attempt))
+
+        def send(attempt):
+            """send freshly signed request"""
+            try:
+                request = sign()
+                started = time.time()
+                # both futures live on the IOLoop thread, results are chained
+                # directly, without a hop through the IOLoop callback queue
+                http.fetch(request).add_done_callback(
+                    lambda future: inject_result(future, attempt, started))
+            except Exception as exc:
+                # runs from callbacks, nobody else would see the error
+                fail(exc)
+
+        def fail(exc):
+            """report the error of the call to its Future"""
+            finish(exc)
+            final_result.set_exception(exc)
+
+        def inject_result(future, attempt, started):
             """callback to connect AsyncHTTPClient future with parse function"""
-            raw_response = future.result().body
-            xml_root = objectify.fromstring(raw_response)
-            final_result.set_result(parse_function(xml_root))
+            try:
+                http_response = future.result()
+                received(http_response, started)
+            except Exception as exc:
+                received(getattr(exc, 'response', None), started)
+                error = parse_error(exc)
+                if limiter is not None and policy.is_throttling(error):
+                    limiter.on_throttle()
+                if policy.should_retry(error, attempt):
+                    ioloop.call_later(policy.delay(attempt), fetch,
+                                      attempt + 1)
+                else:
+                    finish(error)
+                    final_result.set_exception(error)
+                return
+            policy.record_success()
+            if limiter is not None:
+                limiter.on_success()
+            raw_response = http_response.body
+            if executor is not None and len(raw_response) >= threshold:
+                submitted = time.time()
+                ioloop.add_future(
+                    executor.submit(parse_response, parse_function,
+                                    raw_response),
+                    lambda future: parsed(future, submitted))
+                return
+            try:
+                response = parse(raw_response)
+            except Exception as exc:
+                finish(exc)
+                final_result.set_exception(exc)
+                return
+            finish()
+            final_result.set_result(response)
+
+        def parsed(future, started):
+            """callback of parsing done by executor"""
+            if metrics is not None:
+                metrics.parse_time += time.time() - started
+            try:
+                response = future.result()
+            except Exception as exc:
+                finish(exc)
+                final_result.set_exception(exc)
+                return
+            finish()
+            final_result.set_result(response)
+
+        def start():
+            """send the first attempt, large body is hashed by executor"""
+            if executor is not None and body is not None and \
+                    len(body) >= threshold:
+                def payload_hashed(future):
+                    try:
+                        hashed.append(future.result())
+                    except Exception as exc:
+                        fail(exc)
+                        return
+                    fetch(1)
+                ioloop.add_future(executor.submit(payload_hash, body),
+                                  payload_hashed)
+            else:
+                fetch(1)
+
+        def credentials_loaded(future):
+            """start the call once the first credentials are known"""
+            try:
+                future.result()
+            except Exception as exc:
+                finish(exc)
+                final_result.set_exception(exc)
+                return
+            start()
 
-        ioloop.add_future(self._http.fetch(request), inject_result)
+        if self.credentials.current is None:
+            self.credentials.ready().add_done_callback(credentials_loaded)
+        else:
+            start()
         return final_result
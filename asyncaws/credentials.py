@@ -0,0 +1,348 @@
+"""
+Credential providers of AWS clients.
+Providers load credentials from a single source: static keys, environment,
+shared credentials file, container or EC2 instance metadata endpoints.
+CredentialsCache keeps the loaded credentials and refreshes temporary ones
+in the background ahead of their expiry, so requests never wait for it.
+"""
+import calendar
+import json
+import logging
+import os
+import time
+from ConfigParser import RawConfigParser, Error as ConfigError
+from tornado.concurrent import Future
+from tornado.gen import coroutine, Return, maybe_future
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.ioloop import IOLoop
+
+logger = logging.getLogger(__name__)
+
+
+class CredentialsError(Exception):
+    """No provider could load credentials"""
+
+
+class Credentials(object):
+    """
+    Access key, secret key and optional session token of temporary
+    credentials, expiration is a unix timestamp (None if static).
+    """
+    __slots__ = ('access_key', 'secret_key', 'token', 'expiration')
+
+    def __init__(self, access_key, secret_key, token=None, expiration=None):
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.token = token
+        self.expiration = expiration
+
+    def expires_within(self, seconds):
+        """True if credentials expire in less than given seconds"""
+        return (self.expiration is not None and
+                self.expiration - time.time() < seconds)
+
+
+def parse_expiration(value):
+    """Unix timestamp of ISO 8601 UTC time, e.g. 2016-10-18T12:00:00Z"""
+    return calendar.timegm(time.strptime(value[:19], '%Y-%m-%dT%H:%M:%S'))
+
+
+def from_json(body):
+    """Credentials of container or instance metadata JSON response"""
+    data = json.loads(body)
+    return Credentials(data['AccessKeyId'], data['SecretAccessKey'],
+                       data.get('Token'),
+                       parse_expiration(data['Expiration'])
+                       if data.get('Expiration') else None)
+
+
+class CredentialProvider(object):
+    """Base class of credential sources"""
+    def load(self):
+        """
+        Load credentials from the source.
+
+        :return: Credentials, None if the source has none, or Future with
+            either of them if the source is queried over HTTP.
+        """
+        raise NotImplementedError
+
+
+class StaticProvider(CredentialProvider):
+    """Fixed keys, e.g. passed to client constructor"""
+    def __init__(self, access_key, secret_key, token=None):
+        self.credentials = Credentials(access_key, secret_key, token)
+
+    def load(self):
+        return self.credentials
+
+
+class EnvironmentProvider(CredentialProvider):
+    """AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY and AWS_SESSION_TOKEN"""
+    def load(self):
+        access_key = os.environ.get('AWS_ACCESS_KEY_ID')
+        secret_key = os.environ.get('AWS_SECRET_ACCESS_KEY')
+        if not access_key or not secret_key:
+            return None
+        return Credentials(access_key, secret_key,
+                           os.environ.get('AWS_SESSION_TOKEN'))
+
+
+class SharedFileProvider(CredentialProvider):
+    """
+    Profile of the shared credentials file, as written by AWS CLI.
+
+    :param path: path of the file, AWS_SHARED_CREDENTIALS_FILE
+        or ~/.aws/credentials by default.
+    :param profile: section of the file, AWS_PROFILE or default.
+    """
+    def __init__(self, path=None, profile=None):
+        self.path = os.path.expanduser(
+            path or os.environ.get('AWS_SHARED_CREDENTIALS_FILE') or
+            '~/.aws/credentials')
+        self.profile = profile or os.environ.get('AWS_PROFILE') or 'default'
+
+    def load(self):
+        config = RawConfigParser()
+        try:
+            if not config.read(self.path):
+                return None
+            return Credentials(
+                config.get(self.profile, 'aws_access_key_id'),
+                config.get(self.profile, 'aws_secret_access_key'),
+                config.get(self.profile, 'aws_session_token')
+                if config.has_option(self.profile, 'aws_session_token')
+                else None)
+        except ConfigError:
+            return None
+
+
+def endpoint_client():
+    """
+    Private HTTP client of credential endpoints, their requests never wait
+    in the queue of the shared AsyncHTTPClient behind long polls.
+    """
+    return AsyncHTTPClient(force_instance=True)
+
+
+class ContainerProvider(CredentialProvider):
+    """
+    Credentials endpoint of ECS tasks, given by environment variables
+    AWS_CONTAINER_CREDENTIALS_RELATIVE_URI or _FULL_URI.
+
+    :param endpoint: URL of the credentials, overrides environment,
+        e.g. of a local server in tests.
+    :param timeout: timeout (in seconds) of the request.
+    """
+    host = 'http://169.254.170.2'
+
+    def __init__(self, endpoint=None, timeout=2):
+        if endpoint is None:
+            relative = os.environ.get('AWS_CONTAINER_CREDENTIALS_RELATIVE_URI')
+            if relative:
+                endpoint = self.host + relative
+            else:
+                endpoint = os.environ.get(
+                    'AWS_CONTAINER_CREDENTIALS_FULL_URI')
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    @coroutine
+    def load(self):
+        if not self.endpoint:
+            raise Return(None)
+        headers = {}
+        if os.environ.get('AWS_CONTAINER_AUTHORIZATION_TOKEN'):
+            headers['Authorization'] = \
+                os.environ['AWS_CONTAINER_AUTHORIZATION_TOKEN']
+        http = endpoint_client()
+        try:
+            response = yield http.fetch(HTTPRequest(
+                self.endpoint, headers=headers, connect_timeout=self.timeout,
+                request_timeout=self.timeout))
+        finally:
+            http.close()
+        raise Return(from_json(response.body))
+
+
+class InstanceMetadataProvider(CredentialProvider):
+    """
+    Credentials of EC2 instance profile role, from the instance metadata
+    service with session token (IMDSv2).
+
+    :param endpoint: URL of the metadata service, e.g. of a local
+        server in tests.
+    :param timeout: timeout (in seconds) of every request.
+    """
+    def __init__(self, endpoint='http://169.254.169.254', timeout=1):
+        self.endpoint = endpoint.rstrip('/')
+        self.timeout = timeout
+
+    @coroutine
+    def load(self):
+        http = endpoint_client()
+        try:
+            credentials = yield self._fetch(http)
+        finally:
+            http.close()
+        raise Return(credentials)
+
+    @coroutine
+    def _fetch(self, http):
+        """Get session token, role name and credentials of the role"""
+        token = yield http.fetch(HTTPRequest(
+            self.endpoint + '/latest/api/token', method='PUT', body='',
+            headers={'X-aws-ec2-metadata-token-ttl-seconds': '21600'},
+            connect_timeout=self.timeout, request_timeout=self.timeout))
+        headers = {'X-aws-ec2-metadata-token': token.body}
+        url = self.endpoint + '/latest/meta-data/iam/security-credentials/'
+        roles = yield http.fetch(HTTPRequest(
+            url, headers=headers, connect_timeout=self.timeout,
+            request_timeout=self.timeout))
+        role = roles.body.strip().split('\n')[0]
+        if not role:
+            raise Return(None)
+        response = yield http.fetch(HTTPRequest(
+            url + role, headers=headers, connect_timeout=self.timeout,
+            request_timeout=self.timeout))
+        raise Return(from_json(response.body))
+
+
+class ChainProvider(CredentialProvider):
+    """
+    Tries providers in order, the first one with credentials wins.
+    Errors of a provider (e.g. metadata service unreachable) are logged
+    and the next one is tried.
+
+    :param providers: list of providers, by default environment, shared
+        file, container and instance metadata.
+    """
+    def __init__(self, providers=None):
+        if providers is None:
+            providers = [EnvironmentProvider(), SharedFileProvider(),
+                         ContainerProvider(), InstanceMetadataProvider()]
+        self.providers = providers
+
+    @coroutine
+    def load(self):
+        for provider in self.providers:
+            try:
+                credentials = yield maybe_future(provider.load())
+            except Exception as error:
+                logger.debug("%s failed: %s", type(provider).__name__, error)
+                continue
+            if credentials is not None:
+                raise Return(credentials)
+        raise Return(None)
+
+
+class CredentialsCache(object):
+    """
+    Keeps credentials loaded by provider. Temporary credentials are
+    refreshed in the background once they expire within `advance` seconds;
+    requests keep using the current ones meanwhile and never wait for it.
+
+    :param provider: CredentialProvider.
+    :param async: False to load synchronously, for clients in sync mode.
+    :param advance: time (in seconds) before expiry to start the refresh.
+    :param retry_interval: min time (in seconds) between failed refreshes.
+    :param credentials: initial credentials, e.g. static keys.
+    """
+    def __init__(self, provider, async=True, advance=300, retry_interval=10,
+                 credentials=None):
+        self.provider = provider
+        self.advance = advance
+        self.retry_interval = retry_interval
+        self._async = async
+        self._credentials = credentials
+        self._loading = None
+        self._failed = 0
+
+    @property
+    def current(self):
+        """
+        Current credentials, None before the first load.
+        Starts background refresh if they are about to expire.
+        """
+        credentials = self._credentials
+        if credentials is not None and \
+                credentials.expires_within(self.advance) and \
+                self._loading is None and \
+                time.time() - self._failed > self.retry_interval:
+            if self._async:
+                self._load()
+            else:
+                self._refresh_sync()
+        return self._credentials
+
+    def ready(self):
+        """
+        Future resolved once credentials are loaded.
+        Fails with CredentialsError if the provider has none.
+        """
+        if self._credentials is not None:
+            future = Future()
+            future.set_result(self._credentials)
+            return future
+        if self._loading is None:
+            return self._load()
+        return self._loading
+
+    def load_sync(self):
+        """Load credentials, blocking (sync mode)"""
+        # HTTP providers run on a private IOLoop, as tornado HTTPClient does
+        io_loop = IOLoop(make_current=False)
+        try:
+            credentials = io_loop.run_sync(
+                lambda: maybe_future(self.provider.load()))
+        finally:
+            io_loop.close(all_fds=True)
+        self._loaded(credentials)
+        return self._credentials
+
+    def _refresh_sync(self):
+        """Refresh expiring credentials, keep them if they are still valid"""
+        try:
+            self.load_sync()
+        except Exception as error:
+            self._failed = time.time()
+            if self._credentials.expires_within(0):
+                raise
+            logger.warning("Refreshing credentials failed: %s", error)
+
+    def _load(self):
+        """Start loading in the background"""
+        future = Future()
+        try:
+            result = maybe_future(self.provider.load())
+        except Exception as error:
+            # provider failed before returning a Future
+            self._failed = time.time()
+            logger.warning("Loading credentials failed: %s", error)
+            if self._credentials is None:
+                future.set_exception(error)
+            else:
+                future.set_result(self._credentials)
+            return future
+        self._loading = future
+
+        def done(result):
+            self._loading = None
+            try:
+                self._loaded(result.result())
+            except Exception as error:
+                self._failed = time.time()
+                logger.warning("Loading credentials failed: %s", error)
+                if self._credentials is None:
+                    future.set_exception(error)
+                    return
+            future.set_result(self._credentials)
+
+        IOLoop.current().add_future(result, done)
+        return future
+
+    def _loaded(self, credentials):
+        """Replace current credentials"""
+        if credentials is None:
+            raise CredentialsError('Unable to locate credentials')
+        self._credentials = credentials
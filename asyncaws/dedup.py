@@ -0,0 +1,202 @@
+"""
+Suppression of repeated deliveries. SQS delivers messages at least once:
+a message can come again after its visibility timeout, or twice from
+SNS fan-out retries. Deduplicator remembers keys of processed messages
+and acknowledges repeated ones without running the handler again.
+"""
+import itertools
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from tornado.concurrent import Future, is_future
+from tornado.gen import coroutine, maybe_future
+
+
+class DuplicateFailed(Exception):
+    """Concurrent delivery of the same message failed, retry this one"""
+
+
+class DedupStore(object):
+    """
+    Base class of stores of processed message keys.
+    Methods may return Futures, e.g. of a remote cache client.
+    """
+    def seen(self, key):
+        """True if key was added and has not expired yet"""
+        raise NotImplementedError
+
+    def add(self, key):
+        """Remember key of a processed message"""
+        raise NotImplementedError
+
+
+class MemoryDedupStore(DedupStore):
+    """
+    Keys in an LRU dict of the process, every lookup is O(1) and at most
+    max_size keys are kept.
+
+    :param max_size: max number of keys, least recently used are dropped.
+    :param ttl: time (in seconds) a key is kept, should exceed the time
+        in which a message can be redelivered.
+    """
+    def __init__(self, max_size=100000, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._keys = OrderedDict()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def seen(self, key):
+        expires = self._keys.pop(key, None)
+        if expires is None or expires <= time.time():
+            return False
+        # move to the end, the most recently used
+        self._keys[key] = expires
+        return True
+
+    def add(self, key):
+        self._keys.pop(key, None)
+        self._keys[key] = time.time() + self.ttl
+        while len(self._keys) > self.max_size:
+            self._keys.popitem(last=False)
+
+
+class SQLiteDedupStore(DedupStore):
+    """
+    Keys in an SQLite file, shared by worker processes of one host.
+    Queries run on executor threads, never on the IOLoop thread, so waiting
+    for a lock held by another process does not stall the loop; methods
+    return Futures. Expired keys are purged every purge_interval additions,
+    so the file holds about ttl seconds of keys.
+
+    :param path: path of the database file, created if missing.
+    :param ttl: time (in seconds) a key is kept.
+    :param timeout: time (in seconds) to wait for a lock of other process.
+    :param purge_interval: number of additions between purges.
+    :param executor: concurrent.futures thread pool running the queries,
+        e.g. executor of the client, a private single thread by default.
+    """
+    def __init__(self, path, ttl=3600, timeout=5, purge_interval=1000,
+                 executor=None):
+        self.path = path
+        self.ttl = ttl
+        self.timeout = timeout
+        self.purge_interval = purge_interval
+        self._own_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(1)
+        # sqlite3 connections can not be shared between threads
+        self._local = threading.local()
+        self._connections = []
+        self._added = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _db(self):
+        """Connection of the current executor thread"""
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            # autocommit, every statement is its own transaction
+            db = sqlite3.connect(self.path, timeout=self.timeout,
+                                 isolation_level=None,
+                                 check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('CREATE TABLE IF NOT EXISTS processed '
+                       '(key TEXT PRIMARY KEY, expires REAL NOT NULL)')
+            db.execute('CREATE INDEX IF NOT EXISTS processed_expires '
+                       'ON processed (expires)')
+            self._local.db = db
+            with self._lock:
+                self._connections.append(db)
+        return db
+
+    def seen(self, key):
+        return self.executor.submit(self._seen, key)
+
+    def add(self, key):
+        return self.executor.submit(self._add, key)
+
+    def _seen(self, key):
+        row = self._db().execute(
+            'SELECT expires FROM processed WHERE key = ?', (key,)).fetchone()
+        return row is not None and row[0] > time.time()
+
+    def _add(self, key):
+        now = time.time()
+        db = self._db()
+        db.execute('INSERT OR REPLACE INTO processed VALUES (?, ?)',
+                   (key, now + self.ttl))
+        if next(self._added) % self.purge_interval == 0:
+            db.execute('DELETE FROM processed WHERE expires <= ?', (now,))
+
+    def close(self):
+        """Wait for pending queries and close the database connections"""
+        if self._own_executor:
+            self.executor.shutdown()
+        with self._lock:
+            for db in self._connections:
+                db.close()
+            del self._connections[:]
+
+
+def message_id(message):
+    """Default dedup key, ID assigned by SQS"""
+    return message['MessageId']
+
+
+class Deduplicator(object):
+    """
+    Handler wrapper that runs the handler once per key. Keys are recorded
+    after the handler succeeds, so failed messages are retried as usual.
+    A message whose key is already recorded returns right away, and the
+    consumer deletes it. A duplicate that arrives while the same key is
+    still being processed waits for that run: it is acknowledged if the
+    run succeeds and fails with DuplicateFailed otherwise.
+    Use as handler of SQSConsumer or MultiQueueConsumer::
+
+        consumer = SQSConsumer(sqs, queue_url, Deduplicator(
+            handler, SQLiteDedupStore('/var/run/worker/dedup.db')))
+
+    :param handler: function or coroutine, called with every new message.
+    :param store: DedupStore, MemoryDedupStore by default.
+    :param key: function(message) returning its key, MessageId by default.
+        Messages of SNS fan-out get new IDs in every queue; to skip an
+        SNS notification repeated in the same queue use its own ID,
+        e.g. ``lambda m: json.loads(m['Body'])['MessageId']``.
+    """
+    def __init__(self, handler, store=None, key=message_id):
+        self.handler = handler
+        self.store = store if store is not None else MemoryDedupStore()
+        self.key = key
+        self.skipped = 0
+        # key -> Future resolved with True once processed, False on error
+        self._pending = {}
+
+    @coroutine
+    def __call__(self, message):
+        key = self.key(message)
+        pending = self._pending.get(key)
+        if pending is not None:
+            processed = yield pending
+            if not processed:
+                raise DuplicateFailed(key)
+            self.skipped += 1
+            return
+        done = self._pending[key] = Future()
+        try:
+            seen = yield maybe_future(self.store.seen(key))
+            if seen:
+                self.skipped += 1
+            else:
+                result = self.handler(message)
+                if is_future(result):
+                    yield result
+                yield maybe_future(self.store.add(key))
+        except Exception:
+            done.set_result(False)
+            raise
+        else:
+            done.set_result(True)
+        finally:
+            del self._pending[key]
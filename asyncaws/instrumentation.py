@@ -0,0 +1,148 @@
+"""Instrumentation hooks and metrics of AWS calls"""
+import logging
+import socket
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CallMetrics(object):
+    """
+    Measurements of a single AWS call, including all of its attempts.
+    Times are in seconds, sizes in bytes.
+    """
+    __slots__ = ('service', 'action', 'region', 'started', 'finished',
+                 'sign_time', 'network_time', 'parse_time', 'request_bytes',
+                 'response_bytes', 'attempts', 'status_code', 'error')
+
+    def __init__(self, service, action, region):
+        self.service = service
+        self.action = action
+        self.region = region
+        self.started = time.time()
+        self.finished = None
+        self.sign_time = 0.0
+        self.network_time = 0.0
+        self.parse_time = 0.0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.attempts = 0
+        self.status_code = None
+        self.error = None
+
+    @property
+    def duration(self):
+        """Total time of the call, including backoff and rate limiting"""
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def retries(self):
+        """Number of repeated attempts"""
+        return max(0, self.attempts - 1)
+
+    @property
+    def tags(self):
+        """Tags identifying the call"""
+        return {'service': self.service, 'action': self.action,
+                'region': self.region}
+
+
+class Instrumentation(object):
+    """
+    Base class of instrumentation hooks, passed to AWS clients.
+    Both methods get CallMetrics of the call; request_end is called once
+    the call succeeded or failed for good, with all timings filled in.
+    Without instrumentation clients skip all of the bookkeeping.
+    """
+    def request_start(self, metrics):
+        """Called before the first attempt of a call"""
+
+    def request_end(self, metrics):
+        """Called when result or error of a call is known"""
+
+
+def notify(instrumentation, hook, metrics):
+    """Call a hook, errors of hooks never break AWS calls"""
+    try:
+        getattr(instrumentation, hook)(metrics)
+    except Exception:
+        logger.exception("Instrumentation hook %s failed", hook)
+
+
+class MetricsCollector(Instrumentation):
+    """
+    Aggregates counters and timings in memory, per service, action and
+    region, e.g. for a Prometheus exporter or a periodic log line.
+    """
+    fields = ('requests', 'errors', 'retries', 'request_bytes',
+              'response_bytes', 'duration', 'sign_time', 'network_time',
+              'parse_time')
+
+    def __init__(self):
+        self.metrics = {}
+
+    def request_end(self, metrics):
+        key = (metrics.service, metrics.action, metrics.region)
+        totals = self.metrics.get(key)
+        if totals is None:
+            totals = self.metrics[key] = dict.fromkeys(self.fields, 0)
+        totals['requests'] += 1
+        totals['errors'] += metrics.error is not None
+        totals['retries'] += metrics.retries
+        totals['request_bytes'] += metrics.request_bytes
+        totals['response_bytes'] += metrics.response_bytes
+        totals['duration'] += metrics.duration
+        totals['sign_time'] += metrics.sign_time
+        totals['network_time'] += metrics.network_time
+        totals['parse_time'] += metrics.parse_time
+
+    def snapshot(self):
+        """Copy of totals, keyed by (service, action, region)"""
+        return dict((key, dict(totals))
+                    for key, totals in self.metrics.items())
+
+
+class StatsdInstrumentation(Instrumentation):
+    """
+    Sends timings and counters of every call to statsd over UDP,
+    tagged with service, action and region in DogStatsD format.
+
+    :param host: statsd host.
+    :param port: statsd port.
+    :param prefix: prefix of metric names.
+    """
+    def __init__(self, host='127.0.0.1', port=8125, prefix='asyncaws'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+
+    def request_end(self, metrics):
+        tags = '|#service:{},action:{},region:{}'.format(
+            metrics.service, metrics.action, metrics.region)
+        lines = [
+            '{}.request.count:1|c'.format(self.prefix),
+            '{}.request.duration:{:.3f}|ms'.format(
+                self.prefix, metrics.duration * 1000),
+            '{}.request.sign:{:.3f}|ms'.format(
+                self.prefix, metrics.sign_time * 1000),
+            '{}.request.network:{:.3f}|ms'.format(
+                self.prefix, metrics.network_time * 1000),
+            '{}.request.parse:{:.3f}|ms'.format(
+                self.prefix, metrics.parse_time * 1000),
+            '{}.request.bytes_sent:{}|c'.format(
+                self.prefix, metrics.request_bytes),
+            '{}.request.bytes_received:{}|c'.format(
+                self.prefix, metrics.response_bytes),
+        ]
+        if metrics.retries:
+            lines.append('{}.request.retries:{}|c'.format(
+                self.prefix, metrics.retries))
+        if metrics.error is not None:
+            lines.append('{}.request.errors:1|c'.format(self.prefix))
+        packet = '\n'.join(line + tags for line in lines)
+        try:
+            self._socket.sendto(packet, self.address)
+        except socket.error:
+            # metrics are best effort
+            pass
@@ -0,0 +1,150 @@
+"""Received SQS messages"""
+
+
+class Message(object):
+    """
+    Message returned by receive calls. Body, receipt handle and message ID
+    are plain attributes; Attributes and MessageAttributes are kept as the
+    name/value pairs read from the response and turned into dicts on first
+    access, so handlers reading only the body never build them. Messages
+    also support the dict access of older versions, e.g. message['Body']
+    or message.get('Attributes'). Messages of a client with codec that
+    can not be decoded keep the encoded body and the error in decode_error.
+
+    :param message_id: MessageId.
+    :param receipt_handle: ReceiptHandle, needed to delete the message.
+    :param body: Body.
+    :param attributes: dict of attributes, e.g. ApproximateReceiveCount.
+    :param message_attributes: dict of message attribute name to dict
+        with DataType and StringValue (or BinaryValue).
+    :param md5_of_body: MD5OfBody.
+    :param md5_of_message_attributes: MD5OfMessageAttributes.
+    :param raw_attributes: list of (name, value) pairs, source of
+        attributes if they are not given.
+    :param raw_message_attributes: list of (name, [(field, text), ...])
+        pairs, source of message_attributes if they are not given.
+    """
+    __slots__ = ('message_id', 'receipt_handle', 'body', 'md5_of_body',
+                 'md5_of_message_attributes', 'queue_url', 'decode_error',
+                 '_sqs', '_raw_attributes', '_raw_message_attributes',
+                 '_attributes', '_message_attributes')
+
+    # dict keys of older versions
+    _keys = {
+        'MessageId': 'message_id',
+        'ReceiptHandle': 'receipt_handle',
+        'Body': 'body',
+        'MD5OfBody': 'md5_of_body',
+        'MD5OfMessageAttributes': 'md5_of_message_attributes',
+        'Attributes': 'attributes',
+        'MessageAttributes': 'message_attributes',
+        'QueueUrl': 'queue_url',
+    }
+
+    def __init__(self, message_id=None, receipt_handle=None, body=None,
+                 attributes=None, message_attributes=None, md5_of_body=None,
+                 md5_of_message_attributes=None, raw_attributes=None,
+                 raw_message_attributes=None):
+        self.message_id = message_id
+        self.receipt_handle = receipt_handle
+        self.body = body
+        self.md5_of_body = md5_of_body
+        self.md5_of_message_attributes = md5_of_message_attributes
+        self.queue_url = None
+        self.decode_error = None
+        self._sqs = None
+        self._raw_attributes = raw_attributes
+        self._raw_message_attributes = raw_message_attributes
+        self._attributes = attributes
+        self._message_attributes = message_attributes
+
+    @property
+    def attributes(self):
+        """Dict of attributes requested with the receive"""
+        if self._attributes is None:
+            self._attributes = dict(self._raw_attributes or ())
+            self._raw_attributes = None
+        return self._attributes
+
+    @attributes.setter
+    def attributes(self, value):
+        self._attributes = value
+
+    @property
+    def message_attributes(self):
+        """Dict of message attributes, values are dicts with DataType"""
+        if self._message_attributes is None:
+            self._message_attributes = dict(
+                (name, dict(fields))
+                for name, fields in self._raw_message_attributes or ())
+            self._raw_message_attributes = None
+        return self._message_attributes
+
+    @message_attributes.setter
+    def message_attributes(self, value):
+        self._message_attributes = value
+
+    def bind(self, sqs, queue_url):
+        """Attach the client and queue the message was received with"""
+        self._sqs = sqs
+        self.queue_url = queue_url
+
+    def delete(self):
+        """
+        Delete the message from its queue.
+
+        :return: Request ID, Future of it in async mode.
+        """
+        assert self._sqs is not None, "message is not bound to a client"
+        return self._sqs.delete_message(self.queue_url, self.receipt_handle)
+
+    def change_visibility(self, visibility_timeout):
+        """
+        Change visibility timeout of the message, counted from now.
+
+        :param visibility_timeout: new timeout (in seconds, 0-43200).
+        :return: Request ID, Future of it in async mode.
+        """
+        assert self._sqs is not None, "message is not bound to a client"
+        return self._sqs.change_message_visibility(
+            self.queue_url, self.receipt_handle, visibility_timeout)
+
+    def to_dict(self):
+        """Message as dict of older versions"""
+        result = {}
+        for key, name in self._keys.items():
+            value = getattr(self, name)
+            if value is not None:
+                result[key] = value
+        return result
+
+    def __getitem__(self, key):
+        try:
+            name = self._keys[key]
+        except KeyError:
+            raise KeyError(key)
+        return getattr(self, name)
+
+    def __setitem__(self, key, value):
+        try:
+            name = self._keys[key]
+        except KeyError:
+            raise KeyError(key)
+        setattr(self, name, value)
+
+    def __contains__(self, key):
+        return key in self._keys and self[key] is not None
+
+    def get(self, key, default=None):
+        """Dict-style access, default for unknown or missing keys"""
+        value = self[key] if key in self._keys else None
+        return default if value is None else value
+
+    def __reduce__(self):
+        # slotted objects need it to be pickled, e.g. by process executors
+        return (Message, (self.message_id, self.receipt_handle, self.body,
+                          self.attributes, self.message_attributes,
+                          self.md5_of_body, self.md5_of_message_attributes))
+
+    def __repr__(self):
+        return '<Message %s>' % self.message_id
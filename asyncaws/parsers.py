@@ -0,0 +1,141 @@
+"""
+Single-pass parsers of AWS XML responses.
+They extract only the needed fields with plain lxml.etree, which is much
+cheaper than building an lxml.objectify tree and walking it attribute by
+attribute. AWS._process passes the raw response body to instances of
+ResponseParser, plain functions still get the objectify root.
+"""
+from lxml import etree
+from asyncaws.message import Message
+
+# responses use a small fixed set of tags, so local names are memoized
+_local_names = {}
+
+
+def local_name(element):
+    """Tag of element without namespace"""
+    tag = element.tag
+    try:
+        return _local_names[tag]
+    except KeyError:
+        name = tag[tag.index('}') + 1:] if tag[0] == '{' else tag
+        _local_names[tag] = name
+        return name
+
+
+def children_to_dict(element):
+    """Map local names of element children to their text"""
+    return dict((local_name(child), child.text) for child in element)
+
+
+class ResponseParser(object):
+    """Base class of parsers, called with raw response body"""
+    def parse(self, raw):
+        """Convert raw XML response to the result of an action"""
+        raise NotImplementedError
+
+
+class TextParser(ResponseParser):
+    """Text of the first element with given local name, e.g. MessageId"""
+    def __init__(self, tag):
+        self.tag = tag
+        self._selector = '{*}' + tag
+
+    def parse(self, raw):
+        for element in etree.fromstring(raw).iter(self._selector):
+            return element.text
+        return None
+
+
+class TextListParser(TextParser):
+    """Texts of all elements with given local name, e.g. QueueUrl"""
+    def parse(self, raw):
+        return [element.text
+                for element in etree.fromstring(raw).iter(self._selector)]
+
+
+class AttributesParser(ResponseParser):
+    """Dict of all Attribute Name/Value pairs, e.g. GetQueueAttributes"""
+    def parse(self, raw):
+        result = {}
+        for element in etree.fromstring(raw).iter('{*}Attribute'):
+            # AWS schema defines Name followed by Value
+            result[element[0].text] = element[1].text
+        return result
+
+
+class MessagesParser(ResponseParser):
+    """
+    Messages of ReceiveMessage response as Message objects.
+    Building the tree with C parser and iterating it turned out faster
+    than iterparse for responses up to 10 messages of 256 KB.
+    Attributes are collected as name/value pairs, messages build dicts of
+    them when they are read; no message keeps a reference to the tree.
+
+    :param single: return the first message or None instead of a list.
+    """
+    # tags of Message fields
+    fields = {'MessageId': 'message_id', 'ReceiptHandle': 'receipt_handle',
+              'Body': 'body', 'MD5OfBody': 'md5_of_body',
+              'MD5OfMessageAttributes': 'md5_of_message_attributes'}
+
+    def __init__(self, single=False):
+        self.single = single
+
+    def parse(self, raw):
+        messages = []
+        fields = self.fields
+        for element in etree.fromstring(raw).iter('{*}Message'):
+            attributes = []
+            message_attributes = []
+            message = Message(raw_attributes=attributes,
+                              raw_message_attributes=message_attributes)
+            for child in element:
+                tag = local_name(child)
+                if tag == 'Attribute':
+                    # AWS schema defines Name followed by Value
+                    attributes.append((child[0].text, child[1].text))
+                elif tag == 'MessageAttribute':
+                    message_attributes.append((child[0].text, [
+                        (local_name(value), value.text)
+                        for value in child[1]]))
+                elif tag in fields:
+                    setattr(message, fields[tag], child.text)
+            messages.append(message)
+        if self.single:
+            return messages[0] if messages else None
+        return messages
+
+
+class BatchResultParser(ResponseParser):
+    """
+    Entries of batch action result split to Successful and Failed lists,
+    every entry is a dict, failed ones contain Id, Code, Message, SenderFault.
+    Handles both SQS layout (result entries and BatchResultErrorEntry) and
+    SNS layout (Successful and Failed lists of members).
+    """
+    def parse(self, raw):
+        result = {'Successful': [], 'Failed': [], 'RequestId': None}
+        for element in etree.fromstring(raw):
+            tag = local_name(element)
+            if tag == 'ResponseMetadata':
+                result['RequestId'] = children_to_dict(element)['RequestId']
+                continue
+            for entry in element:
+                entry_tag = local_name(entry)
+                if entry_tag in ('Successful', 'Failed'):
+                    result[entry_tag].extend(
+                        children_to_dict(member) for member in entry)
+                elif entry_tag == 'BatchResultErrorEntry':
+                    result['Failed'].append(children_to_dict(entry))
+                else:
+                    result['Successful'].append(children_to_dict(entry))
+        return result
+
+
+# shared stateless instances
+REQUEST_ID = TextParser('RequestId')
+ATTRIBUTES = AttributesParser()
+MESSAGES = MessagesParser()
+SINGLE_MESSAGE = MessagesParser(single=True)
+BATCH_RESULT = BatchResultParser()
@@ -1,20 +1,51 @@
 """Module that covers SNS API"""
-from asyncaws.core import AWS
+from tornado.gen import coroutine, Return
+from asyncaws.core import AWS, message_attribute_params, message_size
+from asyncaws.batching import BatchCollector
+from asyncaws import parsers
 import json
 
 
 class SNS(AWS):
     """
-    :param access_key: AWS_ACCESS_KEY_ID
+    :param access_key: AWS_ACCESS_KEY_ID, None to use credentials provider
     :param secret_key: AWS_SECRET_ACCESS_KEY
     :param region: region name as string
     :param async: True by default, indicates that AsyncHTTPClient should
         be used. Otherwise HTTPClient (synchronous). Useful for debugging.
+    :param retry_policy: RetryPolicy deciding how failed requests are
+        repeated, default allows 3 attempts with jittered backoff.
+    :param rate_limit: optional initial rate limit (requests per second),
+        adapted to throttling responses. The limiter is shared by all
+        clients of the same service, region and access key.
+    :param post_threshold: requests with params longer than this (in bytes)
+        are sent as POST with signed body instead of a query string.
+    :param transport: optional TransportConfig with connection pools,
+        HTTP backend and timeouts. By default the shared tornado
+        AsyncHTTPClient is used for all calls.
+    :param endpoint: optional URL of the service endpoint, e.g. of a local
+        stand-in server. Regional AWS endpoint by default.
+    :param instrumentation: optional Instrumentation, its hooks get
+        CallMetrics (timings, sizes, attempts) of every call.
+    :param executor: optional concurrent.futures executor (thread or process
+        pool), hashes large request bodies and parses large responses off
+        the IOLoop thread. Async mode only.
+    :param offload_threshold: min size (in bytes) of body or response
+        handled by executor, smaller ones are processed inline.
+    :param name_cache_ttl: time (in seconds) names resolved to topic ARNs
+        are cached.
+    :param credentials: optional CredentialProvider used if access_key
+        is None, by default environment, shared file, container and instance
+        metadata are tried. Temporary credentials are refreshed in the
+        background before they expire.
+    :param codec: optional MessageCodec, compresses published messages
+        and offloads large ones to its blob store. Async mode only.
     """
     common_params = {
         "Version": "2010-03-31",
     }
     service = 'sns'
+    post_actions = frozenset(['Publish', 'PublishBatch'])
 
     def create_topic(self, name):
         """
@@ -32,11 +63,21 @@ class SNS(AWS):
             "Action": "CreateTopic"
         }
         params.update(self.common_params)
-        url = "http://{service}.{region}.amazonaws.com/".format(
-            service=self.service, region=self.region)
-        parse_function = lambda root: root.CreateTopicResult.TopicArn.text
+        url = self.endpoint
+        parse_function = parsers.TextParser('TopicArn')
         return self._process(url, params, self.service, parse_function)
 
+    def resolve_topic_arn(self, name):
+        """
+        Cached create_topic: CreateTopic is idempotent, so it resolves
+        the name to ARN once per name_cache_ttl. Concurrent calls for the
+        same name share one request.
+
+        :param name: The name of the topic.
+        :return: TopicArn - The Amazon Resource Name of the topic.
+        """
+        return self.names.get(name, lambda: self.create_topic(name))
+
     def delete_topic(self, topic_arn):
         """
         Deletes a topic and all its subscriptions.
@@ -53,9 +94,9 @@ class SNS(AWS):
             "Action": "DeleteTopic"
         }
         params.update(self.common_params)
-        url = "http://{service}.{region}.amazonaws.com/".format(
-            service=self.service, region=self.region)
-        parse_function = lambda root: root.ResponseMetadata.RequestId.text
+        self.names.invalidate(topic_arn)
+        url = self.endpoint
+        parse_function = parsers.REQUEST_ID
         return self._process(url, params, self.service, parse_function)
 
     def subscribe(self, endpoint, topic_arn, protocol):
@@ -80,9 +121,8 @@ class SNS(AWS):
             "Action": "Subscribe"
         }
         params.update(self.common_params)
-        url = "http://{service}.{region}.amazonaws.com/".format(
-            service=self.service, region=self.region)
-        parse_function = lambda root: root.SubscribeResult.SubscriptionArn.text
+        url = self.endpoint
+        parse_function = parsers.TextParser('SubscriptionArn')
         return self._process(url, params, self.service, parse_function)
 
     def confirm_subscription(self, topic_arn, token, auth_unsubscribe=False):
@@ -106,13 +146,12 @@ class SNS(AWS):
             "AuthenticateOnUnsubscribe": str(auth_unsubscribe).lower()
         }
         params.update(self.common_params)
-        url = "http://{service}.{region}.amazonaws.com/".format(
-            service=self.service, region=self.region)
-        parse_func = lambda r: r.ConfirmSubscriptionResult.SubscriptionArn.text
-        return self._process(url, params, self.service, parse_func)
+        url = self.endpoint
+        parse_function = parsers.TextParser('SubscriptionArn')
+        return self._process(url, params, self.service, parse_function)
 
     def publish(self, message, subject, topic_arn, target_arn=None,
-                message_structure=None):
+                message_structure=None, message_attributes=None):
         """
         Sends a message to all of a topic's subscribed endpoints.
         When a messageId is returned, the message has been saved and SNS
@@ -133,7 +172,13 @@ class SNS(AWS):
         :param target_arn: Either TopicArn or EndpointArn, but not both.
         :param message_structure: Should be empty to send the same message to
             all protocols, or "json" to send a different messages.
+        :param message_attributes: Optional dict of message attributes,
+            values are strings or dicts with DataType and StringValue.
         :return: MessageId - Unique identifier assigned to the published message
+
+        Messages without structure are encoded by codec of the client, if
+        any. Subscribed queues decode them on receive with raw message
+        delivery, which passes the codec attribute on.
         """
         assert message_structure in (None, 'json')
         assert topic_arn or target_arn
@@ -152,8 +197,143 @@ class SNS(AWS):
             params["TopicArn"] = topic_arn
         else:
             params["TargetArn"] = target_arn
+        if self.codec is not None and message_structure is None:
+            return self._publish_encoded(params, message_attributes)
+        return self._publish(params, message_attributes)
+
+    @coroutine
+    def _publish_encoded(self, params, message_attributes):
+        """Encode message with codec and publish it"""
+        params['Message'], message_attributes = yield self.codec.encode(
+            params['Message'], message_attributes)
+        result = yield self._publish(params, message_attributes)
+        raise Return(result)
+
+    def _publish(self, params, message_attributes):
+        """Publish request of message as it is"""
+        if message_attributes:
+            params.update(message_attribute_params('MessageAttributes.entry',
+                                                   message_attributes))
+        params.update(self.common_params)
+        url = self.endpoint
+        parse_function = parsers.TextParser('MessageId')
+        return self._process(url, params, self.service, parse_function)
+
+    def publish_batch(self, topic_arn, entries):
+        """
+        Publishes up to ten messages to the specified topic.
+        The result of each message is reported individually.
+        AWS API: PublishBatch_
+
+        :param topic_arn: The topic to publish to.
+        :param entries: List of dicts with Id (unique within the batch),
+            Message and optional Subject, MessageStructure, MessageGroupId,
+            MessageDeduplicationId and MessageAttributes. Total size of all
+            messages is maximum 256 KB. Messages without structure are
+            encoded by codec of the client, if any.
+        :return: dict with Successful list (Id, MessageId), Failed list
+            (Id, Code, Message, SenderFault) and RequestId.
+        """
+        assert 1 <= len(entries) <= 10
+        if self.codec is not None:
+            return self._publish_batch_encoded(topic_arn, entries)
+        return self._publish_batch(topic_arn, entries)
+
+    @coroutine
+    def _publish_batch_encoded(self, topic_arn, entries):
+        """Encode messages of entries with codec and publish them"""
+        encoded = []
+        for entry in entries:
+            if entry.get('MessageStructure'):
+                encoded.append(entry)
+                continue
+            message, attributes = yield self.codec.encode(
+                entry['Message'], entry.get('MessageAttributes'))
+            encoded.append(dict(entry, Message=message,
+                                MessageAttributes=attributes))
+        result = yield self._publish_batch(topic_arn, encoded)
+        raise Return(result)
+
+    def _publish_batch(self, topic_arn, entries):
+        """PublishBatch request of entries as they are"""
+        params = {
+            "TopicArn": topic_arn,
+            "Action": "PublishBatch",
+        }
+        for i, entry in enumerate(entries):
+            prefix = 'PublishBatchRequestEntries.member.%s.' % (i+1)
+            for key, value in entry.items():
+                if key == 'MessageAttributes':
+                    if value:
+                        params.update(message_attribute_params(
+                            prefix + 'MessageAttributes.entry', value))
+                else:
+                    params[prefix + key] = value
         params.update(self.common_params)
-        url = "http://{service}.{region}.amazonaws.com/".format(
-            service=self.service, region=self.region)
-        parse_function = lambda root: root.PublishResult.MessageId.text
+        url = self.endpoint
+        parse_function = parsers.BATCH_RESULT
         return self._process(url, params, self.service, parse_function)
+
+
+class SNSBatcher(object):
+    """
+    Coalesces publish calls to the same topic made within a short window
+    into PublishBatch requests, up to 10 entries or 256 KB per request.
+    Every call still gets its own Future. Requires SNS client in async mode.
+
+    :param sns: SNS client instance.
+    :param window: max time (in seconds) a call waits to be batched.
+    """
+    def __init__(self, sns, window=0.05):
+        assert sns._async, "batching requires async mode"
+        self.sns = sns
+        self._publish = BatchCollector(
+            sns._publish_batch,
+            lambda item, batch: item['MessageId'], window=window)
+
+    def publish(self, message, subject, topic_arn, message_structure=None,
+                message_attributes=None):
+        """
+        Queue a message to be published with the next PublishBatch.
+        Messages without structure are encoded by codec of the client, if any.
+
+        :param message: The message to send to the topic, see SNS.publish.
+        :param subject: Optional "Subject" line of email endpoints.
+        :param topic_arn: The topic to publish to.
+        :param message_structure: Empty to send the same message to all
+            protocols, or "json" to send a different messages.
+        :param message_attributes: Optional dict of message attributes.
+        :return: Future with MessageId. Failed entry raises AWSError.
+        """
+        assert message_structure in (None, 'json')
+        entry = {'Message': message}
+        if message_structure == 'json':
+            if not isinstance(message, (str, unicode)):
+                entry['Message'] = json.dumps(message)
+            entry['MessageStructure'] = message_structure
+        if subject is not None:
+            entry['Subject'] = subject
+        if self.sns.codec is not None and message_structure is None:
+            return self._add_encoded(topic_arn, entry, message_attributes)
+        return self._add(topic_arn, entry, message_attributes)
+
+    @coroutine
+    def _add_encoded(self, topic_arn, entry, message_attributes):
+        """Encode message with codec and queue it"""
+        entry['Message'], message_attributes = yield self.sns.codec.encode(
+            entry['Message'], message_attributes)
+        result = yield self._add(topic_arn, entry, message_attributes)
+        raise Return(result)
+
+    def _add(self, topic_arn, entry, message_attributes):
+        """Queue entry, its size counts message, subject and attributes"""
+        if message_attributes:
+            entry['MessageAttributes'] = message_attributes
+        size = message_size(entry['Message'], message_attributes)
+        if 'Subject' in entry:
+            size += message_size(entry['Subject'])
+        return self._publish.add(topic_arn, entry, size)
+
+    def flush(self):
+        """Send all buffered calls immediately"""
+        self._publish.flush()
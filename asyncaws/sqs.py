@@ -1,22 +1,59 @@
 """Module that covers SQS API"""
 import json
 import hashlib
-from asyncaws.core import AWS
+import logging
+import uuid
+from tornado.concurrent import Future
+from tornado.gen import coroutine, Return
+from asyncaws.core import AWS, message_attribute_params, message_size
+from asyncaws.batching import BatchCollector
+from asyncaws.consumer import MessageStream
+from asyncaws import parsers
 
+logger = logging.getLogger(__name__)
 
 class SQS(AWS):
     """
-    :param access_key: AWS_ACCESS_KEY_ID
+    :param access_key: AWS_ACCESS_KEY_ID, None to use credentials provider
     :param secret_key: AWS_SECRET_ACCESS_KEY
     :param region: region name as string
     :param async: True by default, indicates that AsyncHTTPClient should
         be used. Otherwise HTTPClient (synchronous). Useful for debugging.
+    :param retry_policy: RetryPolicy deciding how failed requests are
+        repeated, default allows 3 attempts with jittered backoff.
+    :param rate_limit: optional initial rate limit (requests per second),
+        adapted to throttling responses. The limiter is shared by all
+        clients of the same service, region and access key.
+    :param post_threshold: requests with params longer than this (in bytes)
+        are sent as POST with signed body instead of a query string.
+    :param transport: optional TransportConfig with connection pools,
+        HTTP backend and timeouts. By default the shared tornado
+        AsyncHTTPClient is used for all calls.
+    :param endpoint: optional URL of the service endpoint, e.g. of a local
+        stand-in server. Regional AWS endpoint by default.
+    :param instrumentation: optional Instrumentation, its hooks get
+        CallMetrics (timings, sizes, attempts) of every call.
+    :param executor: optional concurrent.futures executor (thread or process
+        pool), hashes large request bodies and parses large responses off
+        the IOLoop thread. Async mode only.
+    :param offload_threshold: min size (in bytes) of body or response
+        handled by executor, smaller ones are processed inline.
+    :param name_cache_ttl: time (in seconds) names resolved to queue URLs
+        are cached.
+    :param credentials: optional CredentialProvider used if access_key
+        is None, by default environment, shared file, container and instance
+        metadata are tried. Temporary credentials are refreshed in the
+        background before they expire.
+    :param codec: optional MessageCodec, compresses message bodies and
+        offloads large ones to its blob store; received messages are
+        decoded transparently. Async mode only.
     """
     service = 'sqs'
     common_params = {"Version": "2012-11-05"}
+    post_actions = frozenset(['SendMessage', 'SendMessageBatch'])
 
     def listen_queue(self, queue_url, wait_time=15, max_messages=1,
-                     visibility_timeout=300):
+                     visibility_timeout=300, receive_request_attempt_id=None):
         """
         Retrieves one or more messages from the specified queue.
         Long poll support is enabled by using the WaitTimeSeconds parameter.
@@ -30,47 +67,200 @@ class SQS(AWS):
         :param visibility_timeout: The duration (in seconds) that the received
             messages are hidden from subsequent retrieve requests after being
             retrieved by a ReceiveMessage request.
-        :return: A message or a list of messages.
-        """
-        def parse_function(root):
-            if root.ReceiveMessageResult == '':
-                return None
-            message = root.ReceiveMessageResult.Message
-            result = {
-                'Body': message.Body.text,
-                'MD5OfBody': message.MD5OfBody.text,
-                'ReceiptHandle': message.ReceiptHandle.text,
-                'Attributes': {}
-            }
-            for attr in message.Attribute:
-                result['Attributes'][attr.Name.text] = attr.Value.text
-            return result
+        :param receive_request_attempt_id: FIFO queues only, token of the
+            receive attempt, see receive_messages.
+        :return: A message (or None) if max_messages is 1,
+            otherwise a list of messages, see receive_messages.
+        """
+        if max_messages > 1:
+            return self.receive_messages(queue_url, wait_time, max_messages,
+                                         visibility_timeout,
+                                         receive_request_attempt_id)
+
+        params = self._receive_params(queue_url, wait_time, max_messages,
+                                      visibility_timeout,
+                                      receive_request_attempt_id)
+        result = self._bound(self._process(
+            queue_url, params, self.service, parsers.SINGLE_MESSAGE),
+            queue_url)
+        if self.codec is not None:
+            return self._decoded(result)
+        return result
+
+    def receive_messages(self, queue_url, wait_time=15, max_messages=10,
+                         visibility_timeout=300,
+                         receive_request_attempt_id=None):
+        """
+        Retrieves a batch of up to 10 messages from the specified queue.
+        Same as listen_queue, but always returns a list, so every message
+        of the batch receive is handed to the caller.
+        AWS API: ReceiveMessage_
+
+        :param queue_url: The URL of the Amazon SQS queue to take action on.
+        :param wait_time: The duration (in seconds) for which the call will
+            wait for a message to arrive in the queue before returning.
+        :param max_messages: The maximum number of messages to return, 1-10.
+        :param visibility_timeout: The duration (in seconds) that the received
+            messages are hidden from subsequent retrieve requests.
+        :param receive_request_attempt_id: FIFO queues only, token of the
+            receive attempt: a repeated call with the same token returns the
+            same messages while they are hidden. Generated for every call
+            to a .fifo queue by default, so that retries of a lost response
+            do not lock the received message groups.
+        :return: List of Message objects, empty if none arrived. Messages
+            are bound to this client: message.delete() removes them from
+            the queue.
+        """
+        assert 1 <= max_messages <= 10
+        params = self._receive_params(queue_url, wait_time, max_messages,
+                                      visibility_timeout,
+                                      receive_request_attempt_id)
+        result = self._bound(self._process(
+            queue_url, params, self.service, parsers.MESSAGES), queue_url)
+        if self.codec is not None:
+            return self._decoded(result)
+        return result
+
+    def _bound(self, result, queue_url):
+        """Bind received message or list of messages to this client"""
+        def bind(messages):
+            if isinstance(messages, list):
+                for message in messages:
+                    message.bind(self, queue_url)
+            elif messages is not None:
+                messages.bind(self, queue_url)
+            return messages
+
+        if not self._async:
+            return bind(result)
+        bound = Future()
+
+        def done(future):
+            try:
+                bound.set_result(bind(future.result()))
+            except Exception as exc:
+                bound.set_exception(exc)
 
+        # chained directly, like results of _process
+        result.add_done_callback(done)
+        return bound
+
+    @coroutine
+    def _decoded(self, result):
+        """Decode bodies of received message or list of messages"""
+        messages = yield result
+        if isinstance(messages, list):
+            yield [self._decode(message) for message in messages]
+        elif messages is not None:
+            yield self._decode(messages)
+        raise Return(messages)
+
+    @coroutine
+    def _decode(self, message):
+        """
+        Decode one message. A message that can not be decoded (expired
+        blob, missing compression package) keeps its encoded body and
+        gets the error as decode_error, other messages of the batch
+        are not affected.
+        """
+        try:
+            yield self.codec.decode(message)
+        except Exception as exc:
+            logger.warning("Failed to decode message %s: %s",
+                           message.message_id, exc)
+            message.decode_error = exc
+
+    def iter_messages(self, queue_url, batches=False, prefetch=2,
+                      batch_size=10, wait_time=15, visibility_timeout=300):
+        """
+        Streams messages of the queue. Long polls run in the background,
+        ahead of the consumer, with at most `prefetch` batches buffered.
+        Requires async mode.
+
+        :param queue_url: The URL of the Amazon SQS queue to take action on.
+        :param batches: hand out whole received batches instead of
+            single messages.
+        :param prefetch: max number of received batches in the buffer.
+        :param batch_size: max number of messages per receive, 1-10.
+        :param wait_time: long poll duration (in seconds).
+        :param visibility_timeout: visibility timeout of received messages.
+        :return: MessageStream, its next() returns a Future with the next
+            message (or batch), None after the stream is closed.
+        """
+        return MessageStream(self, queue_url, batches, prefetch, batch_size,
+                             wait_time, visibility_timeout)
+
+    def _receive_params(self, queue_url, wait_time, max_messages,
+                        visibility_timeout, receive_request_attempt_id):
+        """Build ReceiveMessage request params"""
         params = {
             "Action": "ReceiveMessage",
             "WaitTimeSeconds": wait_time,
             "MaxNumberOfMessages": max_messages,
             "VisibilityTimeout": visibility_timeout,
             "AttributeName": "All",
+            "MessageAttributeName": "All",
         }
+        if receive_request_attempt_id is None and \
+                queue_url.endswith('.fifo'):
+            # retries of the call send the same params, thus the same token
+            receive_request_attempt_id = uuid.uuid4().hex
+        if receive_request_attempt_id is not None:
+            params["ReceiveRequestAttemptId"] = receive_request_attempt_id
         params.update(self.common_params)
-        return self._process(queue_url, params, self.service, parse_function)
+        return params
 
-    def send_message(self, queue_url, message_body):
+    def send_message(self, queue_url, message_body, message_attributes=None,
+                     message_group_id=None, deduplication_id=None):
         """
         Delivers a message to the specified queue.
+        Body is encoded by codec of the client, if any.
         AWS API: SendMessage_
 
         :param queue_url: The URL of the Amazon SQS queue to take action on.
         :param message_body: The message to send. String maximum 256 KB in size.
+        :param message_attributes: Optional dict of message attributes,
+            values are strings or dicts with DataType and StringValue.
+        :param message_group_id: FIFO queues only (required), messages of
+            the same group are delivered in order.
+        :param deduplication_id: FIFO queues only, messages with the same
+            token sent within 5 minutes are delivered once. Optional if the
+            queue has ContentBasedDeduplication.
         :return: MD5OfMessageAttributes, MD5OfMessageBody, MessageId
         """
+        if self.codec is not None:
+            return self._send_encoded(queue_url, message_body,
+                                      message_attributes, message_group_id,
+                                      deduplication_id)
+        return self._send_message(queue_url, message_body, message_attributes,
+                                  message_group_id, deduplication_id)
+
+    @coroutine
+    def _send_encoded(self, queue_url, message_body, message_attributes,
+                      message_group_id, deduplication_id):
+        """Encode message body with codec and send it"""
+        body, attributes = yield self.codec.encode(message_body,
+                                                   message_attributes)
+        result = yield self._send_message(queue_url, body, attributes,
+                                          message_group_id, deduplication_id)
+        raise Return(result)
+
+    def _send_message(self, queue_url, message_body, message_attributes,
+                      message_group_id=None, deduplication_id=None):
+        """SendMessage request of body as it is"""
         params = {
             "Action": "SendMessage",
             "MessageBody": message_body,
         }
+        if message_attributes:
+            params.update(message_attribute_params('MessageAttribute',
+                                                   message_attributes))
+        if message_group_id is not None:
+            params["MessageGroupId"] = message_group_id
+        if deduplication_id is not None:
+            params["MessageDeduplicationId"] = deduplication_id
         params.update(self.common_params)
-        parse_function = lambda root: root.SendMessageResult.MessageId.text
+        parse_function = parsers.TextParser('MessageId')
         return self._process(queue_url, params, self.service, parse_function)
 
     def delete_message(self, queue_url, receipt_handle):
@@ -88,7 +278,128 @@ class SQS(AWS):
             "ReceiptHandle": receipt_handle,
         }
         params.update(self.common_params)
-        parse_function = lambda res: res.ResponseMetadata.RequestId.text
+        parse_function = parsers.REQUEST_ID
+        return self._process(queue_url, params, self.service, parse_function)
+
+    def send_message_batch(self, queue_url, entries):
+        """
+        Delivers up to ten messages to the specified queue.
+        The result of each message is reported individually.
+        AWS API: SendMessageBatch_
+
+        :param queue_url: The URL of the Amazon SQS queue to take action on.
+        :param entries: List of dicts with Id (unique within the batch),
+            MessageBody and optional DelaySeconds and MessageAttributes.
+            Total size of all messages is maximum 256 KB. Bodies are encoded
+            by codec of the client, if any.
+            FIFO queues: MessageGroupId and MessageDeduplicationId, entries
+            of a group are delivered in list order.
+        :return: dict with Successful list (Id, MessageId, MD5OfMessageBody),
+            Failed list (Id, Code, Message, SenderFault) and RequestId.
+        """
+        assert 1 <= len(entries) <= 10
+        if self.codec is not None:
+            return self._send_batch_encoded(queue_url, entries)
+        return self._send_message_batch(queue_url, entries)
+
+    @coroutine
+    def _send_batch_encoded(self, queue_url, entries):
+        """Encode message bodies of entries with codec and send them"""
+        encoded = []
+        for entry in entries:
+            body, attributes = yield self.codec.encode(
+                entry['MessageBody'], entry.get('MessageAttributes'))
+            encoded.append(dict(entry, MessageBody=body,
+                                MessageAttributes=attributes))
+        result = yield self._send_message_batch(queue_url, encoded)
+        raise Return(result)
+
+    def _send_message_batch(self, queue_url, entries):
+        """SendMessageBatch request of entries as they are"""
+        params = {
+            "Action": "SendMessageBatch",
+        }
+        for i, entry in enumerate(entries):
+            prefix = 'SendMessageBatchRequestEntry.%s.' % (i+1)
+            for key, value in entry.items():
+                if key == 'MessageAttributes':
+                    if value:
+                        params.update(message_attribute_params(
+                            prefix + 'MessageAttribute', value))
+                else:
+                    params[prefix + key] = value
+        params.update(self.common_params)
+        parse_function = parsers.BATCH_RESULT
+        return self._process(queue_url, params, self.service, parse_function)
+
+    def delete_message_batch(self, queue_url, entries):
+        """
+        Deletes up to ten messages from the specified queue.
+        The result of each deletion is reported individually.
+        AWS API: DeleteMessageBatch_
+
+        :param queue_url: The URL of the Amazon SQS queue to take action on.
+        :param entries: List of dicts with Id (unique within the batch)
+            and ReceiptHandle.
+        :return: dict with Successful list (Id), Failed list
+            (Id, Code, Message, SenderFault) and RequestId.
+        """
+        assert 1 <= len(entries) <= 10
+        params = {
+            "Action": "DeleteMessageBatch",
+        }
+        for i, entry in enumerate(entries):
+            prefix = 'DeleteMessageBatchRequestEntry.%s.' % (i+1)
+            for key, value in entry.items():
+                params[prefix + key] = value
+        params.update(self.common_params)
+        parse_function = parsers.BATCH_RESULT
+        return self._process(queue_url, params, self.service, parse_function)
+
+    def change_message_visibility(self, queue_url, receipt_handle,
+                                  visibility_timeout):
+        """
+        Changes the visibility timeout of the specified message in a queue
+        to a new value, counted from the time of this call.
+        AWS API: ChangeMessageVisibility_
+
+        :param queue_url: The URL of the Amazon SQS queue to take action on.
+        :param receipt_handle: The receipt handle associated with the message.
+        :param visibility_timeout: The new value (in seconds, 0-43200) for
+            the message's visibility timeout.
+        :return: Request ID
+        """
+        params = {
+            "Action": "ChangeMessageVisibility",
+            "ReceiptHandle": receipt_handle,
+            "VisibilityTimeout": visibility_timeout,
+        }
+        params.update(self.common_params)
+        parse_function = parsers.REQUEST_ID
+        return self._process(queue_url, params, self.service, parse_function)
+
+    def change_message_visibility_batch(self, queue_url, entries):
+        """
+        Changes the visibility timeout of up to ten messages.
+        The result of each change is reported individually.
+        AWS API: ChangeMessageVisibilityBatch_
+
+        :param queue_url: The URL of the Amazon SQS queue to take action on.
+        :param entries: List of dicts with Id (unique within the batch),
+            ReceiptHandle and VisibilityTimeout.
+        :return: dict with Successful list (Id), Failed list
+            (Id, Code, Message, SenderFault) and RequestId.
+        """
+        assert 1 <= len(entries) <= 10
+        params = {
+            "Action": "ChangeMessageVisibilityBatch",
+        }
+        for i, entry in enumerate(entries):
+            prefix = 'ChangeMessageVisibilityBatchRequestEntry.%s.' % (i+1)
+            for key, value in entry.items():
+                params[prefix + key] = value
+        params.update(self.common_params)
+        parse_function = parsers.BATCH_RESULT
         return self._process(queue_url, params, self.service, parse_function)
 
     def create_queue(self, queue_name, attributes=None):
@@ -114,12 +425,61 @@ class SQS(AWS):
             params['Attribute.%s.Name' % (i+1)] = key
             params['Attribute.%s.Value' % (i+1)] = value
 
-        url = "http://{service}.{region}.amazonaws.com/".format(
-            service=self.service, region=self.region)
+        url = self.endpoint
+        params.update(self.common_params)
+        parse_function = parsers.TextParser('QueueUrl')
+        return self._process(url, params, self.service, parse_function)
+
+    def get_queue_url(self, queue_name, owner_account=None):
+        """
+        Returns the URL of an existing queue.
+        AWS API: GetQueueUrl_
+
+        :param queue_name: The name of the queue.
+        :param owner_account: Optional AWS account ID of the queue owner.
+        :return: QueueUrl - the URL of the queue.
+        """
+        params = {
+            "Action": "GetQueueUrl",
+            "QueueName": queue_name,
+        }
+        if owner_account is not None:
+            params["QueueOwnerAWSAccountId"] = owner_account
+        url = self.endpoint
         params.update(self.common_params)
-        parse_function = lambda res: res.CreateQueueResult.QueueUrl.text
+        parse_function = parsers.TextParser('QueueUrl')
         return self._process(url, params, self.service, parse_function)
 
+    def list_queues(self, prefix=None):
+        """
+        Returns a list of own queues, up to 1000.
+        AWS API: ListQueues_
+
+        :param prefix: Optional prefix, only queues with names that begin
+            with it are returned.
+        :return: List of queue URLs.
+        """
+        params = {
+            "Action": "ListQueues",
+        }
+        if prefix is not None:
+            params["QueueNamePrefix"] = prefix
+        url = self.endpoint
+        params.update(self.common_params)
+        parse_function = parsers.TextListParser('QueueUrl')
+        return self._process(url, params, self.service, parse_function)
+
+    def resolve_queue_url(self, queue_name):
+        """
+        Cached get_queue_url: the URL is requested once per name_cache_ttl,
+        concurrent calls for the same name share one request.
+
+        :param queue_name: The name of the queue.
+        :return: QueueUrl - the URL of the queue.
+        """
+        return self.names.get(queue_name,
+                              lambda: self.get_queue_url(queue_name))
+
     def delete_queue(self, queue_url):
         """
         Deletes the queue specified by the queue URL, regardless of whether
@@ -136,8 +496,9 @@ class SQS(AWS):
             "Action": "DeleteQueue",
         }
         params.update(self.common_params)
+        self.names.invalidate(queue_url)
 
-        parse_function = lambda root: root.ResponseMetadata.RequestId.text
+        parse_function = parsers.REQUEST_ID
         return self._process(queue_url, params, self.service, parse_function)
 
     def get_queue_attributes(self, queue_url, attributes=('all',)):
@@ -165,13 +526,8 @@ class SQS(AWS):
         for i, attr in enumerate(attributes):
             params['AttributeName.%s' % (i + 1)] = attr
         params.update(self.common_params)
-
-        def parse_function(root):
-            result = {}
-            for attr in root.GetQueueAttributesResult.Attribute:
-                result[attr.Name.text] = attr.Value.text
-            return result
-        return self._process(queue_url, params, self.service, parse_function)
+        return self._process(queue_url, params, self.service,
+                             parsers.ATTRIBUTES)
 
     def set_queue_attributes(self, queue_url, attributes=None):
         """
@@ -193,7 +549,7 @@ class SQS(AWS):
             params['Attribute.%s.Value' % (i+1)] = value
         params.update(self.common_params)
 
-        parse_function = lambda root: root.ResponseMetadata.RequestId.text
+        parse_function = parsers.REQUEST_ID
         return self._process(queue_url, params, self.service, parse_function)
 
     def add_permission(self, queue_url, account_ids, action_names, label):
@@ -223,7 +579,7 @@ class SQS(AWS):
             params['ActionName.%s' % (i + 1)] = name
         params.update(self.common_params)
 
-        parse_function = lambda root: root.ResponseMetadata.RequestId.text
+        parse_function = parsers.REQUEST_ID
         return self._process(queue_url, params, self.service, parse_function)
 
     # Helpers
@@ -249,3 +605,82 @@ class SQS(AWS):
                   'Statement': [statement]}
         return self.set_queue_attributes(queue_url,
                                          {"Policy": json.dumps(policy)})
+
+
+class SQSBatcher(object):
+    """
+    Coalesces send_message and delete_message calls made within a short
+    window into SendMessageBatch and DeleteMessageBatch requests, up to 10
+    entries or 256 KB per request. Every call still gets its own Future.
+    Requires SQS client in async mode.
+
+    :param sqs: SQS client instance.
+    :param window: max time (in seconds) a call waits to be batched.
+    """
+    def __init__(self, sqs, window=0.05):
+        assert sqs._async, "batching requires async mode"
+        self.sqs = sqs
+        self._send = BatchCollector(
+            sqs._send_message_batch,
+            lambda item, batch: item['MessageId'], window=window)
+        self._delete = BatchCollector(
+            sqs.delete_message_batch,
+            lambda item, batch: batch['RequestId'], window=window)
+
+    def send_message(self, queue_url, message_body, delay_seconds=None,
+                     message_attributes=None, message_group_id=None,
+                     deduplication_id=None):
+        """
+        Queue a message to be sent with the next SendMessageBatch.
+        Body is encoded by codec of the client, if any.
+
+        :param queue_url: The URL of the Amazon SQS queue to take action on.
+        :param message_body: The message to send.
+        :param delay_seconds: Optional delay of the message delivery.
+        :param message_attributes: Optional dict of message attributes.
+        :param message_group_id: FIFO queues only, see SQS.send_message.
+            Order within a group is kept inside one batch, batches sent
+            concurrently may be stored in any order.
+        :param deduplication_id: FIFO queues only, see SQS.send_message.
+        :return: Future with MessageId. Failed entry raises AWSError.
+        """
+        entry = {'MessageBody': message_body}
+        if delay_seconds is not None:
+            entry['DelaySeconds'] = delay_seconds
+        if message_group_id is not None:
+            entry['MessageGroupId'] = message_group_id
+        if deduplication_id is not None:
+            entry['MessageDeduplicationId'] = deduplication_id
+        if self.sqs.codec is not None:
+            return self._add_encoded(queue_url, entry, message_attributes)
+        if message_attributes:
+            entry['MessageAttributes'] = message_attributes
+        return self._send.add(queue_url, entry,
+                              message_size(message_body, message_attributes))
+
+    @coroutine
+    def _add_encoded(self, queue_url, entry, message_attributes):
+        """Encode message body with codec and queue it"""
+        body, attributes = yield self.sqs.codec.encode(entry['MessageBody'],
+                                                       message_attributes)
+        entry['MessageBody'] = body
+        if attributes:
+            entry['MessageAttributes'] = attributes
+        result = yield self._send.add(queue_url, entry,
+                                      message_size(body, attributes))
+        raise Return(result)
+
+    def delete_message(self, queue_url, receipt_handle):
+        """
+        Queue a message to be deleted with the next DeleteMessageBatch.
+
+        :param queue_url: The URL of the Amazon SQS queue to take action on.
+        :param receipt_handle: The receipt handle associated with the message.
+        :return: Future with Request ID. Failed entry raises AWSError.
+        """
+        return self._delete.add(queue_url, {'ReceiptHandle': receipt_handle})
+
+    def flush(self):
+        """Send all buffered calls immediately"""
+        self._send.flush()
+        self._delete.flush()
@@ -0,0 +1,676 @@
+"""
+In-process stand-in for SQS and SNS query APIs, built on Tornado.
+It keeps queues and topics in memory, verifies v4 signatures and can
+inject latency and errors, so clients can be tested and benchmarked
+without AWS:
+::
+
+    server = FakeAWSServer(credentials={'key-id': 'key-secret'})
+    endpoint = server.listen()
+    sqs = SQS('key-id', 'key-secret', 'us-east-1', endpoint=endpoint)
+"""
+import hashlib
+import hmac
+import json
+import random
+import time
+import uuid
+from lxml import etree
+from lxml.builder import ElementMaker
+from tornado.gen import coroutine, sleep, maybe_future, Return
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+from tornado.web import Application, RequestHandler
+from asyncaws.core import ALGORITHM, get_signature_key
+
+SQS_NS = 'http://queue.amazonaws.com/doc/2012-11-05/'
+SNS_NS = 'http://sns.amazonaws.com/doc/2010-03-31/'
+
+
+class FakeError(Exception):
+    """Error returned to the client as ErrorResponse"""
+    def __init__(self, code, message='', status=400):
+        super(FakeError, self).__init__(code, message)
+        self.code = code
+        self.message = message
+        self.status = status
+
+
+def md5(text):
+    """Hex MD5 of utf-8 encoded text"""
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+
+def indexed(params, prefix):
+    """
+    Collect numbered params, e.g. Attribute.1.Name, Attribute.1.Value,
+    into a list of dicts [{'Name': ..., 'Value': ...}] ordered by number.
+    """
+    entries = {}
+    for key, value in params.items():
+        if not key.startswith(prefix + '.'):
+            continue
+        number, _, field = key[len(prefix) + 1:].partition('.')
+        entries.setdefault(int(number), {})[field] = value
+    return [entries[number] for number in sorted(entries)]
+
+
+def message_attributes(params, prefix='MessageAttribute'):
+    """Parse MessageAttribute.N.Name/Value.DataType/... params"""
+    result = {}
+    for entry in indexed(params, prefix):
+        value = {'DataType': entry.get('Value.DataType')}
+        for kind in ('StringValue', 'BinaryValue'):
+            if 'Value.' + kind in entry:
+                value[kind] = entry['Value.' + kind]
+        result[entry['Name']] = value
+    return result
+
+
+class FakeMessage(object):
+    """Message stored in FakeQueue"""
+    def __init__(self, body, delay=0, attributes=None, system=None):
+        self.message_id = str(uuid.uuid4())
+        self.body = body
+        self.md5 = md5(body)
+        self.message_attributes = attributes or {}
+        self.system_attributes = system or {}
+        self.sent = time.time()
+        self.visible_at = self.sent + delay
+        self.receipt_handle = None
+        self.receive_count = 0
+        self.first_receive = None
+
+    def attributes(self):
+        """System attributes returned by ReceiveMessage"""
+        result = {
+            'SenderId': 'AIDAFAKESENDER',
+            'SentTimestamp': str(int(self.sent * 1000)),
+            'ApproximateReceiveCount': str(self.receive_count),
+            'ApproximateFirstReceiveTimestamp':
+                str(int(self.first_receive * 1000)),
+        }
+        result.update(self.system_attributes)
+        return result
+
+
+class FakeQueue(object):
+    """
+    Queue with visibility timeouts and receipt handles.
+    Queues named *.fifo keep message groups in order: a group is not
+    received while any of its messages is in flight.
+    """
+    # time (in seconds) of FIFO deduplication and receive attempt tokens
+    fifo_interval = 300
+
+    def __init__(self, name, url, arn, attributes=None):
+        self.name = name
+        self.url = url
+        self.arn = arn
+        self.fifo = name.endswith('.fifo')
+        self.created = int(time.time())
+        self.attributes = {
+            'VisibilityTimeout': '30',
+            'DelaySeconds': '0',
+            'MaximumMessageSize': '262144',
+            'MessageRetentionPeriod': '345600',
+            'ReceiveMessageWaitTimeSeconds': '0',
+        }
+        self.attributes.update(attributes or {})
+        self.messages = []
+        self._sequence = 0
+        # token -> (message, time sent) and (messages, time received)
+        self._deduplication = {}
+        self._attempts = {}
+
+    def send(self, body, delay=None, attributes=None, system=None,
+             group_id=None, deduplication_id=None):
+        """Store a new message, FIFO duplicates return the original one"""
+        if delay is None:
+            delay = int(self.attributes['DelaySeconds'])
+        if self.fifo:
+            duplicate, system = self._fifo_send(body, group_id,
+                                                deduplication_id, system)
+            if duplicate is not None:
+                return duplicate
+        message = FakeMessage(body, delay, attributes, system)
+        self.messages.append(message)
+        if self.fifo:
+            self._deduplication[system['MessageDeduplicationId']] = \
+                (message, message.sent)
+        return message
+
+    def _fifo_send(self, body, group_id, deduplication_id, system):
+        """Check FIFO params, return (duplicate, system attributes)"""
+        if group_id is None:
+            raise FakeError('MissingParameter',
+                            'The request must contain MessageGroupId')
+        if deduplication_id is None:
+            if self.attributes.get('ContentBasedDeduplication') != 'true':
+                raise FakeError('InvalidParameterValue',
+                                'The queue should either have '
+                                'ContentBasedDeduplication enabled or '
+                                'MessageDeduplicationId provided')
+            deduplication_id = hashlib.sha256(
+                body.encode('utf-8')).hexdigest()
+        original = self._deduplication.get(deduplication_id)
+        if original is not None and \
+                original[1] > time.time() - self.fifo_interval:
+            return original[0], None
+        self._sequence += 1
+        system = dict(system or {}, MessageGroupId=group_id,
+                      MessageDeduplicationId=deduplication_id,
+                      SequenceNumber='%020d' % self._sequence)
+        return None, system
+
+    def receive(self, max_messages, visibility_timeout=None,
+                attempt_id=None):
+        """Take up to max_messages visible messages and hide them"""
+        if visibility_timeout is None:
+            visibility_timeout = int(self.attributes['VisibilityTimeout'])
+        now = time.time()
+        if attempt_id is not None and attempt_id in self._attempts:
+            messages, received_at = self._attempts[attempt_id]
+            if received_at > now - self.fifo_interval and \
+                    all(message in self.messages and message.visible_at > now
+                        for message in messages):
+                return messages
+        received = []
+        # groups with messages in flight
+        locked = set()
+        for message in self.messages:
+            if len(received) >= max_messages:
+                break
+            group = message.system_attributes.get('MessageGroupId')
+            if message.visible_at > now:
+                if self.fifo:
+                    locked.add(group)
+                continue
+            if group in locked:
+                continue
+            message.visible_at = now + visibility_timeout
+            message.receipt_handle = str(uuid.uuid4())
+            message.receive_count += 1
+            message.first_receive = message.first_receive or now
+            received.append(message)
+        if attempt_id is not None and received:
+            self._attempts[attempt_id] = (received, now)
+        return received
+
+    def find(self, receipt_handle):
+        """Get in-flight message by its latest receipt handle"""
+        for message in self.messages:
+            if message.receipt_handle == receipt_handle:
+                return message
+        raise FakeError('ReceiptHandleIsInvalid',
+                        'The receipt handle is not valid')
+
+    def delete(self, receipt_handle):
+        """Delete message by its receipt handle"""
+        self.messages.remove(self.find(receipt_handle))
+
+    def change_visibility(self, receipt_handle, visibility_timeout):
+        """Hide message for visibility_timeout from now on"""
+        message = self.find(receipt_handle)
+        message.visible_at = time.time() + int(visibility_timeout)
+
+    def all_attributes(self):
+        """Queue attributes including computed ones"""
+        now = time.time()
+        visible = sum(1 for m in self.messages if m.visible_at <= now)
+        result = dict(self.attributes)
+        result.update({
+            'QueueArn': self.arn,
+            'CreatedTimestamp': str(self.created),
+            'ApproximateNumberOfMessages': str(visible),
+            'ApproximateNumberOfMessagesNotVisible':
+                str(len(self.messages) - visible),
+        })
+        return result
+
+
+class FakeAWSServer(object):
+    """
+    Stand-in for SQS and SNS endpoints, one server handles both.
+    Supported SQS actions: CreateQueue, GetQueueUrl, ListQueues,
+    DeleteQueue, GetQueueAttributes, SetQueueAttributes, AddPermission,
+    SendMessage(Batch), ReceiveMessage (with long polling),
+    DeleteMessage(Batch), ChangeMessageVisibility(Batch). Queues named
+    *.fifo keep message groups in order and deduplicate messages.
+    Supported SNS actions: CreateTopic, DeleteTopic, Subscribe,
+    ConfirmSubscription, Publish(Batch). Messages published to a topic are
+    delivered to subscribed queues (protocol sqs) as SNS notifications.
+
+    :param credentials: dict of access keys and secret keys, v4 signatures
+        are verified for them. None disables the verification.
+    :param region: region of queue URLs and ARNs.
+    :param account_id: account of queue URLs and ARNs.
+    :param latency: delay (in seconds) added to every response.
+    :param error_rate: probability (0-1) of replying with error_code.
+    :param error_code: error code for random errors, Throttling by default.
+    """
+    def __init__(self, credentials=None, region='us-east-1',
+                 account_id='123456789012', latency=0, error_rate=0,
+                 error_code='Throttling'):
+        self.credentials = credentials
+        self.region = region
+        self.account_id = account_id
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.url = None
+        self.queues = {}
+        self.topics = {}
+        self.requests = 0
+        self._planned_errors = []
+        self._server = None
+
+    def application(self):
+        """Tornado Application serving the fake API"""
+        return Application([(r'/.*', FakeAWSHandler, {'fake': self})])
+
+    def listen(self, port=0, address='127.0.0.1'):
+        """
+        Start serving on the current IOLoop.
+
+        :return: endpoint URL, to be passed to SQS/SNS clients.
+        """
+        sockets = bind_sockets(port, address)
+        self._server = HTTPServer(self.application())
+        self._server.add_sockets(sockets)
+        port = sockets[0].getsockname()[1]
+        self.url = 'http://{}:{}/'.format(address, port)
+        return self.url
+
+    def stop(self):
+        """Stop accepting connections"""
+        if self._server is not None:
+            self._server.stop()
+            self._server = None
+
+    def fail_next(self, code='Throttling', status=400, count=1, action=None):
+        """
+        Reply to the next `count` requests (of given action, or any)
+        with an error, e.g. fail_next('InternalError', 500).
+        """
+        for _ in range(count):
+            self._planned_errors.append((action, code, status))
+
+    def queue(self, name_or_url):
+        """Get FakeQueue by name or URL"""
+        name = name_or_url.rstrip('/').rpartition('/')[2]
+        try:
+            return self.queues[name]
+        except KeyError:
+            raise FakeError('AWS.SimpleQueueService.NonExistentQueue',
+                            'The specified queue does not exist')
+
+    def check_errors(self, action):
+        """Raise planned or random error for the action"""
+        for i, (planned_action, code, status) in \
+                enumerate(self._planned_errors):
+            if planned_action in (None, action):
+                del self._planned_errors[i]
+                raise FakeError(code, 'Injected error', status)
+        if self.error_rate and random.random() < self.error_rate:
+            raise FakeError(self.error_code, 'Injected error', 400)
+
+    def verify_signature(self, request):
+        """Check v4 signature of tornado HTTPServerRequest"""
+        if self.credentials is None:
+            return
+        try:
+            algorithm, rest = request.headers['Authorization'].split(' ', 1)
+            fields = dict(part.strip().split('=', 1)
+                          for part in rest.split(','))
+            access_key, scope = fields['Credential'].split('/', 1)
+            date_stamp, region, service, _ = scope.split('/')
+            signed_headers = fields['SignedHeaders']
+            signature = fields['Signature']
+        except (KeyError, ValueError):
+            raise FakeError('IncompleteSignature',
+                            'Authorization header is malformed', 403)
+        secret_key = self.credentials.get(access_key)
+        if algorithm != ALGORITHM or secret_key is None:
+            raise FakeError('InvalidClientTokenId',
+                            'The security token is not valid', 403)
+        canonical_headers = ''.join(
+            '{}:{}\n'.format(name, request.headers.get(name, '').strip())
+            for name in signed_headers.split(';'))
+        canonical_request = '\n'.join([
+            request.method, request.path,
+            '&'.join(sorted(request.query.split('&'))),
+            canonical_headers, signed_headers,
+            hashlib.sha256(request.body or '').hexdigest()])
+        string_to_sign = '\n'.join([
+            algorithm, request.headers.get('X-Amz-Date', ''), scope,
+            hashlib.sha256(canonical_request).hexdigest()])
+        sign_key = get_signature_key(secret_key, date_stamp, region, service)
+        expected = hmac.new(sign_key, string_to_sign.encode('utf-8'),
+                            hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(expected, str(signature)):
+            raise FakeError('SignatureDoesNotMatch',
+                            'The request signature does not match', 403)
+
+    # SQS
+    def create_queue(self, params):
+        name = params['QueueName']
+        if name not in self.queues:
+            attributes = dict((entry['Name'], entry['Value'])
+                              for entry in indexed(params, 'Attribute'))
+            self.queues[name] = FakeQueue(
+                name, '{}{}/{}'.format(self.url, self.account_id, name),
+                'arn:aws:sqs:{}:{}:{}'.format(self.region, self.account_id,
+                                              name),
+                attributes)
+        return {'QueueUrl': self.queues[name].url}
+
+    def get_queue_url(self, params):
+        return {'QueueUrl': self.queue(params['QueueName']).url}
+
+    def list_queues(self, params):
+        prefix = params.get('QueueNamePrefix', '')
+        return [('QueueUrl', queue.url)
+                for name, queue in sorted(self.queues.items())
+                if name.startswith(prefix)]
+
+    def delete_queue(self, params, queue):
+        del self.queues[queue.name]
+
+    def get_queue_attributes(self, params, queue):
+        names = set(value for key, value in params.items()
+                    if key.startswith('AttributeName'))
+        attributes = queue.all_attributes()
+        if not names & set(['All', 'all']):
+            attributes = dict((key, value)
+                              for key, value in attributes.items()
+                              if key in names)
+        return [('Attribute', [('Name', key), ('Value', value)])
+                for key, value in sorted(attributes.items())]
+
+    def set_queue_attributes(self, params, queue):
+        for entry in indexed(params, 'Attribute'):
+            queue.attributes[entry['Name']] = entry['Value']
+
+    def add_permission(self, params, queue):
+        pass
+
+    def send_message(self, params, queue):
+        delay = params.get('DelaySeconds')
+        message = queue.send(params['MessageBody'],
+                             None if delay is None else int(delay),
+                             message_attributes(params),
+                             group_id=params.get('MessageGroupId'),
+                             deduplication_id=params.get(
+                                 'MessageDeduplicationId'))
+        result = [('MD5OfMessageBody', message.md5),
+                  ('MessageId', message.message_id)]
+        if queue.fifo:
+            result.append(('SequenceNumber',
+                           message.system_attributes['SequenceNumber']))
+        return result
+
+    def send_message_batch(self, params, queue):
+        result = []
+        for entry in indexed(params, 'SendMessageBatchRequestEntry'):
+            delay = entry.get('DelaySeconds')
+            message = queue.send(
+                entry['MessageBody'], None if delay is None else int(delay),
+                message_attributes(entry),
+                group_id=entry.get('MessageGroupId'),
+                deduplication_id=entry.get('MessageDeduplicationId'))
+            result.append(('SendMessageBatchResultEntry', [
+                ('Id', entry['Id']), ('MessageId', message.message_id),
+                ('MD5OfMessageBody', message.md5)]))
+        return result
+
+    @coroutine
+    def receive_message(self, params, queue):
+        max_messages = int(params.get('MaxNumberOfMessages', 1))
+        visibility = params.get('VisibilityTimeout')
+        visibility = None if visibility is None else int(visibility)
+        wait_time = int(params.get('WaitTimeSeconds') or
+                        queue.attributes['ReceiveMessageWaitTimeSeconds'])
+        attempt_id = params.get('ReceiveRequestAttemptId')
+        deadline = time.time() + wait_time
+        messages = queue.receive(max_messages, visibility, attempt_id)
+        while not messages and time.time() < deadline:
+            yield sleep(min(0.05, max(0, deadline - time.time())))
+            messages = queue.receive(max_messages, visibility, attempt_id)
+        result = []
+        for message in messages:
+            items = [('MessageId', message.message_id),
+                     ('ReceiptHandle', message.receipt_handle),
+                     ('MD5OfBody', message.md5),
+                     ('Body', message.body)]
+            for name, value in sorted(message.attributes().items()):
+                items.append(('Attribute', [('Name', name),
+                                            ('Value', value)]))
+            for name, value in sorted(message.message_attributes.items()):
+                items.append(('MessageAttribute', [
+                    ('Name', name), ('Value', sorted(value.items()))]))
+            result.append(('Message', items))
+        raise Return(result)
+
+    def delete_message(self, params, queue):
+        queue.delete(params['ReceiptHandle'])
+
+    def delete_message_batch(self, params, queue):
+        return self._batch(
+            params, 'DeleteMessageBatchRequestEntry',
+            'DeleteMessageBatchResultEntry',
+            lambda entry: queue.delete(entry['ReceiptHandle']))
+
+    def change_message_visibility(self, params, queue):
+        queue.change_visibility(params['ReceiptHandle'],
+                                params['VisibilityTimeout'])
+
+    def change_message_visibility_batch(self, params, queue):
+        return self._batch(
+            params, 'ChangeMessageVisibilityBatchRequestEntry',
+            'ChangeMessageVisibilityBatchResultEntry',
+            lambda entry: queue.change_visibility(
+                entry['ReceiptHandle'], entry['VisibilityTimeout']))
+
+    @staticmethod
+    def _batch(params, request_prefix, result_tag, function):
+        """Apply function to every entry, report errors per entry"""
+        result = []
+        for entry in indexed(params, request_prefix):
+            try:
+                function(entry)
+            except FakeError as error:
+                result.append(('BatchResultErrorEntry', [
+                    ('Id', entry['Id']), ('Code', error.code),
+                    ('Message', error.message), ('SenderFault', 'true')]))
+            else:
+                result.append((result_tag, [('Id', entry['Id'])]))
+        return result
+
+    # SNS
+    def topic(self, arn):
+        """Get subscriptions of topic by ARN"""
+        try:
+            return self.topics[arn]
+        except KeyError:
+            raise FakeError('NotFound', 'Topic does not exist', 404)
+
+    def create_topic(self, params):
+        arn = 'arn:aws:sns:{}:{}:{}'.format(self.region, self.account_id,
+                                            params['Name'])
+        self.topics.setdefault(arn, {})
+        return {'TopicArn': arn}
+
+    def delete_topic(self, params):
+        self.topics.pop(params['TopicArn'], None)
+
+    def subscribe(self, params):
+        subscriptions = self.topic(params['TopicArn'])
+        arn = '{}:{}'.format(params['TopicArn'], uuid.uuid4())
+        subscriptions[arn] = (params['Protocol'], params['Endpoint'])
+        return {'SubscriptionArn': arn}
+
+    def confirm_subscription(self, params):
+        return {'SubscriptionArn': '{}:{}'.format(params['TopicArn'],
+                                                  params['Token'])}
+
+    def publish(self, params):
+        return {'MessageId': self._deliver(
+            params.get('TopicArn') or params['TargetArn'], params['Message'],
+            params.get('Subject'),
+            message_attributes(params, 'MessageAttributes.entry'))}
+
+    def publish_batch(self, params):
+        topic_arn = params['TopicArn']
+        self.topic(topic_arn)
+        successful, failed = [], []
+        for entry in indexed(params, 'PublishBatchRequestEntries.member'):
+            if not entry.get('Message'):
+                failed.append(('member', [
+                    ('Id', entry['Id']), ('Code', 'InvalidParameter'),
+                    ('Message', 'Empty message'), ('SenderFault', 'true')]))
+                continue
+            message_id = self._deliver(
+                topic_arn, entry['Message'], entry.get('Subject'),
+                message_attributes(entry, 'MessageAttributes.entry'))
+            successful.append(('member', [('Id', entry['Id']),
+                                          ('MessageId', message_id)]))
+        return [('Successful', successful), ('Failed', failed)]
+
+    def _deliver(self, topic_arn, message, subject, attributes):
+        """Fan out published message to subscribed queues"""
+        message_id = str(uuid.uuid4())
+        notification = json.dumps({
+            'Type': 'Notification',
+            'MessageId': message_id,
+            'TopicArn': topic_arn,
+            'Subject': subject,
+            'Message': message,
+            'Timestamp': time.strftime('%Y-%m-%dT%H:%M:%S.000Z',
+                                       time.gmtime()),
+            'MessageAttributes': dict(
+                (name, {'Type': value['DataType'],
+                        'Value': value.get('StringValue',
+                                           value.get('BinaryValue'))})
+                for name, value in attributes.items()),
+        })
+        for protocol, endpoint in self.topic(topic_arn).values():
+            if protocol != 'sqs':
+                continue
+            for queue in self.queues.values():
+                if queue.arn == endpoint:
+                    queue.send(notification)
+        return message_id
+
+    sqs_actions = {
+        'CreateQueue': (create_queue, False),
+        'GetQueueUrl': (get_queue_url, False),
+        'ListQueues': (list_queues, False),
+        'DeleteQueue': (delete_queue, True),
+        'GetQueueAttributes': (get_queue_attributes, True),
+        'SetQueueAttributes': (set_queue_attributes, True),
+        'AddPermission': (add_permission, True),
+        'SendMessage': (send_message, True),
+        'SendMessageBatch': (send_message_batch, True),
+        'ReceiveMessage': (receive_message, True),
+        'DeleteMessage': (delete_message, True),
+        'DeleteMessageBatch': (delete_message_batch, True),
+        'ChangeMessageVisibility': (change_message_visibility, True),
+        'ChangeMessageVisibilityBatch':
+            (change_message_visibility_batch, True),
+    }
+    sns_actions = {
+        'CreateTopic': create_topic,
+        'DeleteTopic': delete_topic,
+        'Subscribe': subscribe,
+        'ConfirmSubscription': confirm_subscription,
+        'Publish': publish,
+        'PublishBatch': publish_batch,
+    }
+
+    @coroutine
+    def dispatch(self, request, params):
+        """
+        Run the action of a request.
+
+        :return: (namespace, action, result) where result is None,
+            a dict or a list of (tag, value) pairs; lists are nested.
+        """
+        self.requests += 1
+        if self.url is None:
+            # served without listen, e.g. by AsyncHTTPTestCase
+            self.url = '{}://{}/'.format(request.protocol, request.host)
+        if self.latency:
+            yield sleep(self.latency)
+        self.verify_signature(request)
+        action = params.get('Action')
+        self.check_errors(action)
+        if action in self.sqs_actions:
+            function, needs_queue = self.sqs_actions[action]
+            args = (params, self.queue(request.path)) if needs_queue \
+                else (params,)
+            result = yield maybe_future(function(self, *args))
+            raise Return((SQS_NS, action, result))
+        if action in self.sns_actions:
+            result = self.sns_actions[action](self, params)
+            raise Return((SNS_NS, action, result))
+        raise FakeError('InvalidAction',
+                        'Action {} is not supported'.format(action))
+
+
+def build(element_maker, items):
+    """Convert (tag, value) pairs into elements"""
+    if isinstance(items, dict):
+        items = sorted(items.items())
+    elements = []
+    for tag, value in items:
+        if isinstance(value, (list, tuple, dict)):
+            elements.append(getattr(element_maker, tag)(
+                *build(element_maker, value)))
+        else:
+            elements.append(getattr(element_maker, tag)(value))
+    return elements
+
+
+class FakeAWSHandler(RequestHandler):
+    """Serves every request to FakeAWSServer"""
+    def initialize(self, fake):
+        self.fake = fake
+
+    @coroutine
+    def get(self, *args):
+        params = dict((key, values[-1].decode('utf-8'))
+                      for key, values in self.request.arguments.items())
+        try:
+            namespace, action, result = yield self.fake.dispatch(
+                self.request, params)
+        except FakeError as error:
+            self.write_error_response(error)
+            return
+        maker = ElementMaker(namespace=namespace, nsmap={None: namespace})
+        children = []
+        if result is not None:
+            children.append(getattr(maker, action + 'Result')(
+                *build(maker, result)))
+        children.append(maker.ResponseMetadata(
+            maker.RequestId(str(uuid.uuid4()))))
+        root = getattr(maker, action + 'Response')(*children)
+        self.set_header('Content-Type', 'text/xml')
+        self.write(etree.tostring(root, xml_declaration=True,
+                                  encoding='utf-8'))
+
+    post = get
+
+    def write_error_response(self, error):
+        """Reply with AWS ErrorResponse"""
+        maker = ElementMaker()
+        root = maker.ErrorResponse(
+            maker.Error(maker.Type('Sender' if error.status < 500
+                                   else 'Receiver'),
+                        maker.Code(error.code),
+                        maker.Message(error.message)),
+            maker.RequestId(str(uuid.uuid4())))
+        self.set_status(error.status)
+        self.set_header('Content-Type', 'text/xml')
+        self.write(etree.tostring(root, xml_declaration=True,
+                                  encoding='utf-8'))
@@ -0,0 +1,76 @@
+"""HTTP transport configuration of AWS clients"""
+from tornado.httpclient import HTTPClient
+
+
+class TransportConfig(object):
+    """
+    Describes HTTP clients used by AWS. Short calls and long polls
+    (ReceiveMessage with WaitTimeSeconds) get separate connection pools,
+    so that pending long polls never delay publishes and deletes.
+    The clients belong to the AWS client, release them with its close().
+
+    :param max_clients: max number of concurrent short calls.
+    :param long_poll_clients: max number of concurrent long polls.
+    :param backend: 'simple' for tornado simple_httpclient, or 'curl'
+        for curl_httpclient, which reuses connections (requires pycurl).
+    :param connect_timeout: timeout (in seconds) of initial connection.
+    :param request_timeout: timeout (in seconds) of a whole request,
+        for long polls it is added to the poll duration.
+    :param tcp_keepalive: enable TCP keep-alive probes (curl backend).
+    :param keepalive_idle: idle time (in seconds) before the first probe.
+    :param keepalive_interval: time (in seconds) between probes.
+    """
+    def __init__(self, max_clients=10, long_poll_clients=10,
+                 backend='simple', connect_timeout=5, request_timeout=20,
+                 tcp_keepalive=True, keepalive_idle=60, keepalive_interval=30):
+        assert backend in ('simple', 'curl')
+        self.max_clients = max_clients
+        self.long_poll_clients = long_poll_clients
+        self.backend = backend
+        self.connect_timeout = connect_timeout
+        self.request_timeout = request_timeout
+        self.tcp_keepalive = tcp_keepalive
+        self.keepalive_idle = keepalive_idle
+        self.keepalive_interval = keepalive_interval
+
+    def _client_class(self):
+        """AsyncHTTPClient implementation of the backend"""
+        if self.backend == 'curl':
+            from tornado.curl_httpclient import CurlAsyncHTTPClient
+            return CurlAsyncHTTPClient
+        from tornado.simple_httpclient import SimpleAsyncHTTPClient
+        return SimpleAsyncHTTPClient
+
+    def create_clients(self, async=True):
+        """
+        Make dedicated HTTP clients.
+
+        :return: (client for short calls, client for long polls),
+            the same synchronous HTTPClient twice if async is False.
+        """
+        client_class = self._client_class()
+        if not async:
+            client = HTTPClient(client_class)
+            return client, client
+        short_calls = client_class(force_instance=True,
+                                   max_clients=self.max_clients)
+        long_polls = client_class(force_instance=True,
+                                  max_clients=self.long_poll_clients)
+        return short_calls, long_polls
+
+    def request_kwargs(self, wait_time=0):
+        """HTTPRequest arguments for a call, wait_time is long poll duration"""
+        kwargs = {
+            'connect_timeout': self.connect_timeout,
+            'request_timeout': self.request_timeout + wait_time,
+        }
+        if self.backend == 'curl' and self.tcp_keepalive:
+            kwargs['prepare_curl_callback'] = self._prepare_curl
+        return kwargs
+
+    def _prepare_curl(self, curl):
+        """Enable TCP keep-alive on curl handle"""
+        import pycurl
+        curl.setopt(pycurl.TCP_KEEPALIVE, 1)
+        curl.setopt(pycurl.TCP_KEEPIDLE, self.keepalive_idle)
+        curl.setopt(pycurl.TCP_KEEPINTVL, self.keepalive_interval)
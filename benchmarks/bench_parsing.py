@@ -0,0 +1,68 @@
+"""
+Micro-benchmark of XML response parsing.
+Compares lxml.objectify trees walked attribute by attribute (the previous
+approach) with asyncaws.parsers on recorded responses in tests/fixtures.
+
+Usage: python benchmarks/bench_parsing.py [number_of_parses]
+"""
+import os
+import sys
+import timeit
+from lxml import objectify
+# run from a checkout: asyncaws is imported from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+from asyncaws import parsers
+
+FIXTURES = os.path.join(os.path.dirname(__file__), os.pardir,
+                        'tests', 'fixtures')
+
+
+def objectify_messages(root):
+    result = []
+    for message in getattr(root.ReceiveMessageResult, 'Message', []):
+        item = {'MessageId': message.MessageId.text,
+                'Body': message.Body.text,
+                'MD5OfBody': message.MD5OfBody.text,
+                'ReceiptHandle': message.ReceiptHandle.text,
+                'Attributes': {}, 'MessageAttributes': {}}
+        for attr in message.Attribute:
+            item['Attributes'][attr.Name.text] = attr.Value.text
+        for attr in getattr(message, 'MessageAttribute', []):
+            item['MessageAttributes'][attr.Name.text] = dict(
+                (value.tag.rpartition('}')[2], value.text)
+                for value in attr.Value.iterchildren())
+        result.append(item)
+    return result
+
+
+def objectify_attributes(root):
+    result = {}
+    for attr in root.GetQueueAttributesResult.Attribute:
+        result[attr.Name.text] = attr.Value.text
+    return result
+
+
+CASES = (
+    ('receive_message.xml', objectify_messages, parsers.MESSAGES),
+    ('get_queue_attributes.xml', objectify_attributes, parsers.ATTRIBUTES),
+    ('send_message.xml', lambda root: root.SendMessageResult.MessageId.text,
+     parsers.TextParser('MessageId')),
+)
+
+
+def main(number=5000):
+    for name, objectify_function, parser in CASES:
+        with open(os.path.join(FIXTURES, name), 'rb') as xml_file:
+            raw = xml_file.read()
+        old = min(timeit.repeat(
+            lambda: objectify_function(objectify.fromstring(raw)),
+            number=number, repeat=3))
+        new = min(timeit.repeat(lambda: parser.parse(raw),
+                                number=number, repeat=3))
+        print '%-26s objectify %8.0f/s  parser %8.0f/s  x%.1f' % (
+            name, number / old, number / new, old / new)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,43 @@
+"""
+Micro-benchmark for AWSRequest signing.
+Compares deriving the signing key on every request with the per-client
+SigningKeyCache used by AWS.
+
+Usage: python benchmarks/bench_signing.py [number_of_requests]
+"""
+import os
+import sys
+import timeit
+# run from a checkout: asyncaws is imported from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+from asyncaws.core import AWSRequest, SigningKeyCache
+
+URL = ("https://sqs.eu-west-1.amazonaws.com/123456789012/test-queue"
+       "?Action=SendMessage&MessageBody=Hello%20World&Version=2012-11-05")
+
+
+def sign_uncached():
+    AWSRequest(URL, service='sqs', region='eu-west-1',
+               access_key='key-id', secret_key='key-secret')
+
+
+def make_sign_cached():
+    signing_keys = SigningKeyCache('key-secret')
+
+    def sign_cached():
+        AWSRequest(URL, service='sqs', region='eu-west-1',
+                   access_key='key-id', secret_key='key-secret',
+                   signing_keys=signing_keys)
+    return sign_cached
+
+
+def main(number=20000):
+    for name, func in (('uncached', sign_uncached),
+                       ('cached', make_sign_cached())):
+        seconds = min(timeit.repeat(func, number=number, repeat=3))
+        print '%-10s %10.0f requests signed/s' % (name, number / seconds)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,184 @@
+"""
+Throughput and latency benchmarks of SQS and SNS clients.
+Runs against the in-process FakeAWSServer, never against real AWS, and
+measures requests per second with p50/p99 latency for every scenario
+and concurrency level. Results are printed and written as JSON.
+
+Usage:
+    python benchmarks/run.py --requests 2000 --concurrency 1,10,50 \
+        --output bench_results.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import lxml
+import tornado
+from tornado.gen import coroutine, Return
+from tornado.ioloop import IOLoop
+# run from a checkout: asyncaws is imported from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+from asyncaws import SQS, SNS, SNSBatcher, TransportConfig
+from asyncaws.testing import FakeAWSServer
+import bench_parsing
+import bench_signing
+
+CREDENTIALS = {'bench-key': 'bench-secret'}
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of sorted list"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def summary(name, concurrency, latencies, seconds):
+    """Result record of one scenario run"""
+    latencies = sorted(latencies)
+    return {
+        'scenario': name,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'seconds': round(seconds, 4),
+        'requests_per_second': round(len(latencies) / seconds, 1),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+@coroutine
+def run_concurrent(name, operation, total, concurrency):
+    """Call operation() total times, at most concurrency at once"""
+    latencies = []
+    remaining = [total]
+
+    @coroutine
+    def worker():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            started = time.time()
+            yield operation()
+            latencies.append(time.time() - started)
+
+    started = time.time()
+    yield [worker() for _ in range(concurrency)]
+    raise Return(summary(name, concurrency, latencies, time.time() - started))
+
+
+def run_inline(name, operation, total):
+    """Time CPU-only operation called total times in a row"""
+    latencies = []
+    started = time.time()
+    for _ in range(total):
+        call_started = time.time()
+        operation()
+        latencies.append(time.time() - call_started)
+    return summary(name, 1, latencies, time.time() - started)
+
+
+def cpu_scenarios(total):
+    """Signing and parsing costs, isolated from the network"""
+    results = [run_inline('sign_request', bench_signing.make_sign_cached(),
+                          total)]
+    for fixture, _, parser in bench_parsing.CASES:
+        with open(os.path.join(bench_parsing.FIXTURES, fixture),
+                  'rb') as xml_file:
+            raw = xml_file.read()
+        results.append(run_inline('parse_' + fixture.split('.')[0],
+                                  lambda: parser.parse(raw), total))
+    return results
+
+
+@coroutine
+def client_scenarios(endpoint, total, concurrency):
+    """SQS and SNS round trips through the fake endpoint"""
+    transport = TransportConfig(max_clients=concurrency,
+                                long_poll_clients=concurrency)
+    sqs = SQS('bench-key', 'bench-secret', 'us-east-1', endpoint=endpoint,
+              transport=transport)
+    sns = SNS('bench-key', 'bench-secret', 'us-east-1', endpoint=endpoint,
+              transport=transport)
+    results = []
+    queue_url = yield sqs.create_queue('bench-%s' % concurrency)
+    results.append((yield run_concurrent(
+        'sqs_send_message',
+        lambda: sqs.send_message(queue_url, 'benchmark message'),
+        total, concurrency)))
+
+    @coroutine
+    def round_trip():
+        yield sqs.send_message(queue_url, 'benchmark message')
+        message = yield sqs.listen_queue(queue_url, wait_time=1)
+        if message:
+            yield sqs.delete_message(queue_url, message['ReceiptHandle'])
+
+    results.append((yield run_concurrent(
+        'sqs_listen_queue_round_trip', round_trip, total, concurrency)))
+
+    topic_arn = yield sns.create_topic('bench-%s' % concurrency)
+    for n in range(3):
+        subscriber_url = yield sqs.create_queue(
+            'bench-%s-subscriber-%s' % (concurrency, n))
+        attributes = yield sqs.get_queue_attributes(subscriber_url,
+                                                    ['QueueArn'])
+        yield sns.subscribe(attributes['QueueArn'], topic_arn, 'sqs')
+    results.append((yield run_concurrent(
+        'sns_publish_fan_out_3',
+        lambda: sns.publish('benchmark message', 'subject', topic_arn),
+        total, concurrency)))
+    batcher = SNSBatcher(sns, window=0.005)
+    results.append((yield run_concurrent(
+        'sns_batched_publish_fan_out_3',
+        lambda: batcher.publish('benchmark message', 'subject', topic_arn),
+        total, concurrency)))
+    sqs.close()
+    sns.close()
+    raise Return(results)
+
+
+@coroutine
+def main(args):
+    fake = FakeAWSServer(credentials=CREDENTIALS, latency=args.latency)
+    endpoint = fake.listen()
+    results = cpu_scenarios(args.requests)
+    for concurrency in args.concurrency:
+        results.extend((yield client_scenarios(endpoint, args.requests,
+                                               concurrency)))
+    fake.stop()
+    for result in results:
+        print ('{scenario:30} c={concurrency:<4} {requests_per_second:>10} '
+               'req/s  p50 {p50_ms:>8} ms  p99 {p99_ms:>8} ms'
+               .format(**result))
+    report = {
+        'timestamp': int(time.time()),
+        'python': platform.python_version(),
+        'tornado': tornado.version,
+        'lxml': lxml.__version__,
+        'fake_latency': args.latency,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--requests', type=int, default=1000,
+                        help='requests per scenario and concurrency level')
+    parser.add_argument('--concurrency', default='1,10,50',
+                        type=lambda value: [int(v) for v in value.split(',')],
+                        help='comma-separated concurrency levels')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='latency (in seconds) added by fake server')
+    parser.add_argument('--output', help='path of JSON results file')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    IOLoop.current().run_sync(lambda: main(parse_args(sys.argv[1:])))
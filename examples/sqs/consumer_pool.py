@@ -0,0 +1,27 @@
+import os
+from tornado.ioloop import IOLoop
+from tornado.gen import coroutine, sleep
+from asyncaws import SQS, SQSBatcher, SQSConsumer
+
+ioloop = IOLoop.current()
+aws_key_id = os.environ['AWS_ACCESS_KEY_ID']
+aws_key_secret = os.environ['AWS_SECRET_ACCESS_KEY']
+
+sqs = SQS(aws_key_id, aws_key_secret, "eu-west-1")
+queue_url = "https://sqs.eu-west-1.amazonaws.com/637085312181/test-queue"
+
+
+@coroutine
+def on_message(message):
+    """Called for every message, it is deleted when the coroutine returns"""
+    yield sleep(1)
+    print "Message processed:", message['Body']
+
+
+# 4 concurrent long polls, at most 50 messages processed at once
+consumer = SQSConsumer(sqs, queue_url, on_message, pollers=4,
+                       max_in_flight=50, batcher=SQSBatcher(sqs))
+
+if __name__ == '__main__':
+    consumer.start()
+    ioloop.start()
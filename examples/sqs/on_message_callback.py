@@ -1,35 +1,45 @@
 import os
-from functools import partial
 from tornado.ioloop import IOLoop
 from tornado.gen import coroutine
-from asyncaws import SQS
+from asyncaws import SQS, SQSBatcher
 
 ioloop = IOLoop.current()
 aws_key_id = os.environ['AWS_ACCESS_KEY_ID']
 aws_key_secret = os.environ['AWS_SECRET_ACCESS_KEY']
 
 sqs = SQS(aws_key_id, aws_key_secret, "eu-west-1")
+# deletes made within 50ms are sent together with DeleteMessageBatch
+batcher = SQSBatcher(sqs)
 queue_url = "https://sqs.eu-west-1.amazonaws.com/637085312181/test-queue"
 
+
 @coroutine
 def listen_queue():
     """Wait for SQS messages using async long polling"""
-    # tornado will "pause" the coroutine here until SQS returns something
-    message = yield sqs.listen_queue(queue_url)
-    if message:
-        # schedule the callback
-        ioloop.add_callback(partial(on_message, message))
-    # reconnect to SQS and repeat everything
-    ioloop.add_callback(listen_queue)
+    # the next long poll is already running while a message is handled
+    stream = sqs.iter_messages(queue_url, prefetch=2)
+    while True:
+        # tornado will "pause" the coroutine here until a message arrives
+        message = yield stream.next()
+        if message is None:
+            break
+        on_message(message)
+        # the delete is not awaited, so deletes of the following messages
+        # join the same batch instead of waiting out a window each
+        deleted = batcher.delete_message(queue_url, message['ReceiptHandle'])
+        ioloop.add_future(deleted, on_deleted)
 
 
-@coroutine
 def on_message(message):
     """This function will be called when new message arrives"""
     print "New message received:", message['Body']
-    yield sqs.delete_message(queue_url, message['ReceiptHandle'])
+
+
+def on_deleted(future):
+    """Report messages that could not be deleted, SQS redelivers them"""
+    if future.exception() is not None:
+        print "Failed to delete message:", future.exception()
 
 
 if __name__ == '__main__':
-    ioloop.add_callback(listen_queue)
-    ioloop.start()
\ No newline at end of file
+    ioloop.run_sync(listen_queue)
@@ -0,0 +1,95 @@
+from unittest import TestCase
+from mock import patch
+from tornado.concurrent import Future
+from tornado.testing import AsyncHTTPTestCase, gen_test
+from asyncaws import SQS, SNS, AWSError
+from asyncaws.cache import NameCache
+from asyncaws.testing import FakeAWSServer
+
+
+class TestNameCache(TestCase):
+    def test_sync_values_expire(self):
+        cache = NameCache(ttl=10, async=False)
+        lookups = []
+
+        def lookup():
+            lookups.append(1)
+            return 'url'
+        with patch('asyncaws.cache.time') as clock:
+            clock.time.return_value = 100
+            self.assertEqual(cache.get('queue', lookup), 'url')
+            clock.time.return_value = 109
+            self.assertEqual(cache.get('queue', lookup), 'url')
+            self.assertEqual(len(lookups), 1)
+            clock.time.return_value = 111
+            self.assertEqual(cache.get('queue', lookup), 'url')
+            self.assertEqual(len(lookups), 2)
+
+    def test_single_flight_and_failures(self):
+        cache = NameCache()
+        futures = []
+
+        def lookup():
+            futures.append(Future())
+            return futures[-1]
+        first = cache.get('queue', lookup)
+        self.assertIs(cache.get('queue', lookup), first)
+        first.set_exception(ValueError())
+        # failed lookup is not cached
+        second = cache.get('queue', lookup)
+        self.assertEqual(len(futures), 2)
+        second.set_result('url')
+        self.assertEqual(cache.get('queue', lookup).result(), 'url')
+        self.assertEqual(len(futures), 2)
+
+    def test_invalidate_during_lookup(self):
+        cache = NameCache()
+        futures = []
+
+        def lookup():
+            futures.append(Future())
+            return futures[-1]
+        cache.get('queue', lookup)
+        cache.invalidate('url')
+        futures[0].set_result('url')
+        # stale result of the lookup in flight is not cached
+        cache.get('queue', lookup)
+        self.assertEqual(len(futures), 2)
+
+
+class TestResolution(AsyncHTTPTestCase):
+    def get_app(self):
+        self.fake = FakeAWSServer(credentials={'key': 'secret'})
+        return self.fake.application()
+
+    def setUp(self):
+        super(TestResolution, self).setUp()
+        self.sqs = SQS('key', 'secret', 'us-east-1',
+                       endpoint=self.get_url('/'))
+        self.sns = SNS('key', 'secret', 'us-east-1',
+                       endpoint=self.get_url('/'))
+
+    @gen_test
+    def test_resolved_queue_url_is_cached(self):
+        queue_url = yield self.sqs.create_queue('queue')
+        requests = self.fake.requests
+        resolved = yield [self.sqs.resolve_queue_url('queue')
+                          for _ in range(5)]
+        self.assertEqual(resolved, [queue_url] * 5)
+        resolved = yield self.sqs.resolve_queue_url('queue')
+        self.assertEqual(resolved, queue_url)
+        self.assertEqual(self.fake.requests - requests, 1)
+        yield self.sqs.delete_queue(queue_url)
+        with self.assertRaises(AWSError):
+            yield self.sqs.resolve_queue_url('queue')
+
+    @gen_test
+    def test_resolved_topic_arn_is_cached(self):
+        topic_arn = yield self.sns.resolve_topic_arn('topic')
+        requests = self.fake.requests
+        again = yield self.sns.resolve_topic_arn('topic')
+        self.assertEqual(again, topic_arn)
+        self.assertEqual(self.fake.requests, requests)
+        yield self.sns.delete_topic(topic_arn)
+        yield self.sns.resolve_topic_arn('topic')
+        self.assertEqual(self.fake.requests - requests, 2)
@@ -0,0 +1,136 @@
+import base64
+import os
+import shutil
+import tempfile
+import unittest
+from tornado.testing import AsyncTestCase, AsyncHTTPTestCase, gen_test
+from asyncaws import SQS, SQSBatcher, MessageCodec, FilesystemBlobStore
+from asyncaws.codec import CODEC_ATTRIBUTE
+from asyncaws.core import message_size
+from asyncaws.testing import FakeAWSServer
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BODY = u'{"event": "order-created", "note": "Gr\\u00fc\\u00dfe"}' * 200
+
+
+class TestMessageCodec(AsyncTestCase):
+    def setUp(self):
+        super(TestMessageCodec, self).setUp()
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+        super(TestMessageCodec, self).tearDown()
+
+    @gen_test
+    def test_small_body_passes_through(self):
+        body, attributes = yield MessageCodec().encode('small', {'a': 'b'})
+        self.assertEqual((body, attributes), ('small', {'a': 'b'}))
+        message = yield MessageCodec().decode({'Body': 'small',
+                                               'MessageAttributes': {}})
+        self.assertEqual(message['Body'], 'small')
+
+    @gen_test
+    def test_compression_round_trip(self):
+        codec = MessageCodec()
+        body, attributes = yield codec.encode(BODY)
+        self.assertTrue(len(body) < len(BODY) / 10)
+        self.assertEqual(attributes[CODEC_ATTRIBUTE]['StringValue'],
+                         'zlib/base64')
+        message = yield codec.decode({'Body': body,
+                                      'MessageAttributes': attributes})
+        self.assertEqual(message['Body'], BODY)
+
+    @unittest.skipIf(zstandard is None, "zstandard is not installed")
+    @gen_test
+    def test_zstd(self):
+        codec = MessageCodec('zstd')
+        body, attributes = yield codec.encode(BODY)
+        self.assertEqual(attributes[CODEC_ATTRIBUTE]['StringValue'],
+                         'zstd/base64')
+        message = yield codec.decode({'Body': body,
+                                      'MessageAttributes': attributes})
+        self.assertEqual(message['Body'], BODY)
+
+    @gen_test
+    def test_offload_to_blob_store(self):
+        codec = MessageCodec(blob_store=FilesystemBlobStore(self.path),
+                             offload_threshold=100)
+        body, attributes = yield codec.encode(BODY)
+        self.assertEqual(attributes[CODEC_ATTRIBUTE]['StringValue'],
+                         'zlib/blob')
+        message = yield codec.decode({'Body': body,
+                                      'MessageAttributes': attributes})
+        self.assertEqual(message['Body'], BODY)
+
+    @gen_test
+    def test_size_limit_counts_encoding_and_attributes(self):
+        # about 191 KiB of text that zlib shrinks less than base64 grows it
+        body = base64.b64encode(os.urandom(191 * 768))
+        codec = MessageCodec(blob_store=FilesystemBlobStore(self.path))
+        encoded, attributes = yield codec.encode(body)
+        self.assertEqual((encoded, attributes), (body, None))
+        self.assertTrue(message_size(encoded) <= codec.offload_threshold)
+        # attributes push the message over the threshold
+        extra = {'padding': 'x' * 2048}
+        encoded, attributes = yield codec.encode(body, extra)
+        self.assertTrue(attributes[CODEC_ATTRIBUTE]['StringValue']
+                        .endswith('blob'))
+        message = yield codec.decode({'Body': encoded,
+                                      'MessageAttributes': attributes})
+        self.assertEqual(message['Body'], body)
+
+
+class TestCodecClient(AsyncHTTPTestCase):
+    def get_app(self):
+        self.fake = FakeAWSServer()
+        return self.fake.application()
+
+    def setUp(self):
+        super(TestCodecClient, self).setUp()
+        self.path = tempfile.mkdtemp()
+        codec = MessageCodec(blob_store=FilesystemBlobStore(self.path),
+                             offload_threshold=64 * 1024)
+        self.sqs = SQS('key', 'secret', 'us-east-1',
+                       endpoint=self.get_url('/'), codec=codec)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+        super(TestCodecClient, self).tearDown()
+
+    @gen_test
+    def test_send_and_receive(self):
+        queue_url = yield self.sqs.create_queue('queue')
+        # random text does not compress below 256 KB, it is offloaded
+        large = open('/dev/urandom', 'rb').read(300 * 1024).encode('hex')
+        yield self.sqs.send_message(queue_url, BODY, {'kind': 'order'})
+        yield self.sqs.send_message(queue_url, large)
+        yield SQSBatcher(self.sqs, window=0.01).send_message(queue_url,
+                                                             'plain')
+        messages = yield self.sqs.receive_messages(queue_url, wait_time=0)
+        self.assertEqual([message['Body'] for message in messages],
+                         [BODY, large, 'plain'])
+        self.assertEqual(
+            messages[0]['MessageAttributes']['kind']['StringValue'], 'order')
+        stored = self.fake.queue('queue').messages
+        self.assertTrue(all(len(message.body) < 64 * 1024
+                            for message in stored))
+
+    @gen_test
+    def test_undecodable_message_fails_alone(self):
+        queue_url = yield self.sqs.create_queue('queue')
+        large = open('/dev/urandom', 'rb').read(100 * 1024).encode('hex')
+        yield self.sqs.send_message(queue_url, large)
+        yield self.sqs.send_message(queue_url, BODY)
+        for name in os.listdir(self.path):
+            os.remove(os.path.join(self.path, name))
+        expired, healthy = yield self.sqs.receive_messages(queue_url,
+                                                           wait_time=0)
+        self.assertIsInstance(expired.decode_error, IOError)
+        self.assertEqual(len(expired['Body']), 32)
+        self.assertIsNone(healthy.decode_error)
+        self.assertEqual(healthy['Body'], BODY)
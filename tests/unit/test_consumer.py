@@ -0,0 +1,272 @@
+from tornado.concurrent import Future
+from tornado.gen import coroutine, sleep
+from tornado.testing import AsyncTestCase, gen_test
+from asyncaws import (SQSConsumer, MultiQueueConsumer, VisibilityHeartbeat,
+                      MessageStream, MessageGroupDispatcher, Message)
+
+
+def resolved(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+class FakeSQS(object):
+    """Serves messages from a list, records deleted receipt handles"""
+    _async = True
+
+    def __init__(self, count):
+        self.messages = [{'MessageId': str(n), 'ReceiptHandle': 'h%s' % n,
+                          'Body': 'body-%s' % n} for n in range(count)]
+        self.deleted = []
+        self.extended = []
+        self.received_batches = []
+
+    def receive_messages(self, queue_url, wait_time, max_messages,
+                         visibility_timeout):
+        batch = self.messages[:max_messages]
+        del self.messages[:max_messages]
+        self.received_batches.append(len(batch))
+        if not batch:
+            # emulate long poll of an empty queue
+            future = Future()
+            sleep(0.01).add_done_callback(lambda _: future.set_result([]))
+            return future
+        return resolved(batch)
+
+    def delete_message(self, queue_url, receipt_handle):
+        self.deleted.append(receipt_handle)
+        return resolved('request-id')
+
+    def change_message_visibility_batch(self, queue_url, entries):
+        self.extended.extend(e['ReceiptHandle'] for e in entries)
+        return resolved({
+            'Successful': [{'Id': e['Id']} for e in entries
+                           if e['ReceiptHandle'] != 'expired'],
+            'Failed': [{'Id': e['Id'], 'Message': 'Expired'} for e in entries
+                       if e['ReceiptHandle'] == 'expired']})
+
+
+class TestMessageStream(AsyncTestCase):
+    @gen_test
+    def test_prefetch_is_bounded(self):
+        sqs = FakeSQS(100)
+        stream = MessageStream(sqs, 'queue', prefetch=2, batch_size=5)
+        yield sleep(0.01)
+        # two batches buffered, third receive waits for free space
+        self.assertEqual(sqs.received_batches, [5, 5, 5])
+        first = yield stream.next()
+        self.assertEqual(first['MessageId'], '0')
+        for _ in range(4):
+            yield stream.next()
+        yield sleep(0.01)
+        self.assertEqual(sqs.received_batches, [5, 5, 5, 5])
+        stream.close()
+        bodies = []
+        while True:
+            message = yield stream.next()
+            if message is None:
+                break
+            bodies.append(message['Body'])
+        # messages received before close are still handed out
+        self.assertEqual(bodies, ['body-%s' % n for n in range(5, 20)])
+        self.assertIsNone((yield stream.next()))
+
+    @gen_test
+    def test_batches(self):
+        sqs = FakeSQS(7)
+        stream = MessageStream(sqs, 'queue', batches=True, batch_size=4)
+        first = yield stream.next()
+        second = yield stream.next()
+        self.assertEqual([len(first), len(second)], [4, 3])
+        stream.close()
+        self.assertIsNone((yield stream.next()))
+
+
+class TestSQSConsumer(AsyncTestCase):
+    @gen_test
+    def test_bounded_in_flight(self):
+        sqs = FakeSQS(25)
+        active = []
+        peak = [0]
+
+        def handler(message):
+            active.append(message)
+            peak[0] = max(peak[0], len(active))
+            done = sleep(0.01)
+            done.add_done_callback(lambda _: active.remove(message))
+            return done
+
+        consumer = SQSConsumer(sqs, 'queue', handler, pollers=3,
+                               max_in_flight=5)
+        consumer.start()
+        while len(sqs.deleted) < 25:
+            yield sleep(0.01)
+        yield consumer.stop()
+        self.assertEqual(peak[0], 5)
+        self.assertTrue(max(sqs.received_batches) <= 5)
+        self.assertEqual(sorted(sqs.deleted),
+                         sorted('h%s' % n for n in range(25)))
+        self.assertEqual(consumer.in_flight, 0)
+
+    @gen_test
+    def test_failed_message_is_not_deleted(self):
+        sqs = FakeSQS(2)
+
+        def handler(message):
+            if message['MessageId'] == '0':
+                raise ValueError('boom')
+
+        consumer = SQSConsumer(sqs, 'queue', handler, pollers=1)
+        consumer.start()
+        yield sleep(0.02)
+        yield consumer.stop()
+        self.assertEqual(sqs.deleted, ['h1'])
+
+    @gen_test
+    def test_undecodable_message_is_not_handled(self):
+        sqs = FakeSQS(0)
+        sqs.messages = [Message('0', 'h0', 'blob-key'),
+                        Message('1', 'h1', 'body-1')]
+        sqs.messages[0].decode_error = IOError('blob expired')
+        handled = []
+        consumer = SQSConsumer(sqs, 'queue',
+                               lambda m: handled.append(m['Body']),
+                               pollers=1)
+        consumer.start()
+        yield sleep(0.02)
+        yield consumer.stop()
+        self.assertEqual(handled, ['body-1'])
+        self.assertEqual(sqs.deleted, ['h1'])
+
+
+class FakeQueues(object):
+    """FakeSQS per queue URL"""
+    _async = True
+
+    def __init__(self, **counts):
+        self.queues = dict((url, FakeSQS(count))
+                           for url, count in counts.items())
+        self.received = []
+
+    def receive_messages(self, queue_url, *args):
+        self.received.append(queue_url)
+        return self.queues[queue_url].receive_messages(queue_url, *args)
+
+    def delete_message(self, queue_url, receipt_handle):
+        return self.queues[queue_url].delete_message(queue_url,
+                                                     receipt_handle)
+
+
+class TestMultiQueueConsumer(AsyncTestCase):
+    @gen_test
+    def test_capacity_goes_by_weight(self):
+        sqs = FakeQueues(high=30, low=30)
+        handled = []
+        handler = lambda message: handled.append(message['QueueUrl'])
+        consumer = MultiQueueConsumer(sqs, {'high': 3, 'low': 1}, handler,
+                                      pollers=1, max_in_flight=5,
+                                      batch_size=5)
+        consumer.start()
+        while len(handled) < 60:
+            yield sleep(0.005)
+        yield consumer.stop()
+        self.assertEqual(handled[:20].count('high'), 15)
+        self.assertEqual(len(sqs.queues['low'].deleted), 30)
+
+    @gen_test
+    def test_empty_queue_backs_off(self):
+        sqs = FakeQueues(empty=0, busy=40)
+        consumer = MultiQueueConsumer(sqs, ['empty', 'busy'], lambda m: None,
+                                      pollers=2, idle_delay=0.05)
+        consumer.start()
+        yield sleep(0.1)
+        yield consumer.stop()
+        self.assertEqual(len(sqs.queues['busy'].deleted), 40)
+        # polled at start, after 50ms and not again before 150ms
+        self.assertEqual(sqs.received.count('empty'), 2)
+        self.assertEqual(consumer.in_flight, 0)
+
+
+class TestMessageGroupDispatcher(AsyncTestCase):
+    @gen_test
+    def test_groups_in_order_and_concurrent(self):
+        sqs = FakeSQS(9)
+        for n, message in enumerate(sqs.messages):
+            message['Attributes'] = {'MessageGroupId': 'g%s' % (n % 3)}
+        started = []
+        finished = []
+        # handlers wait until the first messages of all groups started
+        gate = Future()
+
+        @coroutine
+        def handler(message):
+            started.append(message['Body'])
+            yield gate
+            if message['Body'] == 'body-4':
+                raise ValueError('boom')
+            finished.append(message['Body'])
+
+        dispatcher = MessageGroupDispatcher(handler)
+        consumer = SQSConsumer(sqs, 'queue', dispatcher, pollers=1)
+        consumer.start()
+        yield sleep(0.005)
+        # first message of every group runs, the rest waits
+        self.assertEqual(started, ['body-0', 'body-1', 'body-2'])
+        self.assertEqual(len(dispatcher), 3)
+        gate.set_result(None)
+        while len(sqs.deleted) < 7:
+            yield sleep(0.01)
+        yield consumer.stop()
+        for group in range(3):
+            bodies = ['body-%s' % n for n in range(group, 9, 3)]
+            self.assertEqual([b for b in started if b in bodies],
+                             bodies if group != 1 else bodies[:2])
+        # body-7 follows failed body-4 of the same group and is skipped
+        self.assertNotIn('body-7', started)
+        self.assertEqual(sorted(sqs.deleted),
+                         ['h0', 'h1', 'h2', 'h3', 'h5', 'h6', 'h8'])
+        self.assertEqual(len(dispatcher), 0)
+
+
+class TestVisibilityHeartbeat(AsyncTestCase):
+    @gen_test
+    def test_extends_while_processing(self):
+        sqs = FakeSQS(1)
+        heartbeat = VisibilityHeartbeat(sqs, visibility_timeout=30,
+                                        interval=0.01)
+        consumer = SQSConsumer(sqs, 'queue', lambda m: sleep(0.05),
+                               pollers=1, heartbeat=heartbeat)
+        consumer.start()
+        yield sleep(0.03)
+        self.assertEqual(len(heartbeat), 1)
+        yield consumer.stop()
+        self.assertTrue(sqs.extended)
+        self.assertEqual(set(sqs.extended), set(['h0']))
+        self.assertEqual(len(heartbeat), 0)
+
+    @gen_test
+    def test_batches_and_untracks_failed(self):
+        sqs = FakeSQS(0)
+        heartbeat = VisibilityHeartbeat(sqs)
+        for n in range(14):
+            heartbeat.track('queue', 'h%s' % n)
+        heartbeat.track('queue', 'expired')
+        yield heartbeat.beat()
+        self.assertEqual(len(sqs.extended), 15)
+        self.assertEqual(len(heartbeat), 14)
+        heartbeat.untrack('queue', 'h0')
+        self.assertEqual(len(heartbeat), 13)
+
+    def test_interval_shorter_than_visibility_timeout(self):
+        sqs = FakeSQS(0)
+        # first extension would come 2s after receive, message visible at 1s
+        heartbeat = VisibilityHeartbeat(sqs, visibility_timeout=4)
+        with self.assertRaises(AssertionError):
+            SQSConsumer(sqs, 'queue', lambda m: None, visibility_timeout=1,
+                        heartbeat=heartbeat)
+        with self.assertRaises(AssertionError):
+            MultiQueueConsumer(sqs, ['queue'], lambda m: None,
+                               visibility_timeout=2, heartbeat=heartbeat)
+        SQSConsumer(sqs, 'queue', lambda m: None, visibility_timeout=3,
+                    heartbeat=heartbeat)
@@ -0,0 +1,325 @@
+import datetime
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from unittest import TestCase
+from mock import patch
+from tornado.httpclient import HTTPError
+from tornado.httpserver import HTTPServer
+from tornado.ioloop import IOLoop
+from tornado.testing import (AsyncTestCase, AsyncHTTPTestCase, gen_test,
+                             bind_unused_port)
+from tornado.web import Application, RequestHandler
+from asyncaws.core import (AWS, AWSError, AWSRequest, RateLimiter,
+                           RetryPolicy, SigningKeyCache, get_signature_key,
+                           payload_hash, parse_response, FORM_CONTENT_TYPE)
+from asyncaws.sqs import SQS
+from asyncaws.testing import FakeAWSServer
+
+URL = "https://sqs.eu-west-1.amazonaws.com/123/queue?Action=SendMessage"
+
+
+def make_request(utc_now, **kwargs):
+    with patch('asyncaws.core.datetime') as dt:
+        dt.datetime.utcnow.return_value = utc_now
+        return AWSRequest(URL, service='sqs', region='eu-west-1',
+                          access_key='key', secret_key='secret', **kwargs)
+
+
+class TestSigningKeyCache(TestCase):
+    def test_key_matches_derivation(self):
+        cache = SigningKeyCache('secret')
+        key, scope = cache.get('20161018', 'eu-west-1', 'sqs')
+        self.assertEqual(
+            key, get_signature_key('secret', '20161018', 'eu-west-1', 'sqs'))
+        self.assertEqual(scope, '20161018/eu-west-1/sqs/aws4_request')
+
+    def test_key_is_reused_within_day(self):
+        cache = SigningKeyCache('secret')
+        with patch('asyncaws.core.get_signature_key') as derive:
+            derive.return_value = 'k'
+            cache.get('20161018', 'eu-west-1', 'sqs')
+            cache.get('20161018', 'eu-west-1', 'sqs')
+            self.assertEqual(derive.call_count, 1)
+            cache.get('20161018', 'eu-west-1', 'sns')
+            self.assertEqual(derive.call_count, 2)
+
+    def test_rollover_at_midnight(self):
+        cache = SigningKeyCache('secret')
+        cache.get('20161018', 'eu-west-1', 'sqs')
+        key, scope = cache.get('20161019', 'eu-west-1', 'sqs')
+        self.assertTrue(scope.startswith('20161019/'))
+        self.assertEqual(list(cache._entries),
+                         [('20161019', 'eu-west-1', 'sqs')])
+
+    def test_post_body_is_signed(self):
+        now = datetime.datetime(2016, 10, 18, 12, 30)
+        get = make_request(now)
+        post = make_request(now, method='POST', body='Action=SendMessage')
+        self.assertNotEqual(get.headers['Authorization'],
+                            post.headers['Authorization'])
+        self.assertEqual(post.headers['Content-Type'], FORM_CONTENT_TYPE)
+        self.assertEqual(post.body, 'Action=SendMessage')
+
+    def test_cached_signature_is_identical(self):
+        now = datetime.datetime(2016, 10, 18, 12, 30)
+        plain = make_request(now)
+        cached = make_request(now, signing_keys=SigningKeyCache('secret'))
+        self.assertEqual(plain.headers['Authorization'],
+                         cached.headers['Authorization'])
+
+
+ERROR_BODY = """<ErrorResponse>
+  <Error><Type>{type}</Type><Code>{code}</Code><Message>Oops</Message></Error>
+  <RequestId>request-id</RequestId>
+</ErrorResponse>"""
+
+OK_BODY = """<Response><ResponseMetadata>
+  <RequestId>ok-request-id</RequestId>
+</ResponseMetadata></Response>"""
+
+
+class ScriptedHandler(RequestHandler):
+    """Replies with queued (status, code) errors, then with success"""
+    script = []
+    dates = []
+
+    def get(self):
+        self.dates.append(self.request.headers['X-Amz-Date'])
+        if self.script:
+            status, code = self.script.pop(0)
+            self.set_status(status)
+            self.write(ERROR_BODY.format(
+                code=code, type='Sender' if status < 500 else 'Receiver'))
+            return
+        self.write(OK_BODY)
+
+
+class TestRetry(AsyncHTTPTestCase):
+    def get_app(self):
+        return Application([(r'/', ScriptedHandler)])
+
+    def setUp(self):
+        super(TestRetry, self).setUp()
+        ScriptedHandler.dates = []
+        self.policy = RetryPolicy(base_delay=0.001)
+        self.aws = AWS('key', 'secret', 'eu-west-1', retry_policy=self.policy)
+
+    def call(self):
+        return self.aws._process(self.get_url('/'), {'Action': 'Test'}, 'sqs',
+                                 lambda r: r.ResponseMetadata.RequestId.text)
+
+    @gen_test
+    def test_retries_server_errors_and_throttling(self):
+        ScriptedHandler.script = [(503, 'ServiceUnavailable'),
+                                  (400, 'Throttling')]
+        result = yield self.call()
+        self.assertEqual(result, 'ok-request-id')
+        self.assertEqual(len(ScriptedHandler.dates), 3)
+
+    @gen_test
+    def test_non_retryable_error_reaches_future(self):
+        ScriptedHandler.script = [(400, 'InvalidParameterValue')]
+        with self.assertRaises(AWSError) as ctx:
+            yield self.call()
+        self.assertEqual(ctx.exception.code, 'InvalidParameterValue')
+        self.assertTrue(ctx.exception.sender_fault)
+        self.assertEqual(len(ScriptedHandler.dates), 1)
+
+    @gen_test
+    def test_attempts_are_limited(self):
+        ScriptedHandler.script = [(500, 'InternalError')] * 5
+        with self.assertRaises(AWSError) as ctx:
+            yield self.call()
+        self.assertEqual(ctx.exception.status_code, 500)
+        self.assertEqual(len(ScriptedHandler.dates), 3)
+
+    @gen_test
+    def test_budget_stops_retries(self):
+        self.policy.tokens = self.policy.retry_cost
+        ScriptedHandler.script = [(500, 'InternalError')] * 5
+        with self.assertRaises(AWSError):
+            yield self.call()
+        self.assertEqual(len(ScriptedHandler.dates), 2)
+        self.assertEqual(self.policy.tokens, 0)
+
+    @gen_test
+    def test_signing_error_on_retry_reaches_future(self):
+        ScriptedHandler.script = [(503, 'ServiceUnavailable')]
+        sign = self.aws._sign
+        calls = []
+
+        def failing_sign(*args, **kwargs):
+            calls.append(args)
+            if len(calls) > 1:
+                raise ValueError('signing failed')
+            return sign(*args, **kwargs)
+
+        self.aws._sign = failing_sign
+        with self.assertRaises(ValueError):
+            yield self.call()
+        self.assertEqual(len(ScriptedHandler.dates), 1)
+
+    @gen_test
+    def test_throttling_slows_rate_limiter(self):
+        self.aws.rate_limiter = RateLimiter(rate=100)
+        ScriptedHandler.script = [(400, 'Throttling')]
+        yield self.call()
+        self.assertTrue(self.aws.rate_limiter.rate < 51)
+
+
+class TestRetryPolicy(TestCase):
+    def test_backoff_is_capped(self):
+        policy = RetryPolicy(base_delay=1, max_delay=4)
+        for attempt in range(1, 10):
+            self.assertTrue(0 <= policy.delay(attempt) <= 4)
+
+    def test_classification(self):
+        policy = RetryPolicy()
+        self.assertTrue(policy.is_retryable(AWSError('RequestThrottled', '')))
+        self.assertTrue(policy.is_retryable(HTTPError(599)))
+        self.assertTrue(policy.is_retryable(socket.error()))
+        self.assertFalse(policy.is_retryable(AWSError('AccessDenied', '',
+                                                      status_code=403)))
+
+
+class TestRateLimiter(AsyncTestCase):
+    @gen_test
+    def test_queues_over_limit(self):
+        limiter = RateLimiter(rate=100, burst=2)
+        futures = [limiter.acquire() for _ in range(5)]
+        self.assertEqual([f.done() for f in futures],
+                         [True, True, False, False, False])
+        self.assertEqual(limiter.queue_depth, 3)
+        started = time.time()
+        yield futures
+        self.assertTrue(time.time() - started >= 0.02)
+        self.assertEqual(limiter.queue_depth, 0)
+
+    def test_aimd(self):
+        limiter = RateLimiter(rate=10, min_rate=4, max_rate=11, cooldown=60)
+        limiter.on_success()
+        self.assertAlmostEqual(limiter.rate, 10.1)
+        limiter.on_throttle()
+        self.assertAlmostEqual(limiter.rate, 5.05)
+        # ignored during cooldown
+        limiter.on_throttle()
+        self.assertAlmostEqual(limiter.rate, 5.05)
+        limiter._decreased = 0
+        limiter.on_throttle()
+        self.assertEqual(limiter.rate, 4)
+
+    def test_shared_per_service_region_account(self):
+        first = AWS('shared-key', 'secret', 'eu-west-1', rate_limit=5)
+        second = AWS('shared-key', 'secret', 'eu-west-1', rate_limit=5)
+        other = AWS('other-key', 'secret', 'eu-west-1', rate_limit=5)
+        self.assertIs(first.rate_limiter, second.rate_limiter)
+        self.assertIsNot(first.rate_limiter, other.rate_limiter)
+
+
+class RecordingExecutor(ThreadPoolExecutor):
+    def __init__(self):
+        super(RecordingExecutor, self).__init__(2)
+        self.functions = []
+
+    def submit(self, fn, *args, **kwargs):
+        self.functions.append(fn)
+        return super(RecordingExecutor, self).submit(fn, *args, **kwargs)
+
+
+class TestExecutor(AsyncHTTPTestCase):
+    def get_app(self):
+        self.fake = FakeAWSServer(credentials={'key': 'secret'})
+        return self.fake.application()
+
+    def make_sqs(self, executor):
+        return SQS('key', 'secret', 'us-east-1', endpoint=self.get_url('/'),
+                   executor=executor, offload_threshold=10000)
+
+    @gen_test
+    def test_large_payloads_are_offloaded(self):
+        executor = RecordingExecutor()
+        sqs = self.make_sqs(executor)
+        queue_url = yield sqs.create_queue('queue')
+        yield sqs.send_message(queue_url, 'small')
+        self.assertEqual(executor.functions, [])
+        yield sqs.send_message(queue_url, 'x' * 20000)
+        self.assertEqual(executor.functions, [payload_hash])
+        messages = yield sqs.receive_messages(queue_url, wait_time=0)
+        self.assertEqual(executor.functions, [payload_hash, parse_response])
+        self.assertEqual([len(message['Body']) for message in messages],
+                         [5, 20000])
+        executor.shutdown()
+
+    @gen_test
+    def test_process_pool(self):
+        executor = ProcessPoolExecutor(1)
+        sqs = self.make_sqs(executor)
+        queue_url = yield sqs.create_queue('queue')
+        yield sqs.send_message(queue_url, 'x' * 20000)
+        message = yield sqs.listen_queue(queue_url, wait_time=0)
+        self.assertEqual(message['Body'], 'x' * 20000)
+        executor.shutdown()
+
+
+class TestGather(AsyncHTTPTestCase):
+    def get_app(self):
+        return FakeAWSServer(credentials={'key': 'secret'}).application()
+
+    @gen_test
+    def test_gather_is_bounded(self):
+        active = []
+        peak = [0]
+        completed = []
+
+        def create(name):
+            def operation(sqs):
+                active.append(name)
+                peak[0] = max(peak[0], len(active))
+                future = sqs.create_queue(name)
+                future.add_done_callback(lambda _: active.remove(name))
+                return future
+            return operation
+
+        sqs = SQS('key', 'secret', 'us-east-1', endpoint=self.get_url('/'))
+        operations = [create('queue-%s' % n) for n in range(7)]
+        operations.append(lambda sqs: sqs.get_queue_url('missing'))
+        results = yield sqs.gather(
+            operations, concurrency=3,
+            callback=lambda index, result, error: completed.append(index))
+        self.assertEqual(peak[0], 3)
+        self.assertEqual(sorted(completed), range(8))
+        self.assertTrue(results[6][0].endswith('/queue-6'))
+        self.assertIsNone(results[6][1])
+        self.assertIsNone(results[7][0])
+        self.assertIsInstance(results[7][1], AWSError)
+
+
+class TestSyncGather(TestCase):
+    def setUp(self):
+        self.fake = FakeAWSServer(credentials={'key': 'secret'})
+        sock, port = bind_unused_port()
+        self.io_loop = IOLoop(make_current=False)
+        self.server = HTTPServer(self.fake.application(),
+                                 io_loop=self.io_loop)
+        self.server.add_sockets([sock])
+        self.thread = threading.Thread(target=self.io_loop.start)
+        self.thread.start()
+        self.sqs = SQS('key', 'secret', 'us-east-1', async=False,
+                       endpoint='http://127.0.0.1:%s/' % port)
+
+    def tearDown(self):
+        self.io_loop.add_callback(self.io_loop.stop)
+        self.thread.join()
+        self.server.stop()
+        self.io_loop.close(all_fds=True)
+
+    def test_sync_client_runs_calls_concurrently(self):
+        results = self.sqs.gather(
+            (lambda sqs, n=n: sqs.create_queue('queue-%s' % n)
+             for n in range(20)), concurrency=5)
+        self.assertEqual([error for _, error in results], [None] * 20)
+        # the client itself stays synchronous
+        self.assertEqual(self.sqs.list_queues('queue-1'),
+                         [results[1][0]] + [url for url, _ in results[10:]])
@@ -0,0 +1,213 @@
+import json
+import os
+import tempfile
+import time
+from unittest import TestCase
+from mock import patch
+from tornado.concurrent import Future
+from tornado.gen import sleep
+from tornado.testing import AsyncTestCase, AsyncHTTPTestCase, gen_test
+from tornado.web import Application, RequestHandler
+from asyncaws import (SQS, Credentials, CredentialsError, ChainProvider,
+                      ContainerProvider, EnvironmentProvider,
+                      InstanceMetadataProvider, SharedFileProvider)
+from asyncaws.credentials import CredentialsCache
+from asyncaws.testing import FakeAWSHandler, FakeAWSServer
+
+
+def credentials_json(access_key, expires_in=3600):
+    expiration = time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                               time.gmtime(time.time() + expires_in))
+    return json.dumps({'AccessKeyId': access_key,
+                       'SecretAccessKey': 'secret-' + access_key,
+                       'Token': 'token-' + access_key,
+                       'Expiration': expiration})
+
+
+class ContainerHandler(RequestHandler):
+    def get(self):
+        self.write(credentials_json('container'))
+
+
+class TokenHandler(RequestHandler):
+    def put(self):
+        self.write('imds-token')
+
+
+class RoleHandler(RequestHandler):
+    def get(self, role):
+        assert self.request.headers['X-aws-ec2-metadata-token'] == \
+            'imds-token'
+        if not role:
+            self.write('role\n')
+        else:
+            self.write(credentials_json(role))
+
+
+class TestProviders(TestCase):
+    def test_environment(self):
+        with patch.dict(os.environ, {'AWS_ACCESS_KEY_ID': 'key',
+                                     'AWS_SECRET_ACCESS_KEY': 'secret',
+                                     'AWS_SESSION_TOKEN': 'token'}):
+            credentials = EnvironmentProvider().load()
+        self.assertEqual((credentials.access_key, credentials.secret_key,
+                          credentials.token), ('key', 'secret', 'token'))
+        with patch.dict(os.environ, clear=True):
+            self.assertIsNone(EnvironmentProvider().load())
+
+    def test_shared_file(self):
+        with tempfile.NamedTemporaryFile() as shared_file:
+            shared_file.write('[default]\naws_access_key_id = key\n'
+                              'aws_secret_access_key = secret\n'
+                              '[other]\naws_access_key_id = other\n')
+            shared_file.flush()
+            credentials = SharedFileProvider(shared_file.name).load()
+            self.assertEqual(credentials.access_key, 'key')
+            self.assertIsNone(credentials.token)
+            # incomplete profile
+            self.assertIsNone(
+                SharedFileProvider(shared_file.name, 'other').load())
+        self.assertIsNone(SharedFileProvider('/nonexistent').load())
+
+    def test_sync_client_signs_session_token(self):
+        with patch.dict(os.environ, {'AWS_ACCESS_KEY_ID': 'key',
+                                     'AWS_SECRET_ACCESS_KEY': 'secret',
+                                     'AWS_SESSION_TOKEN': 'token'}):
+            sqs = SQS(None, None, 'us-east-1', async=False,
+                      credentials=EnvironmentProvider())
+            request = sqs._sign('https://sqs.us-east-1.amazonaws.com/'
+                                '?Action=ListQueues', 'sqs')
+        self.assertEqual(request.headers['x-amz-security-token'], 'token')
+        self.assertIn('SignedHeaders=host;x-amz-date;x-amz-security-token',
+                      request.headers['Authorization'])
+        self.assertIn('Credential=key/', request.headers['Authorization'])
+
+
+class TestRemoteCredentials(AsyncHTTPTestCase):
+    def get_app(self):
+        self.fake = FakeAWSServer(credentials={
+            'container': 'secret-container', 'role': 'secret-role'})
+        return Application([
+            (r'/container', ContainerHandler),
+            (r'/latest/api/token', TokenHandler),
+            (r'/latest/meta-data/iam/security-credentials/(.*)',
+             RoleHandler),
+            (r'/.*', FakeAWSHandler, {'fake': self.fake}),
+        ])
+
+    @gen_test
+    def test_container_credentials_sign_requests(self):
+        provider = ContainerProvider(self.get_url('/container'))
+        sqs = SQS(None, None, 'us-east-1', endpoint=self.get_url('/'),
+                  credentials=provider)
+        queue_url = yield sqs.create_queue('queue')
+        self.assertTrue(queue_url.endswith('/queue'))
+        self.assertEqual(sqs.credentials.current.token, 'token-container')
+
+    @gen_test
+    def test_instance_metadata_in_chain(self):
+        provider = ChainProvider([
+            ContainerProvider(self.get_url('/missing')),
+            InstanceMetadataProvider(self.get_url('/'))])
+        credentials = yield provider.load()
+        self.assertEqual(credentials.access_key, 'role')
+        self.assertTrue(credentials.expires_within(3601))
+        self.assertFalse(credentials.expires_within(3000))
+
+    @gen_test(timeout=10)
+    def test_load_does_not_wait_for_long_polls(self):
+        sqs = SQS('container', 'secret-container', 'us-east-1',
+                  endpoint=self.get_url('/'))
+        queue_url = yield sqs.create_queue('queue')
+        # all connections of the shared AsyncHTTPClient are taken
+        polls = [sqs.receive_messages(queue_url, wait_time=2)
+                 for _ in range(10)]
+        provider = ContainerProvider(self.get_url('/container'), timeout=1)
+        credentials = yield provider.load()
+        self.assertEqual(credentials.access_key, 'container')
+        self.assertFalse(any(poll.done() for poll in polls))
+        yield polls
+
+    @gen_test
+    def test_missing_credentials_fail_the_call(self):
+        sqs = SQS(None, None, 'us-east-1', endpoint=self.get_url('/'),
+                  credentials=ChainProvider([]))
+        with self.assertRaises(CredentialsError):
+            yield sqs.create_queue('queue')
+
+
+class ScriptedProvider(object):
+    def __init__(self):
+        self.pending = []
+
+    def load(self):
+        self.pending.append(Future())
+        return self.pending[-1]
+
+
+class TestCredentialsCache(AsyncTestCase):
+    @gen_test
+    def test_refresh_ahead_of_expiry(self):
+        provider = ScriptedProvider()
+        cache = CredentialsCache(provider, advance=60)
+        ready = cache.ready()
+        provider.pending[0].set_result(
+            Credentials('first', 'secret', expiration=time.time() + 30))
+        first = yield ready
+        # about to expire: refresh starts, old credentials are still used
+        self.assertIs(cache.current, first)
+        self.assertIs(cache.current, first)
+        self.assertEqual(len(provider.pending), 2)
+        provider.pending[1].set_result(
+            Credentials('second', 'secret', expiration=time.time() + 3600))
+        yield sleep(0)
+        self.assertEqual(cache.current.access_key, 'second')
+        self.assertEqual(len(provider.pending), 2)
+
+    @gen_test
+    def test_failed_refresh_keeps_credentials(self):
+        provider = ScriptedProvider()
+        first = Credentials('first', 'secret', expiration=time.time() + 30)
+        cache = CredentialsCache(provider, advance=60, credentials=first)
+        self.assertIs(cache.current, first)
+        provider.pending[0].set_exception(IOError('unreachable'))
+        yield sleep(0)
+        # next attempt waits for retry_interval
+        self.assertIs(cache.current, first)
+        self.assertEqual(len(provider.pending), 1)
+
+
+class BrokenProvider(object):
+    def __init__(self):
+        self.calls = 0
+
+    def load(self):
+        self.calls += 1
+        raise IOError('unreachable')
+
+
+class TestFailingProvider(AsyncTestCase):
+    @gen_test
+    def test_synchronous_error_does_not_block_loading(self):
+        provider = BrokenProvider()
+        cache = CredentialsCache(provider)
+        with self.assertRaises(IOError):
+            yield cache.ready()
+        # nothing is left pending, the next call tries again
+        with self.assertRaises(IOError):
+            yield cache.ready()
+        self.assertEqual(provider.calls, 2)
+
+    def test_sync_refresh_keeps_valid_credentials(self):
+        provider = BrokenProvider()
+        valid = Credentials('valid', 'secret', expiration=time.time() + 30)
+        cache = CredentialsCache(provider, async=False, advance=60,
+                                 credentials=valid)
+        self.assertIs(cache.current, valid)
+        self.assertEqual(provider.calls, 1)
+        expired = Credentials('expired', 'secret',
+                              expiration=time.time() - 1)
+        cache = CredentialsCache(provider, async=False, advance=60,
+                                 credentials=expired)
+        with self.assertRaises(IOError):
+            cache.current
@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+from mock import patch
+from tornado.gen import coroutine, sleep
+from tornado.testing import AsyncTestCase, gen_test
+from asyncaws import (Deduplicator, DuplicateFailed, MemoryDedupStore,
+                      SQLiteDedupStore)
+
+
+class TestStores(TestCase):
+    def test_memory_lru_and_ttl(self):
+        store = MemoryDedupStore(max_size=2, ttl=10)
+        store.add('a')
+        store.add('b')
+        self.assertTrue(store.seen('a'))
+        # b is the least recently used now
+        store.add('c')
+        self.assertEqual(len(store), 2)
+        self.assertFalse(store.seen('b'))
+        self.assertTrue(store.seen('a'))
+        with patch('asyncaws.dedup.time.time', return_value=time.time() + 11):
+            self.assertFalse(store.seen('c'))
+
+    def test_sqlite_shared_between_stores(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        first = SQLiteDedupStore(os.path.join(path, 'dedup.db'),
+                                 purge_interval=2)
+        second = SQLiteDedupStore(os.path.join(path, 'dedup.db'))
+        self.addCleanup(first.close)
+        self.addCleanup(second.close)
+        first.add('a').result()
+        self.assertTrue(second.seen('a').result())
+        self.assertFalse(second.seen('b').result())
+        later = time.time() + 3601
+        with patch('asyncaws.dedup.time.time', return_value=later):
+            self.assertFalse(second.seen('a').result())
+            # purge on the second addition removes expired a
+            first.add('b').result()
+        count = second.executor.submit(
+            lambda: second._db().execute(
+                'SELECT COUNT(*) FROM processed').fetchone()[0])
+        self.assertEqual(count.result(), 1)
+
+
+class TestDeduplicator(AsyncTestCase):
+    @gen_test
+    def test_duplicates_skip_handler(self):
+        handled = []
+
+        @coroutine
+        def handler(message):
+            yield sleep(0.01)
+            if message['Body'] == 'fail':
+                raise ValueError('boom')
+            handled.append(message['MessageId'])
+
+        dedup = Deduplicator(handler)
+        # concurrent duplicate shares the outcome of the first delivery
+        yield [dedup({'MessageId': '1', 'Body': 'ok'}),
+               dedup({'MessageId': '1', 'Body': 'ok'})]
+        yield dedup({'MessageId': '1', 'Body': 'ok'})
+        self.assertEqual(handled, ['1'])
+        self.assertEqual(dedup.skipped, 2)
+        first = dedup({'MessageId': '2', 'Body': 'fail'})
+        second = dedup({'MessageId': '2', 'Body': 'fail'})
+        with self.assertRaises(ValueError):
+            yield first
+        with self.assertRaises(DuplicateFailed):
+            yield second
+        # failed key is not recorded, redelivery runs the handler
+        with self.assertRaises(ValueError):
+            yield dedup({'MessageId': '2', 'Body': 'fail'})
+        self.assertEqual(dedup.skipped, 2)
+
+    @gen_test
+    def test_sqlite_store_off_the_loop(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        store = SQLiteDedupStore(os.path.join(path, 'dedup.db'))
+        self.addCleanup(store.close)
+        handled = []
+        dedup = Deduplicator(handled.append, store)
+        for _ in range(2):
+            yield dedup({'MessageId': '1', 'Body': 'ok'})
+        self.assertEqual(len(handled), 1)
+        self.assertEqual(dedup.skipped, 1)
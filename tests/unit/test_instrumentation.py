@@ -0,0 +1,76 @@
+import socket
+from tornado.testing import AsyncHTTPTestCase, gen_test
+from asyncaws import (SQS, AWSError, RetryPolicy, Instrumentation,
+                      MetricsCollector, StatsdInstrumentation)
+from asyncaws.testing import FakeAWSServer
+
+
+class Recorder(Instrumentation):
+    def __init__(self):
+        self.events = []
+
+    def request_start(self, metrics):
+        self.events.append(('start', metrics.action))
+
+    def request_end(self, metrics):
+        self.events.append(('end', metrics.action))
+
+
+class BrokenHook(Instrumentation):
+    def request_end(self, metrics):
+        raise ValueError('broken')
+
+
+class TestInstrumentation(AsyncHTTPTestCase):
+    def get_app(self):
+        self.fake = FakeAWSServer()
+        return self.fake.application()
+
+    def make_sqs(self, instrumentation):
+        return SQS('key', 'secret', 'us-east-1', endpoint=self.get_url('/'),
+                   retry_policy=RetryPolicy(base_delay=0.001),
+                   instrumentation=instrumentation)
+
+    @gen_test
+    def test_hooks_and_collected_metrics(self):
+        recorder = Recorder()
+        sqs = self.make_sqs(recorder)
+        queue_url = yield sqs.create_queue('queue')
+        self.assertEqual(recorder.events, [('start', 'CreateQueue'),
+                                           ('end', 'CreateQueue')])
+        collector = MetricsCollector()
+        sqs.instrumentation = collector
+        self.fake.fail_next('Throttling', action='SendMessage')
+        yield sqs.send_message(queue_url, 'x' * 1000)
+        self.fake.fail_next('AccessDenied', status=403)
+        with self.assertRaises(AWSError):
+            yield sqs.send_message(queue_url, 'hello')
+        totals = collector.snapshot()[('sqs', 'SendMessage', 'us-east-1')]
+        self.assertEqual(totals['requests'], 2)
+        self.assertEqual(totals['retries'], 1)
+        self.assertEqual(totals['errors'], 1)
+        self.assertTrue(totals['request_bytes'] > 2000)
+        self.assertTrue(totals['response_bytes'] > 0)
+        self.assertTrue(0 < totals['sign_time'] < totals['duration'])
+        self.assertTrue(0 < totals['network_time'] < totals['duration'])
+        self.assertTrue(totals['parse_time'] > 0)
+
+    @gen_test
+    def test_broken_hook_does_not_break_call(self):
+        sqs = self.make_sqs(BrokenHook())
+        queue_url = yield sqs.create_queue('queue')
+        self.assertTrue(queue_url.endswith('/queue'))
+
+    @gen_test
+    def test_statsd(self):
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.bind(('127.0.0.1', 0))
+        receiver.settimeout(1)
+        statsd = StatsdInstrumentation(port=receiver.getsockname()[1])
+        sqs = self.make_sqs(statsd)
+        yield sqs.create_queue('queue')
+        packet = receiver.recv(4096)
+        receiver.close()
+        self.assertIn('asyncaws.request.count:1|c|#service:sqs,'
+                      'action:CreateQueue,region:us-east-1', packet)
+        self.assertIn('asyncaws.request.duration:', packet)
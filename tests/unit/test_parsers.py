@@ -0,0 +1,110 @@
+import os
+import pickle
+from unittest import TestCase
+from asyncaws import Message, parsers
+
+FIXTURES = os.path.join(os.path.dirname(__file__), os.pardir, 'fixtures')
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), 'rb') as xml_file:
+        return xml_file.read()
+
+
+class TestParsers(TestCase):
+    def test_messages(self):
+        messages = parsers.MESSAGES.parse(fixture('receive_message.xml'))
+        self.assertEqual(len(messages), 10)
+        message = messages[3]
+        self.assertEqual(message['MessageId'],
+                         '5fea7756-0ea4-451a-a703-a558b933e273')
+        self.assertTrue(message['Body'].startswith('{"event"'))
+        self.assertTrue(message['ReceiptHandle'].startswith('MbZj6wDWli'))
+        self.assertEqual(message['Attributes']['ApproximateReceiveCount'], '5')
+        self.assertEqual(message['MessageAttributes']['tenant'],
+                         {'StringValue': 'tenant-3', 'DataType': 'String'})
+
+    def test_single_message(self):
+        message = parsers.SINGLE_MESSAGE.parse(fixture('receive_message.xml'))
+        self.assertEqual(message['MessageId'],
+                         '5fea7756-0ea4-451a-a703-a558b933e270')
+        empty = ('<ReceiveMessageResponse><ReceiveMessageResult/>'
+                 '</ReceiveMessageResponse>')
+        self.assertIsNone(parsers.SINGLE_MESSAGE.parse(empty))
+        self.assertEqual(parsers.MESSAGES.parse(empty), [])
+
+    def test_attributes(self):
+        result = parsers.ATTRIBUTES.parse(fixture('get_queue_attributes.xml'))
+        self.assertEqual(len(result), 11)
+        self.assertEqual(result['QueueArn'],
+                         'arn:aws:sqs:eu-west-1:123456789012:test-queue')
+
+    def test_text(self):
+        raw = fixture('publish.xml')
+        self.assertEqual(parsers.TextParser('MessageId').parse(raw),
+                         '94f20ce6-13c5-43a0-9a9e-ca52d816e90b')
+        self.assertEqual(parsers.REQUEST_ID.parse(raw),
+                         'f187a3c1-376f-11df-8963-01868b7c937a')
+        self.assertIsNone(parsers.TextParser('Missing').parse(raw))
+
+    def test_batch_result(self):
+        result = parsers.BATCH_RESULT.parse(fixture('send_message_batch.xml'))
+        self.assertEqual(len(result['Successful']), 9)
+        self.assertEqual(result['Successful'][0]['Id'], '0')
+        self.assertEqual(result['Failed'], [{
+            'Id': '9', 'Code': 'InvalidMessageContents',
+            'Message': 'Message contains invalid characters',
+            'SenderFault': 'true'}])
+        self.assertEqual(result['RequestId'],
+                         'ca1ad5d0-8271-408b-8d0f-1351bf547e74')
+
+    def test_sns_batch_result(self):
+        result = parsers.BATCH_RESULT.parse(fixture('publish_batch.xml'))
+        self.assertEqual([item['Id'] for item in result['Successful']],
+                         ['0', '1'])
+        self.assertEqual(result['Successful'][1]['MessageId'],
+                         '567910cd-659e-55d4-8ccb-5aaf14679dc1')
+        self.assertEqual(result['Failed'], [{
+            'Id': '2', 'Code': 'InvalidParameter',
+            'Message': 'Message too long', 'SenderFault': 'true'}])
+        self.assertEqual(result['RequestId'],
+                         'd74b8436-ae13-5ab4-a9ff-ce54dfea72a0')
+
+
+class TestMessage(TestCase):
+    def setUp(self):
+        self.message = parsers.MESSAGES.parse(
+            fixture('receive_message.xml'))[3]
+
+    def test_attributes_are_decoded_lazily(self):
+        self.assertIsNone(self.message._attributes)
+        self.assertTrue(self.message.body.startswith('{"event"'))
+        self.assertIsNone(self.message._message_attributes)
+        # no reference to the parsed tree is kept
+        self.assertFalse(hasattr(self.message, '_element'))
+        self.assertEqual(
+            self.message.attributes['ApproximateReceiveCount'], '5')
+        self.assertEqual(self.message.message_attributes['tenant'],
+                         {'StringValue': 'tenant-3', 'DataType': 'String'})
+
+    def test_dict_access(self):
+        message = self.message
+        self.assertEqual(message['MessageId'], message.message_id)
+        self.assertIs(message['Attributes'], message.attributes)
+        self.assertEqual(message.get('QueueUrl', 'none'), 'none')
+        self.assertNotIn('QueueUrl', message)
+        message['Body'] = 'decoded'
+        self.assertEqual(message.body, 'decoded')
+        with self.assertRaises(KeyError):
+            message['Unknown']
+        self.assertEqual(sorted(message.to_dict()), [
+            'Attributes', 'Body', 'MD5OfBody', 'MD5OfMessageAttributes',
+            'MessageAttributes',
+            'MessageId', 'ReceiptHandle'])
+        with self.assertRaises(AttributeError):
+            message.extra = 1
+
+    def test_pickle(self):
+        copy = pickle.loads(pickle.dumps(self.message, 2))
+        self.assertIsInstance(copy, Message)
+        self.assertEqual(copy.to_dict(), self.message.to_dict())
@@ -0,0 +1,47 @@
+from tornado.testing import AsyncHTTPTestCase, gen_test
+from asyncaws import SQS, SNS, SNSBatcher, AWSError
+from asyncaws.testing import FakeAWSServer
+
+
+class TestSNS(AsyncHTTPTestCase):
+    def get_app(self):
+        self.fake = FakeAWSServer(credentials={'key': 'secret'})
+        return self.fake.application()
+
+    def setUp(self):
+        super(TestSNS, self).setUp()
+        self.sqs = SQS('key', 'secret', 'us-east-1',
+                       endpoint=self.get_url('/'))
+        self.sns = SNS('key', 'secret', 'us-east-1',
+                       endpoint=self.get_url('/'))
+
+    @gen_test
+    def test_publish_batch(self):
+        topic_arn = yield self.sns.create_topic('topic')
+        result = yield self.sns.publish_batch(topic_arn, [
+            {'Id': 'a', 'Message': 'first', 'Subject': 'Subject'},
+            {'Id': 'b', 'Message': ''}])
+        self.assertEqual([item['Id'] for item in result['Successful']], ['a'])
+        self.assertEqual(result['Failed'][0]['Id'], 'b')
+        self.assertEqual(result['Failed'][0]['Code'], 'InvalidParameter')
+
+    @gen_test
+    def test_batcher_coalesces_publish_calls(self):
+        topic_arn = yield self.sns.create_topic('topic')
+        queue_url = yield self.sqs.create_queue('subscriber')
+        attributes = yield self.sqs.get_queue_attributes(queue_url,
+                                                         ['QueueArn'])
+        yield self.sns.subscribe(attributes['QueueArn'], topic_arn, 'sqs')
+        requests = self.fake.requests
+        batcher = SNSBatcher(self.sns, window=0.01)
+        futures = [batcher.publish('message-%s' % n, None, topic_arn)
+                   for n in range(12)]
+        futures.append(batcher.publish('', None, topic_arn))
+        message_ids = yield futures[:12]
+        self.assertEqual(len(set(message_ids)), 12)
+        with self.assertRaises(AWSError) as ctx:
+            yield futures[12]
+        self.assertEqual(ctx.exception.code, 'InvalidParameter')
+        self.assertEqual(self.fake.requests - requests, 2)
+        messages = yield self.sqs.receive_messages(queue_url, wait_time=0)
+        self.assertEqual(len(messages), 10)
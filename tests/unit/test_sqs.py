@@ -0,0 +1,221 @@
+from asyncaws import SQS, SQSBatcher
+from asyncaws.batching import BatchCollector
+from asyncaws.core import AWSError
+from asyncaws.testing import FakeAWSServer
+from tornado.concurrent import Future
+from tornado.testing import AsyncHTTPTestCase, AsyncTestCase, gen_test
+from tornado.web import Application, RequestHandler
+
+MESSAGE = """
+<Message>
+  <MessageId>id-{n}</MessageId>
+  <ReceiptHandle>handle-{n}</ReceiptHandle>
+  <MD5OfBody>md5-{n}</MD5OfBody>
+  <Body>body-{n}</Body>
+  <Attribute><Name>SenderId</Name><Value>sender</Value></Attribute>
+  <Attribute><Name>ApproximateReceiveCount</Name><Value>1</Value></Attribute>
+  <MessageAttribute>
+    <Name>color</Name>
+    <Value><StringValue>red</StringValue><DataType>String</DataType></Value>
+  </MessageAttribute>
+</Message>"""
+
+RESPONSE = """<?xml version="1.0"?>
+<ReceiveMessageResponse xmlns="http://queue.amazonaws.com/doc/2012-11-05/">
+  <ReceiveMessageResult>{messages}</ReceiveMessageResult>
+  <ResponseMetadata><RequestId>request-id</RequestId></ResponseMetadata>
+</ReceiveMessageResponse>"""
+
+
+BATCH_RESPONSE = """<?xml version="1.0"?>
+<{action}Response xmlns="http://queue.amazonaws.com/doc/2012-11-05/">
+  <{action}Result>{entries}</{action}Result>
+  <ResponseMetadata><RequestId>batch-request-id</RequestId></ResponseMetadata>
+</{action}Response>"""
+
+SUCCESS_ENTRY = """<{action}ResultEntry>
+  <Id>{id}</Id><MessageId>message-{body}</MessageId>
+</{action}ResultEntry>"""
+
+ERROR_ENTRY = """<BatchResultErrorEntry>
+  <Id>{id}</Id><Code>InvalidMessageContents</Code>
+  <Message>Bad body</Message><SenderFault>true</SenderFault>
+</BatchResultErrorEntry>"""
+
+
+class QueueHandler(RequestHandler):
+    batch_sizes = []
+    methods = []
+
+    def get(self):
+        self.methods.append(self.request.method)
+        action = self.get_argument('Action')
+        if action == 'ReceiveMessage':
+            count = int(self.get_argument('MaxNumberOfMessages'))
+            messages = ''.join(MESSAGE.format(n=n) for n in range(count))
+            self.write(RESPONSE.format(messages=messages))
+            return
+        prefix = action.replace('Batch', 'BatchRequestEntry')
+        entries = []
+        n = 1
+        while self.get_argument('%s.%s.Id' % (prefix, n), None) is not None:
+            entry_id = self.get_argument('%s.%s.Id' % (prefix, n))
+            body = self.get_argument('%s.%s.MessageBody' % (prefix, n), n)
+            template = ERROR_ENTRY if body == 'fail' else SUCCESS_ENTRY
+            entries.append(template.format(action=action, id=entry_id,
+                                           body=body))
+            n += 1
+        self.batch_sizes.append(len(entries))
+        self.write(BATCH_RESPONSE.format(action=action,
+                                         entries=''.join(entries)))
+
+    post = get
+
+
+class TestReceive(AsyncHTTPTestCase):
+    def get_app(self):
+        return Application([(r'/123/queue', QueueHandler)])
+
+    def setUp(self):
+        super(TestReceive, self).setUp()
+        self.sqs = SQS('key', 'secret', 'eu-west-1')
+        self.queue_url = self.get_url('/123/queue')
+
+    @gen_test
+    def test_receive_messages_returns_whole_batch(self):
+        messages = yield self.sqs.receive_messages(self.queue_url,
+                                                   max_messages=10)
+        self.assertEqual(len(messages), 10)
+        self.assertEqual([m['Body'] for m in messages],
+                         ['body-%s' % n for n in range(10)])
+        self.assertEqual(messages[9]['ReceiptHandle'], 'handle-9')
+        self.assertEqual(messages[0]['Attributes']['SenderId'], 'sender')
+        self.assertEqual(messages[0]['MessageAttributes']['color'],
+                         {'StringValue': 'red', 'DataType': 'String'})
+
+    @gen_test
+    def test_large_params_are_posted(self):
+        QueueHandler.methods = []
+        yield self.sqs.receive_messages(self.queue_url)
+        self.sqs.post_threshold = 10
+        yield self.sqs.receive_messages(self.queue_url)
+        result = yield self.sqs.send_message_batch(
+            self.queue_url, [{'Id': 'a', 'MessageBody': 'x' * 3000}])
+        self.assertEqual(result['Successful'][0]['MessageId'],
+                         'message-' + 'x' * 3000)
+        self.assertEqual(QueueHandler.methods, ['GET', 'POST', 'POST'])
+
+    @gen_test
+    def test_listen_queue_single_message(self):
+        message = yield self.sqs.listen_queue(self.queue_url)
+        self.assertEqual(message['MessageId'], 'id-0')
+        messages = yield self.sqs.listen_queue(self.queue_url, max_messages=3)
+        self.assertEqual(len(messages), 3)
+
+
+class TestBatch(AsyncHTTPTestCase):
+    def get_app(self):
+        return Application([(r'/123/queue', QueueHandler)])
+
+    def setUp(self):
+        super(TestBatch, self).setUp()
+        QueueHandler.batch_sizes = []
+        self.sqs = SQS('key', 'secret', 'eu-west-1')
+        self.queue_url = self.get_url('/123/queue')
+
+    @gen_test
+    def test_send_message_batch(self):
+        result = yield self.sqs.send_message_batch(self.queue_url, [
+            {'Id': 'a', 'MessageBody': 'one'},
+            {'Id': 'b', 'MessageBody': 'fail'}])
+        self.assertEqual(result['Successful'],
+                         [{'Id': 'a', 'MessageId': 'message-one'}])
+        self.assertEqual(result['Failed'][0]['Code'], 'InvalidMessageContents')
+        self.assertEqual(result['RequestId'], 'batch-request-id')
+
+    @gen_test
+    def test_batcher_coalesces_calls(self):
+        batcher = SQSBatcher(self.sqs, window=0.01)
+        futures = [batcher.send_message(self.queue_url, 'body-%s' % n)
+                   for n in range(12)]
+        message_ids = yield futures
+        self.assertEqual(message_ids, ['message-body-%s' % n
+                                       for n in range(12)])
+        # 10 entries flushed at once, the rest after the window
+        self.assertEqual(QueueHandler.batch_sizes, [10, 2])
+
+    @gen_test
+    def test_batcher_partial_failure(self):
+        batcher = SQSBatcher(self.sqs, window=0.01)
+        ok = batcher.send_message(self.queue_url, 'ok')
+        failed = batcher.send_message(self.queue_url, 'fail')
+        deleted = batcher.delete_message(self.queue_url, 'handle')
+        self.assertEqual((yield ok), 'message-ok')
+        with self.assertRaises(AWSError) as ctx:
+            yield failed
+        self.assertEqual(ctx.exception.code, 'InvalidMessageContents')
+        self.assertTrue(ctx.exception.sender_fault)
+        self.assertEqual((yield deleted), 'batch-request-id')
+
+
+class TestBatchCollector(AsyncTestCase):
+    @gen_test
+    def test_unknown_ids_are_skipped(self):
+        def send_batch(key, entries):
+            future = Future()
+            future.set_result({
+                'Successful': [{'Id': '0'}, {'Id': 'unknown'}],
+                'Failed': [{'Id': '0', 'Code': 'Repeated'}]})
+            return future
+
+        collector = BatchCollector(send_batch, lambda item, batch: 'ok',
+                                   window=0.01)
+        first = collector.add('key', {})
+        second = collector.add('key', {})
+        self.assertEqual((yield first), 'ok')
+        with self.assertRaises(AWSError) as ctx:
+            yield second
+        self.assertEqual(ctx.exception.code, 'MissingEntry')
+
+
+class TestFifoQueue(AsyncHTTPTestCase):
+    def get_app(self):
+        return FakeAWSServer(credentials={'key': 'secret'}).application()
+
+    def setUp(self):
+        super(TestFifoQueue, self).setUp()
+        self.sqs = SQS('key', 'secret', 'us-east-1',
+                       endpoint=self.get_url('/'))
+
+    @gen_test
+    def test_fifo_queue(self):
+        queue_url = yield self.sqs.create_queue(
+            'jobs.fifo', {'FifoQueue': 'true',
+                          'ContentBasedDeduplication': 'true'})
+        for body, group in [('a1', 'a'), ('b1', 'b'), ('a2', 'a')]:
+            yield self.sqs.send_message(queue_url, body,
+                                        message_group_id=group)
+        # duplicate of a1 is dropped
+        yield self.sqs.send_message(queue_url, 'a1', message_group_id='a')
+        yield self.sqs.send_message(queue_url, 'a1', message_group_id='a',
+                                    deduplication_id='again')
+        first = yield self.sqs.receive_messages(queue_url, 0, 2,
+                                                receive_request_attempt_id='x')
+        self.assertEqual([m.body for m in first], ['a1', 'b1'])
+        self.assertEqual(first[0].attributes['MessageGroupId'], 'a')
+        self.assertTrue(first[0].attributes['SequenceNumber'] <
+                        first[1].attributes['SequenceNumber'])
+        # retried attempt gets the same messages
+        retried = yield self.sqs.receive_messages(
+            queue_url, 0, 2, receive_request_attempt_id='x')
+        self.assertEqual([m.receipt_handle for m in retried],
+                         [m.receipt_handle for m in first])
+        # both groups are in flight
+        locked = yield self.sqs.receive_messages(queue_url, 0)
+        self.assertEqual(locked, [])
+        yield first[0].delete()
+        rest = yield self.sqs.receive_messages(queue_url, 0)
+        self.assertEqual([m.body for m in rest], ['a2', 'a1'])
+        with self.assertRaises(AWSError) as ctx:
+            yield self.sqs.send_message(queue_url, 'no group')
+        self.assertEqual(ctx.exception.code, 'MissingParameter')
@@ -0,0 +1,136 @@
+import json
+from tornado.concurrent import Future
+from tornado.gen import sleep
+from tornado.testing import AsyncHTTPTestCase, gen_test
+from asyncaws import SQS, SNS, AWSError, RetryPolicy
+from asyncaws.testing import FakeAWSServer
+
+CREDENTIALS = {'key': 'secret'}
+
+
+class FakeServerTestCase(AsyncHTTPTestCase):
+    def get_app(self):
+        self.fake = FakeAWSServer(credentials=CREDENTIALS)
+        return self.fake.application()
+
+    def setUp(self):
+        super(FakeServerTestCase, self).setUp()
+        self.sqs = SQS('key', 'secret', 'us-east-1',
+                       endpoint=self.get_url('/'))
+        self.sns = SNS('key', 'secret', 'us-east-1',
+                       endpoint=self.get_url('/'))
+
+
+class TestFakeSQS(FakeServerTestCase):
+    @gen_test
+    def test_message_lifecycle(self):
+        queue_url = yield self.sqs.create_queue('queue',
+                                                {'VisibilityTimeout': 1})
+        yield self.sqs.send_message(queue_url, 'hello')
+        message = yield self.sqs.listen_queue(queue_url, wait_time=0,
+                                              visibility_timeout=0)
+        self.assertEqual(message['Body'], 'hello')
+        # visibility timeout 0 makes it available right away
+        again = yield self.sqs.listen_queue(queue_url, wait_time=0)
+        self.assertEqual(again['Attributes']['ApproximateReceiveCount'], '2')
+        hidden = yield self.sqs.listen_queue(queue_url, wait_time=0)
+        self.assertIsNone(hidden)
+        with self.assertRaises(AWSError):
+            yield self.sqs.delete_message(queue_url, message['ReceiptHandle'])
+        yield self.sqs.delete_message(queue_url, again['ReceiptHandle'])
+        attributes = yield self.sqs.get_queue_attributes(queue_url)
+        self.assertEqual(attributes['ApproximateNumberOfMessages'], '0')
+        self.assertEqual(attributes['VisibilityTimeout'], '1')
+
+    @gen_test
+    def test_batches_and_long_poll(self):
+        queue_url = yield self.sqs.create_queue('batch-queue')
+        poll = self.sqs.receive_messages(queue_url, wait_time=2)
+        yield sleep(0.1)
+        self.assertFalse(poll.done())
+        result = yield self.sqs.send_message_batch(queue_url, [
+            {'Id': str(n), 'MessageBody': 'body-%s' % n} for n in range(10)])
+        self.assertEqual(len(result['Successful']), 10)
+        messages = yield poll
+        self.assertEqual(len(messages), 10)
+        result = yield self.sqs.delete_message_batch(queue_url, [
+            {'Id': 'a', 'ReceiptHandle': messages[0]['ReceiptHandle']},
+            {'Id': 'b', 'ReceiptHandle': 'invalid'}])
+        self.assertEqual(result['Successful'], [{'Id': 'a'}])
+        self.assertEqual(result['Failed'][0]['Code'],
+                         'ReceiptHandleIsInvalid')
+
+    @gen_test
+    def test_bound_message_methods(self):
+        queue_url = yield self.sqs.create_queue('queue')
+        yield self.sqs.send_message(queue_url, 'hello')
+        message = yield self.sqs.listen_queue(queue_url, wait_time=0)
+        self.assertEqual(message.queue_url, queue_url)
+        yield message.change_visibility(0)
+        again = yield self.sqs.listen_queue(queue_url, wait_time=0)
+        self.assertEqual(again.message_id, message.message_id)
+        yield again.delete()
+        self.assertEqual(self.fake.queue(queue_url).messages, [])
+
+    @gen_test
+    def test_results_are_tornado_futures(self):
+        future = self.sqs.create_queue('queue')
+        self.assertIsInstance(future, Future)
+        queue_url = yield future
+        self.assertTrue(queue_url.endswith('/queue'))
+
+    @gen_test
+    def test_queue_lookup(self):
+        first = yield self.sqs.create_queue('first')
+        second = yield self.sqs.create_queue('second')
+        queue_url = yield self.sqs.get_queue_url('second')
+        self.assertEqual(queue_url, second)
+        queue_urls = yield self.sqs.list_queues()
+        self.assertEqual(queue_urls, [first, second])
+        queue_urls = yield self.sqs.list_queues('sec')
+        self.assertEqual(queue_urls, [second])
+        with self.assertRaises(AWSError):
+            yield self.sqs.get_queue_url('missing')
+
+    @gen_test
+    def test_bad_signature_is_rejected(self):
+        sqs = SQS('key', 'wrong-secret', 'us-east-1',
+                  endpoint=self.get_url('/'))
+        with self.assertRaises(AWSError) as ctx:
+            yield sqs.create_queue('queue')
+        self.assertEqual(ctx.exception.code, 'SignatureDoesNotMatch')
+
+    @gen_test
+    def test_post_signature(self):
+        queue_url = yield self.sqs.create_queue('queue')
+        body = u'Gr\u00fc\u00dfe ' * 1000
+        yield self.sqs.send_message(queue_url, body)
+        message = yield self.sqs.listen_queue(queue_url, wait_time=0)
+        self.assertEqual(message['Body'], body)
+
+    @gen_test
+    def test_injected_errors_are_retried(self):
+        self.sqs.retry_policy = RetryPolicy(base_delay=0.001)
+        self.fake.fail_next('Throttling', count=2, action='CreateQueue')
+        queue_url = yield self.sqs.create_queue('queue')
+        self.assertTrue(queue_url.endswith('/123456789012/queue'))
+        self.assertEqual(self.fake.requests, 3)
+
+
+class TestFakeSNS(FakeServerTestCase):
+    @gen_test
+    def test_fan_out_to_queues(self):
+        topic_arn = yield self.sns.create_topic('topic')
+        queue_urls = []
+        for name in ('first', 'second'):
+            queue_url = yield self.sqs.create_queue(name)
+            attributes = yield self.sqs.get_queue_attributes(queue_url,
+                                                             ['QueueArn'])
+            yield self.sns.subscribe(attributes['QueueArn'], topic_arn, 'sqs')
+            queue_urls.append(queue_url)
+        yield self.sns.publish('Hello', 'Subject', topic_arn)
+        for queue_url in queue_urls:
+            message = yield self.sqs.listen_queue(queue_url, wait_time=0)
+            notification = json.loads(message['Body'])
+            self.assertEqual(notification['Message'], 'Hello')
+            self.assertEqual(notification['TopicArn'], topic_arn)
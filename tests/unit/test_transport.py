@@ -0,0 +1,85 @@
+from unittest import skipIf
+from tornado.gen import coroutine, sleep
+from tornado.httpclient import AsyncHTTPClient
+from tornado.testing import AsyncHTTPTestCase, gen_test
+from tornado.web import Application, RequestHandler
+from asyncaws import SQS, TransportConfig
+
+try:
+    import pycurl
+except ImportError:
+    pycurl = None
+
+EMPTY_RECEIVE = """<ReceiveMessageResponse>
+  <ReceiveMessageResult/>
+</ReceiveMessageResponse>"""
+
+SEND = """<SendMessageResponse>
+  <SendMessageResult><MessageId>message-id</MessageId></SendMessageResult>
+</SendMessageResponse>"""
+
+
+class LongPollHandler(RequestHandler):
+    """Long polls wait 0.2s, other calls return immediately"""
+    @coroutine
+    def get(self):
+        if self.get_argument('Action') == 'ReceiveMessage':
+            yield sleep(0.2)
+            self.write(EMPTY_RECEIVE)
+        else:
+            self.write(SEND)
+
+    post = get
+
+
+class TestTransport(AsyncHTTPTestCase):
+    def get_app(self):
+        return Application([(r'/123/queue', LongPollHandler)])
+
+    def setUp(self):
+        super(TestTransport, self).setUp()
+        self.sqs = None
+
+    def tearDown(self):
+        # clients of a transport are owned by the SQS client
+        if self.sqs is not None:
+            self.sqs.close()
+        super(TestTransport, self).tearDown()
+
+    @coroutine
+    def check_short_call_not_blocked(self, backend):
+        transport = TransportConfig(max_clients=2, long_poll_clients=2,
+                                    backend=backend)
+        sqs = self.sqs = SQS('key', 'secret', 'eu-west-1',
+                             transport=transport)
+        queue_url = self.get_url('/123/queue')
+        polls = [sqs.listen_queue(queue_url, wait_time=1) for _ in range(4)]
+        message_id = yield sqs.send_message(queue_url, 'hello')
+        self.assertEqual(message_id, 'message-id')
+        # short call returned while long polls still wait in their pool
+        self.assertFalse(any(poll.done() for poll in polls))
+        self.assertEqual((yield polls), [None] * 4)
+
+    @gen_test
+    def test_separate_pools(self):
+        yield self.check_short_call_not_blocked('simple')
+
+    @skipIf(pycurl is None, "pycurl is not available")
+    @gen_test
+    def test_curl_backend(self):
+        yield self.check_short_call_not_blocked('curl')
+
+    def test_long_poll_timeout(self):
+        transport = TransportConfig(request_timeout=5)
+        self.assertEqual(transport.request_kwargs(20)['request_timeout'], 25)
+        self.assertEqual(transport.request_kwargs()['request_timeout'], 5)
+
+    def test_close(self):
+        shared = SQS('key', 'secret', 'eu-west-1')
+        shared.close()
+        # the shared client stays usable for other clients of the IOLoop
+        self.assertIs(AsyncHTTPClient(), shared._http)
+        owned = SQS('key', 'secret', 'eu-west-1', transport=TransportConfig())
+        owned.close()
+        self.assertTrue(owned._http._closed)
+        self.assertTrue(owned._long_poll_http._closed)